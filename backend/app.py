@@ -1,56 +1,211 @@
 # -*- coding: utf-8 -*-
 import os
-import threading
-from flask import Flask, request, jsonify
+import time
+import hmac
+import hashlib
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
 from dotenv import load_dotenv
-from models import SystemSetting
-from models import db, User, Promo, Payment, Broadcast, Conversation, SupportTicket, PromoStatus, PaymentStatus
+from services.settings_cache import settings
+from models import db, User, Promo, Payment, Broadcast, Conversation, SupportTicket, PromoStatus, PaymentStatus, AIUsage, MediaAsset, PointsLedger, BroadcastJob
 from bot_handler import BotHandler
-from services.openai_service import OpenAIService
-from sqlalchemy import text
-from services.whatsapp_service import WhatsAppService
-from datetime import datetime
+from services.openai_service import OpenAIService, PROMPT_COST_PER_1K, COMPLETION_COST_PER_1K
+from services.media_cache import MediaCache, CHUNK_SIZE
+from services.media_ingest import thumbnail_key
+from services.notification_queue import NotificationQueue
+from services import user_counters
+from services import metrics
+from services.profiler import profiler, slow_requests, SLOW_REQUEST_MS, PROFILE_MAX_SECONDS
+from services.admin_auth import require_admin_key
+from services.broadcast_scheduler import BroadcastScheduler
+from services.status_ingest import status_aggregator
+from services.counter_buffer import counters
+from services.stats_rollup import StatsRollup, vendor_stats, promo_stats, platform_stats, top_promos
+from services.search_index import search_index, KINDS as SEARCH_KINDS
+from services.bulk_export import stream_export, EXPORTS, FORMATS as EXPORT_FORMATS
+from services.schema import upgrade_schema, reset_schema
+from services.rate_limiter import inbound_limiter, INBOUND_RATE_NOTICE
+from config import configure
+from datetime import datetime, timedelta, timezone
 
 
 load_dotenv()
 
 app = Flask(__name__)
 basedir = os.path.abspath(os.path.dirname(__file__))
+configure(app)
 
-database_url = os.getenv('DATABASE_URL', 'sqlite:///easyeasy.db')
+CORS(app)
+db.init_app(app)
 
-if database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+bot_handler = BotHandler()
+whatsapp_service = bot_handler.whatsapp
+media_cache = MediaCache()
+notifications = NotificationQueue()
+# Senders over the inbound rate limit get one "slow down" reply per episode
+inbound_limiter.on_throttled = lambda phone: notifications.send_text(phone, INBOUND_RATE_NOTICE)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+# App secret used by Meta to sign webhook payloads; verification is skipped when unset
+WHATSAPP_APP_SECRET = os.getenv('WHATSAPP_APP_SECRET')
 
-# --- THIS IS THE CRITICAL FIX ---
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_pre_ping": True,   # Pings DB before every query to ensure connection is alive
-    "pool_recycle": 300,     # Refreshes connection every 5 minutes
-    "pool_size": 10,         # Keeps 10 connections open
-    "max_overflow": 20       # Allows temporary extra connections
-}
-# --------------------------------
+# Largest id list accepted by the bulk admin endpoints
+BULK_MAX_IDS = 1000
 
-CORS(app)
-db.init_app(app)
+VENDOR_VERIFIED_MSG = "✅ Your Vendor Account is VERIFIED! \n\nYou can now run promotions without restrictions."
+VENDOR_REJECTED_MSG = "❌ Verification Failed.\n\nThe document you uploaded was rejected. Please ensure it is clear, valid, and recent (NIN, Utility Bill, or Bank Statement). \n\nPlease upload a new document to try again."
+PROMO_APPROVED_MSG = "✅ Great news! Your promotion '{}' has been approved!\n\nIt will be broadcasted to interested users soon. 🚀"
+PROMO_REJECTED_MSG = "❌ Your promotion '{}' was not approved.\n\nReason: {}\n\nPlease create a new promotion that follows our guidelines."
 
-bot_handler = BotHandler()
-whatsapp_service = WhatsAppService()
+# Schema is managed by the release step (`python init_db.py`, see Procfile), not
+# by every worker at boot. AUTO_CREATE_SCHEMA=1 restores that for local runs.
+if os.getenv('AUTO_CREATE_SCHEMA', '0') == '1':
+    with app.app_context():
+        upgrade_schema()
+
+# Full-text index over promos/users/tickets, kept current on every flush
+search_index.init_app(app)
 
-# Create tables
+# SQL/request timing for /metrics
+metrics.init_app(app, db)
+
+# Stack + SQL capture for requests slower than SLOW_REQUEST_MS
+slow_requests.init_app(app, db)
+
+# Warm the settings cache so the first requests are served from memory
 with app.app_context():
-    db.create_all()
+    settings.load()
+
+# Apply ledgered points awards to User.points in the background
+bot_handler.points.start_rollup_worker(app)
+
+# One lease-holding dispatcher (across all workers) sends queued broadcasts
+broadcast_scheduler = BroadcastScheduler(bot_handler.media_ingest)
+broadcast_scheduler.start(app)
+
+# Write-behind counters (Promo views/clicks, Broadcast delivered/read, vendor leads)
+counters.start(app)
+
+# Apply buffered WhatsApp status callbacks to broadcast/promo counters
+status_aggregator.start(app)
+
+# Fold new sends, deliveries, orders and payments into the daily stats tables
+stats_rollup = StatsRollup()
+stats_rollup.start_worker(app)
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "EasyEasy WhatsApp Bot is running"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (merged across gunicorn workers)"""
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type)
+
+@app.route('/api/admin/profile', methods=['POST'])
+@require_admin_key
+def start_profile():
+    """Sample this worker's stacks for N seconds; fetch the result by session id"""
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', request.args.get('seconds', 10)))
+        interval_ms = float(data.get('interval_ms', request.args.get('interval_ms', 5)))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "seconds and interval_ms must be numbers"}), 400
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({
+            "success": False,
+            "error": f"seconds must be in (0, {PROFILE_MAX_SECONDS}] and interval_ms in [1, 1000]"
+        }), 400
+    try:
+        session_id = profiler.start(seconds, interval_ms / 1000.0)
+    except RuntimeError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    return jsonify({
+        "success": True,
+        "session_id": session_id,
+        "pid": os.getpid(),
+        "result_url": f"/api/admin/profile/{session_id}"
+    }), 202
+
+@app.route('/api/admin/profile/<session_id>', methods=['GET'])
+@require_admin_key
+def get_profile(session_id):
+    """Collapsed stacks (flamegraph.pl / speedscope format) once the session has finished"""
+    result = profiler.result(session_id)
+    if result is None:
+        return jsonify({"success": False, "error": "Profile not finished or unknown"}), 404
+    return Response(result, mimetype='text/plain')
+
+@app.route('/api/admin/slow-requests', methods=['GET'])
+@require_admin_key
+def get_slow_requests():
+    """Recent slow requests captured by the worker that serves this call"""
+    return jsonify({
+        "pid": os.getpid(),
+        "threshold_ms": SLOW_REQUEST_MS,
+        "requests": slow_requests.recent()
+    })
+
+@app.route('/api/admin/rate-limit', methods=['GET'])
+@require_admin_key
+def get_rate_limit():
+    """Inbound rate limit settings and the senders this worker has shed most"""
+    return jsonify({"pid": os.getpid(), **inbound_limiter.report(request.args.get('limit', 20, type=int))})
+
+def valid_webhook_signature(body, header):
+    """Check Meta's X-Hub-Signature-256 when WHATSAPP_APP_SECRET is configured"""
+    if not WHATSAPP_APP_SECRET:
+        return True
+    expected = 'sha256=' + hmac.new(WHATSAPP_APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header)
+
+def handle_webhook_message(message):
+    """Route one entry of a webhook `messages` array to the bot. Needs an app context."""
+    phone_number = message['from']
+    message_type = message['type']
+    started = time.perf_counter()
+
+    if message_type == 'text':
+        text = message['text']['body']
+        bot_handler.handle_message(phone_number, text, message_type)
+
+    elif message_type == 'image':
+        image_id = message['image']['id']
+        caption = message['image'].get('caption', '')
+        bot_handler.handle_media_message(phone_number, image_id, 'image', caption)
+
+    elif message_type == 'video':
+        video_id = message['video']['id']
+        caption = message['video'].get('caption', '')
+        bot_handler.handle_media_message(phone_number, video_id, 'video', caption)
+
+    # --- NEW: Handle Document Uploads (PDFs) ---
+    elif message_type == 'document':
+        doc_id = message['document']['id']
+        caption = message['document'].get('caption', '')
+        bot_handler.handle_media_message(phone_number, doc_id, 'document', caption)
+
+    elif message_type == 'interactive':
+        interactive_obj = message['interactive']
+
+        # 1. Handle BUTTON Replies
+        if 'button_reply' in interactive_obj:
+            button_id = interactive_obj['button_reply']['id']
+            bot_handler.handle_button_reply(phone_number, button_id)
+
+        # 2. Handle LIST Replies
+        elif 'list_reply' in interactive_obj:
+            list_id = interactive_obj['list_reply']['id']
+            if list_id.startswith("buy_promo_"):
+                # Item picked from a promo digest
+                bot_handler.handle_button_reply(phone_number, list_id)
+            else:
+                bot_handler.handle_message(phone_number, list_id, 'interactive')
+
+    metrics.observe_since(metrics.WEBHOOK_MESSAGE_SECONDS.labels(message_type), started)
+
 @app.route('/webhook', methods=['GET', 'POST'])
 def webhook():
     """WhatsApp webhook endpoint"""
@@ -68,6 +223,9 @@ def webhook():
             return 'Forbidden', 403
 
     elif request.method == 'POST':
+        if not valid_webhook_signature(request.get_data(), request.headers.get('X-Hub-Signature-256', '')):
+            return 'Invalid signature', 403
+
         # Handle incoming messages
         data = request.json
 
@@ -77,47 +235,19 @@ def webhook():
                     for change in entry.get('changes', []):
                         value = change.get('value', {})
 
+                        # Delivery/read receipts: buffered in memory, applied in batches
+                        if 'statuses' in value:
+                            status_aggregator.add(value['statuses'])
+
                         if 'messages' in value:
-                            for message in value['messages']:
-                                phone_number = message['from']
-                                message_type = message['type']
-
-                                if message_type == 'text':
-                                    text = message['text']['body']
-                                    bot_handler.handle_message(phone_number, text, message_type)
-
-                                elif message_type == 'image':
-                                    image_id = message['image']['id']
-                                    caption = message['image'].get('caption', '')
-                                    bot_handler.handle_media_message(phone_number, image_id, 'image', caption)
-
-                                elif message_type == 'video':
-                                    video_id = message['video']['id']
-                                    caption = message['video'].get('caption', '')
-                                    bot_handler.handle_media_message(phone_number, video_id, 'video', caption)
-                                
-                                # --- NEW: Handle Document Uploads (PDFs) ---
-                                elif message_type == 'document':
-                                    doc_id = message['document']['id']
-                                    caption = message['document'].get('caption', '')
-                                    bot_handler.handle_media_message(phone_number, doc_id, 'document', caption)
-
-                                elif message_type == 'interactive':
-                                    interactive_obj = message['interactive']
-                                    
-                                    # 1. Handle BUTTON Replies
-                                    if 'button_reply' in interactive_obj:
-                                        button_id = interactive_obj['button_reply']['id']
-                                        bot_handler.handle_button_reply(phone_number, button_id)
-                                    
-                                    # 2. Handle LIST Replies
-                                    elif 'list_reply' in interactive_obj:
-                                        list_id = interactive_obj['list_reply']['id']
-                                        bot_handler.handle_message(phone_number, list_id, 'interactive')
+                            # Per-number token bucket, checked before any DB work
+                            for message in inbound_limiter.admit(value['messages']):
+                                handle_webhook_message(message)
 
             return jsonify({"status": "success"}), 200
 
         except Exception as e:
+            metrics.WEBHOOK_ERRORS.inc()
             print("Webhook error: {}" .format(e))
             return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -145,25 +275,87 @@ def get_stats():
         'total_revenue': total_revenue
     })
 
+@app.route('/api/stats/daily', methods=['GET'])
+@require_admin_key
+def get_daily_stats():
+    """Platform-wide daily series from the rollup tables"""
+    return jsonify(platform_stats(request.args.get('days', 30, type=int)))
+
+@app.route('/api/vendors/<int:vendor_id>/stats', methods=['GET'])
+@require_admin_key
+def get_vendor_stats(vendor_id):
+    """Vendor performance from the daily rollups (no live scans)"""
+    days = request.args.get('days', 30, type=int)
+    stats = vendor_stats(vendor_id, days)
+    stats['top_promos'] = top_promos(vendor_id, days, request.args.get('limit', 5, type=int))
+    return jsonify(stats)
+
+@app.route('/api/promos/<int:promo_id>/stats', methods=['GET'])
+@require_admin_key
+def get_promo_stats(promo_id):
+    return jsonify(promo_stats(promo_id, request.args.get('days', 30, type=int)))
+
+@app.route('/api/admin/rollup-stats', methods=['POST'])
+@require_admin_key
+def run_stats_rollup():
+    """Apply pending events to the daily rollups now instead of waiting for the worker"""
+    return jsonify({"success": True, "applied": stats_rollup.run_once()})
+
+@app.route('/api/ai-usage', methods=['GET'])
+def get_ai_usage():
+    """OpenAI token spend hotspots: per feature, top users and top user-days"""
+    days = min(max(request.args.get('days', 7, type=int), 1), 366)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    def cost(prompt_tokens, completion_tokens):
+        return round((prompt_tokens or 0) / 1000 * PROMPT_COST_PER_1K + (completion_tokens or 0) / 1000 * COMPLETION_COST_PER_1K, 4)
+
+    prompt_sum = db.func.sum(AIUsage.prompt_tokens)
+    completion_sum = db.func.sum(AIUsage.completion_tokens)
+    total_sum = db.func.sum(AIUsage.prompt_tokens + AIUsage.completion_tokens)
+
+    by_feature = db.session.query(
+        AIUsage.feature, db.func.sum(AIUsage.calls), prompt_sum, completion_sum
+    ).filter(AIUsage.day >= since).group_by(AIUsage.feature).all()
+
+    top_users = db.session.query(
+        AIUsage.user_id, User.phone_number, User.name, db.func.sum(AIUsage.calls), prompt_sum, completion_sum
+    ).join(User, User.id == AIUsage.user_id).filter(AIUsage.day >= since).group_by(
+        AIUsage.user_id, User.phone_number, User.name
+    ).order_by(total_sum.desc()).limit(limit).all()
+
+    top_rows = AIUsage.query.filter(AIUsage.day >= since).order_by(
+        (AIUsage.prompt_tokens + AIUsage.completion_tokens).desc()
+    ).limit(limit).all()
+
+    return jsonify({
+        'since': since.isoformat(),
+        'features': [{
+            'feature': feature,
+            'calls': calls,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated_cost_usd': cost(prompt_tokens, completion_tokens)
+        } for feature, calls, prompt_tokens, completion_tokens in by_feature],
+        'top_users': [{
+            'user_id': user_id,
+            'phone_number': phone_number,
+            'name': name,
+            'calls': calls,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated_cost_usd': cost(prompt_tokens, completion_tokens)
+        } for user_id, phone_number, name, calls, prompt_tokens, completion_tokens in top_users],
+        'top_user_days': [dict(row.to_dict(), estimated_cost_usd=cost(row.prompt_tokens, row.completion_tokens)) for row in top_rows]
+    })
+
 @app.route('/fix_database_schema', methods=['GET'])
 def fix_database_schema():
-    """Temporary route to add missing columns to the database"""
+    """Add missing tables/columns (same as the `python init_db.py` release step)"""
     try:
         with app.app_context():
-            # 1. Add AI Memory Columns
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS ai_memory TEXT;"))
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_interaction_summary TEXT;"))
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS mood_score VARCHAR(20);"))
-            
-            # 2. Add Wealth Plan Columns (Just in case they are missing too)
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS vendors_patronized_month INTEGER DEFAULT 0;"))
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_ai_reward TIMESTAMP;"))
-            db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS ai_points_today FLOAT DEFAULT 0.0;"))
-            
-            # 3. Create the Order table if it doesn't exist
-            db.create_all()
-            
-            db.session.commit()
+            upgrade_schema()
             return "✅ Database Schema Updated Successfully! You can close this page."
     except Exception as e:
         return f"❌ Error updating schema: {str(e)}"
@@ -173,8 +365,11 @@ def get_users():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     role = request.args.get('role', None)
+    phone = request.args.get('phone', None)
     
     query = User.query
+    if phone:
+        query = query.filter_by(phone_number=phone)
     if role == 'vendor':
         query = query.filter_by(is_vendor=True)
     elif role == 'subscriber':
@@ -188,6 +383,73 @@ def get_users():
         'current_page': users.page
     })
 
+@app.route('/api/search', methods=['GET'])
+@require_admin_key
+def search():
+    """Ranked full-text search: ?q=refund&type=promo,user,ticket&page=1&per_page=20"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"success": False, "error": "q is required"}), 400
+    types = request.args.get('type')
+    kinds = [t.strip() for t in types.split(',')] if types else list(SEARCH_KINDS)
+    unknown = [k for k in kinds if k not in SEARCH_KINDS]
+    if unknown:
+        return jsonify({"success": False, "error": f"Unknown type: {', '.join(unknown)}"}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    return jsonify(search_index.search(q, kinds, page, per_page))
+
+@app.route('/api/admin/search/reindex', methods=['POST'])
+@require_admin_key
+def reindex_search():
+    """Rebuild the search index from the source tables"""
+    return jsonify({"success": True, "indexed": search_index.reindex_all()})
+
+@app.route('/api/users/<int:user_id>/points', methods=['GET'])
+def get_user_points(user_id):
+    """Current balance plus the most recent ledger entries"""
+    User.query.get_or_404(user_id)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    entries = PointsLedger.query.filter_by(user_id=user_id).order_by(PointsLedger.id.desc()).limit(limit).all()
+    return jsonify({
+        'user_id': user_id,
+        'balance': bot_handler.points.balance(user_id),
+        'entries': [e.to_dict() for e in entries]
+    })
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Top users by a maintained counter: referrers, buyers or vendors"""
+    board = request.args.get('type', 'referrers')
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    columns = {
+        'referrers': User.referral_count,
+        'buyers': User.purchases_confirmed,
+        'vendors': User.sales_confirmed
+    }
+    if board not in columns:
+        return jsonify({"error": "type must be one of: referrers, buyers, vendors"}), 400
+
+    column = columns[board]
+    users = User.query.filter(column > 0).order_by(column.desc()).limit(limit).all()
+    return jsonify({
+        'type': board,
+        'leaders': [{
+            'id': u.id,
+            'name': u.name,
+            'business_name': u.business_name,
+            'phone_number': u.phone_number,
+            'count': getattr(u, column.key) or 0
+        } for u in users]
+    })
+
+@app.route('/api/admin/reconcile-counters', methods=['POST'])
+@require_admin_key
+def reconcile_counters():
+    """Recompute referral/order counters from source rows and repair drift"""
+    repaired = user_counters.reconcile()
+    return jsonify({"success": True, "repaired": repaired})
+
 # --- NEW: Verify Vendor Endpoint ---
 @app.route('/api/users/<int:user_id>/verify', methods=['POST'])
 def verify_user(user_id):
@@ -197,10 +459,7 @@ def verify_user(user_id):
     db.session.commit()
     
     # Notify Vendor
-    whatsapp_service.send_text_message(
-        user.phone_number,
-        "✅ Your Vendor Account is VERIFIED! \n\nYou can now run promotions without restrictions."
-    )
+    notifications.send_text(user.phone_number, VENDOR_VERIFIED_MSG)
     return jsonify({"success": True, "user": user.to_dict()})
 
 
@@ -214,12 +473,61 @@ def reject_user_verification(user_id):
     db.session.commit()
     
     # Notify Vendor
-    whatsapp_service.send_text_message(
-        user.phone_number,
-        "❌ Verification Failed.\n\nThe document you uploaded was rejected. Please ensure it is clear, valid, and recent (NIN, Utility Bill, or Bank Statement). \n\nPlease upload a new document to try again."
-    )
+    notifications.send_text(user.phone_number, VENDOR_REJECTED_MSG)
     return jsonify({"success": True, "user": user.to_dict()})
 
+def get_bulk_ids():
+    """Parse {"ids": [...]} from a bulk request; returns (ids, error_response)"""
+    data = request.json or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return None, (jsonify({"success": False, "error": "'ids' must be a non-empty list"}), 400)
+    if len(ids) > BULK_MAX_IDS:
+        return None, (jsonify({"success": False, "error": f"At most {BULK_MAX_IDS} ids per request"}), 400)
+    try:
+        # dict.fromkeys de-duplicates while keeping the caller's order
+        return list(dict.fromkeys(int(i) for i in ids)), None
+    except (TypeError, ValueError):
+        return None, (jsonify({"success": False, "error": "ids must be integers"}), 400)
+
+def bulk_results(ids, updated, existing, status):
+    """Per-id outcome: updated, skipped because it was not pending, or not found"""
+    return [
+        {"id": i, "success": True, "status": status} if i in updated
+        else {"id": i, "success": False, "error": "Not pending" if i in existing else "Not found"}
+        for i in ids
+    ]
+
+def bulk_set_verification(status, message):
+    ids, error = get_bulk_ids()
+    if error:
+        return error
+
+    # Only vendors still awaiting a decision
+    pending = db.and_(User.is_vendor == True, db.or_(
+        User.verification_status.in_(["pending", "unverified"]), User.verification_status.is_(None)
+    ))
+    rows = db.session.query(User.id, User.phone_number, pending).filter(User.id.in_(ids)).all()
+    existing = {user_id for user_id, _, _ in rows}
+    found = {user_id: phone for user_id, phone, is_pending in rows if is_pending}
+    if found:
+        User.query.filter(User.id.in_(list(found)), pending).update(
+            {User.verification_status: status}, synchronize_session=False
+        )
+        db.session.commit()
+        notifications.send_many((phone, message) for phone in found.values())
+
+    return jsonify({"success": True, "updated": len(found), "results": bulk_results(ids, found, existing, status)})
+
+@app.route('/api/users/bulk/verify', methods=['POST'])
+def bulk_verify_users():
+    """Verify many vendors in one transaction; notifications are sent asynchronously"""
+    return bulk_set_verification("verified", VENDOR_VERIFIED_MSG)
+
+@app.route('/api/users/bulk/reject_verification', methods=['POST'])
+def bulk_reject_user_verification():
+    return bulk_set_verification("rejected", VENDOR_REJECTED_MSG)
+
 
 @app.route('/api/promos', methods=['GET'])
 def get_promos():
@@ -244,10 +552,7 @@ def approve_promo(promo_id):
     promo.approved_at = datetime.utcnow()
     db.session.commit()
     vendor = promo.vendor
-    whatsapp_service.send_text_message(
-        vendor.phone_number,
-        "✅ Great news! Your promotion '{}' has been approved!\n\nIt will be broadcasted to interested users soon. 🚀". format (promo.title)
-    )
+    notifications.send_text(vendor.phone_number, PROMO_APPROVED_MSG.format(promo.title))
     return jsonify({"success": True, "promo": promo.to_dict()})
 
 @app.route('/api/promos/<int:promo_id>/reject', methods=['POST'])
@@ -258,117 +563,105 @@ def reject_promo(promo_id):
     promo.status = PromoStatus.REJECTED
     db.session.commit()
     vendor = promo.vendor
-    whatsapp_service.send_text_message(
-        vendor.phone_number,
-        "❌ Your promotion '{}' was not approved.\n\nReason: {}\n\nPlease create a new promotion that follows our guidelines.". format (promo.title, reason)
-    )
+    notifications.send_text(vendor.phone_number, PROMO_REJECTED_MSG.format(promo.title, reason))
     return jsonify({"success": True, "promo": promo.to_dict()})
 
-def send_broadcast_background(promo_id, app_context):
-    """Runs broadcast in background thread with STRICT formatting"""
-    with app_context:
-        promo = Promo.query.get(promo_id)
-        if not promo: return
-        
-        subscribers = User.query.filter_by(is_subscriber=True, is_active=True).all()
-        
-        promo_cats = [c.strip().lower() for c in (promo.category or "general").split(',')]
-        target_gender = promo.target_gender 
-        
-        broadcast = Broadcast(
-            promo_id=promo.id,
-            total_recipients=0,
-            status='in_progress'
+def bulk_set_promo_status(status, values, message_for):
+    ids, error = get_bulk_ids()
+    if error:
+        return error
+
+    rows = db.session.query(Promo.id, Promo.status, Promo.title, User.phone_number).join(
+        User, User.id == Promo.vendor_id
+    ).filter(Promo.id.in_(ids)).all()
+    existing = {promo_id for promo_id, _, _, _ in rows}
+    # Only pending promos: approving a broadcasted or rejected one would make it broadcastable again
+    found = {promo_id: (title, phone) for promo_id, current, title, phone in rows if current == PromoStatus.PENDING}
+
+    if found:
+        Promo.query.filter(Promo.id.in_(list(found)), Promo.status == PromoStatus.PENDING).update(
+            dict(values, status=status), synchronize_session=False
         )
-        db.session.add(broadcast)
         db.session.commit()
-        
-        sent_count = 0
-        failed_count = 0
-        
-        message = promo.ai_generated_caption
-        message += "\n\n---------------------------------------------------------------\n"
-        if promo.price > 0:
-            message += "💰 Price: ₦{:,.2f}".format(promo.price)
-        else:
-            message += "💰 Price: Negotiable"
-        message += "\n📞 Contact: {}".format(promo.contact_info)
-        message += "\n---------------------------------------------------------------"
-        
-        whatsapp_svc = WhatsAppService()
-        valid_recipients = 0
+        notifications.send_many((phone, message_for(title)) for title, phone in found.values())
 
-        for subscriber in subscribers:
-            if subscriber.current_mode == 'vendor':
-                continue
-            
-            if target_gender != 'All' and subscriber.gender:
-                if subscriber.gender != 'All' and subscriber.gender != target_gender:
-                    continue 
+    return jsonify({"success": True, "updated": len(found), "results": bulk_results(ids, found, existing, status)})
 
-            user_interests = (subscriber.interests or "").lower()
-            match_found = False
-            
-            if "general" in promo_cats:
-                match_found = True
-            else:
-                for cat in promo_cats:
-                    if cat in user_interests:
-                        match_found = True
-                        break
-            
-            if not match_found:
-                continue
-            
-            valid_recipients += 1
-            
-            try:
-                if promo.media_url:
-                    if promo.media_type == 'image':
-                        result = whatsapp_svc.send_image_message(subscriber.phone_number, promo.media_url, message)
-                    elif promo.media_type == 'video':
-                        result = whatsapp_svc.send_video_message(subscriber.phone_number, promo.media_url, message)
-                    else:
-                        result = whatsapp_svc.send_text_message(subscriber.phone_number, message)
-                else:
-                    result = whatsapp_svc.send_text_message(subscriber.phone_number, message)
-                
-                if result and result.get('success'):
-                    sent_count += 1
-                else:
-                    failed_count += 1
-            except Exception as e:
-                print(f"Error sending to {subscriber.phone_number}: {e}")
-                failed_count += 1
-                
-        broadcast.total_recipients = valid_recipients
-        broadcast.sent_count = sent_count
-        broadcast.failed_count = failed_count
-        broadcast.status = 'completed'
-        broadcast.completed_at = datetime.utcnow()
-        
-        promo.status = PromoStatus.BROADCASTED
-        promo.broadcasted_at = datetime.utcnow()
-        db.session.commit()
-        
-        whatsapp_svc.send_text_message(
-            promo.vendor.phone_number,
-            "🎉 Your promotion has been broadcasted!\n\n📊 Sent to {} active customers.".format(sent_count)
-        )
+@app.route('/api/promos/bulk/approve', methods=['POST'])
+def bulk_approve_promos():
+    """Approve many promos with a single UPDATE; vendors are notified asynchronously"""
+    return bulk_set_promo_status(
+        PromoStatus.APPROVED.value,
+        {'approved_at': datetime.utcnow()},
+        PROMO_APPROVED_MSG.format
+    )
+
+@app.route('/api/promos/bulk/reject', methods=['POST'])
+def bulk_reject_promos():
+    reason = (request.json or {}).get('reason', 'Does not meet our guidelines')
+    return bulk_set_promo_status(
+        PromoStatus.REJECTED.value,
+        {},
+        lambda title: PROMO_REJECTED_MSG.format(title, reason)
+    )
 
 @app.route('/api/promos/<int:promo_id>/broadcast', methods=['POST'])
 def broadcast_promo(promo_id):
     promo = Promo.query.get_or_404(promo_id)
     if promo.status != PromoStatus.APPROVED:
         return jsonify({"success": False, "error": "Promo must be approved first"}), 400
-    
-    thread = threading.Thread(target=send_broadcast_background, args=(promo_id, app.app_context()))
-    thread.start()
-    
+
+    active = BroadcastJob.query.filter(
+        BroadcastJob.promo_id == promo_id, BroadcastJob.status.in_(["queued", "running"])
+    ).first()
+    if active:
+        return jsonify({"success": False, "error": "Broadcast already scheduled", "job": active.to_dict()}), 409
+
+    # Optional: {"scheduled_at": ISO-8601, UTC unless it carries an offset, "window_start_hour": 8, "window_end_hour": 21}
+    data = request.get_json(silent=True) or {}
+    scheduled_at = None
+    if data.get('scheduled_at'):
+        try:
+            scheduled_at = datetime.fromisoformat(data['scheduled_at'].replace('Z', '+00:00'))
+        except (TypeError, AttributeError, ValueError):
+            return jsonify({"success": False, "error": "scheduled_at must be ISO-8601"}), 400
+        # Jobs are scheduled in naive UTC
+        if scheduled_at.tzinfo is not None:
+            scheduled_at = scheduled_at.astimezone(timezone.utc).replace(tzinfo=None)
+    window_start = data.get('window_start_hour')
+    window_end = data.get('window_end_hour')
+    for hour in (window_start, window_end):
+        if hour is not None and not (isinstance(hour, int) and not isinstance(hour, bool) and 0 <= hour <= 23):
+            return jsonify({"success": False, "error": "Window hours must be integers 0-23"}), 400
+
+    job = broadcast_scheduler.enqueue(promo, scheduled_at, window_start, window_end)
     return jsonify({
         "success": True,
-        "message": "Broadcast started in background. Check status later."
-    })
+        "message": "Broadcast queued. It is sent in priority order within its send window.",
+        "job": job.to_dict()
+    }), 202
+
+@app.route('/api/broadcast-jobs', methods=['GET'])
+def get_broadcast_jobs():
+    """Broadcast queue in dispatch order"""
+    status = request.args.get('status', None)
+    query = BroadcastJob.query
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(*broadcast_scheduler.queue_order()).limit(request.args.get('limit', 100, type=int)).all()
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/api/broadcast-jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_broadcast_job(job_id):
+    """Cancel a job that has not started sending yet"""
+    cancelled = BroadcastJob.query.filter(
+        BroadcastJob.id == job_id, BroadcastJob.status == "queued"
+    ).update({BroadcastJob.status: "cancelled"}, synchronize_session=False)
+    db.session.commit()
+    job = BroadcastJob.query.get_or_404(job_id)
+    if not cancelled:
+        return jsonify({"success": False, "error": f"Job is {job.status}", "job": job.to_dict()}), 409
+    return jsonify({"success": True, "job": job.to_dict()})
 
 @app.route('/api/payments/<int:payment_id>/confirm', methods=['POST'])
 def confirm_payment(payment_id):
@@ -413,6 +706,23 @@ def get_broadcasts():
         'current_page': broadcasts.page
     })
 
+@app.route('/api/export/<entity>', methods=['GET'])
+@require_admin_key
+def export_rows(entity):
+    """Stream a full table: /api/export/users?format=csv|ndjson&gzip=1, with the list endpoint's filters"""
+    if entity not in EXPORTS:
+        return jsonify({"success": False, "error": f"Unknown export: {entity}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": "format must be csv or ndjson"}), 400
+    gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    filters = {key: request.args.get(key) for key in ('role', 'phone', 'status')}
+
+    filename = f"{entity}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}" + (".gz" if gzip else "")
+    body = stream_export(db.engine, entity, fmt, filters, gzip=gzip)
+    return Response(body, mimetype='application/gzip' if gzip else EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/api/support', methods=['GET'])
 def get_tickets():
     page = request.args.get('page', 1, type=int)
@@ -442,25 +752,17 @@ def resolve_ticket(ticket_id):
 @app.route('/api/settings/vendor-lock', methods=['GET'])
 def get_vendor_lock_status():
     """Check if vendor registration is locked"""
-    setting = SystemSetting.query.get('vendor_lock')
     # Default to False (Not locked) if setting doesn't exist yet
-    is_locked = setting.value == 'true' if setting else False
-    return jsonify({"locked": is_locked})
+    return jsonify({"locked": settings.get_bool('vendor_lock')})
 
 @app.route('/api/settings/vendor-lock', methods=['POST'])
 def set_vendor_lock_status():
     """Turn vendor registration ON or OFF"""
     data = request.json
-    should_lock = data.get('locked', False)
+    should_lock = bool(data.get('locked', False))
     
-    setting = SystemSetting.query.get('vendor_lock')
-    if not setting:
-        setting = SystemSetting(key='vendor_lock', value='true' if should_lock else 'false')
-        db.session.add(setting)
-    else:
-        setting.value = 'true' if should_lock else 'false'
-    
-    db.session.commit()
+    # Bumps the settings version so every worker picks up the change
+    settings.set('vendor_lock', should_lock)
     return jsonify({"success": True, "locked": should_lock})
 
 @app.route('/reset_database_secret_key_123', methods=['GET'])
@@ -468,8 +770,7 @@ def reset_database():
     """Wipes the entire database and recreates it. DANGEROUS!"""
     try:
         with app.app_context():
-            db.drop_all()   # Deletes all tables
-            db.create_all() # Recreates them with new schema
+            reset_schema()  # Deletes all tables and recreates them with the new schema
             
             # Optional: Create a default admin user immediately
             # admin = User(phone_number="234...", name="Admin", is_vendor=True)
@@ -482,48 +783,74 @@ def reset_database():
 
 @app.route('/api/media/<media_id>', methods=['GET'])
 def get_media(media_id):
-    """Proxy to fetch media from WhatsApp and serve it to the frontend"""
-    import requests
-    
+    """Proxy to fetch media from WhatsApp and serve it to the frontend.
+
+    Bodies are streamed in chunks and written to the on-disk media cache as
+    they pass through, so repeat views (and Range requests for video
+    seeking) are served locally with an ETag and never go back to Graph.
+    """
     # 1. Validate ID format (basic check)
     if not media_id or len(media_id) < 5 or media_id == "12345":
         return jsonify({"error": "Invalid Media ID"}), 400
 
-    # 2. Get the URL from WhatsApp
-    url = f"https://graph.facebook.com/v18.0/{media_id}"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('WHATSAPP_API_TOKEN')}"
-    }
-    
-    try:
-        # Step 1: Get the download URL
-        meta_response = requests.get(url, headers=headers)
-        
-        # Check specifically for 400/404 from Facebook
-        if meta_response.status_code == 400:
-            return jsonify({"error": "Media ID invalid or expired"}), 400
-            
-        meta_response.raise_for_status()
-        media_url = meta_response.json().get('url')
-        
-        if not media_url:
-            return "Media URL not found", 404
+    # 2. Serve from cache (send_file handles ETag / If-None-Match / Range)
+    cached = media_cache.lookup(media_id)
+    if cached:
+        return send_file(cached['path'], mimetype=cached['mime_type'], etag=cached['digest'], conditional=True, max_age=86400)
 
-        # Step 2: Download the actual file binary
-        # Note: We must pass the headers again to download the binary
-        media_response = requests.get(media_url, headers=headers)
-        media_response.raise_for_status()
-        
-        # Step 3: Serve it back to the browser
-        from flask import Response
-        return Response(
-            media_response.content, 
-            mimetype=media_response.headers.get('Content-Type')
-        )
+    # 3. Cache miss: resolve the download URL from WhatsApp
+    info = whatsapp_service.get_media_info(media_id)
+    if not info['success']:
+        return jsonify({"error": info['error']}), info.get('status_code', 500)
 
+    media_url = info['data'].get('url')
+    if not media_url:
+        return "Media URL not found", 404
+
+    try:
+        media_response = whatsapp_service.open_media_stream(media_url)
     except Exception as e:
         print(f"Error fetching media: {e}")
         return jsonify({"error": str(e)}), 500
 
+    mime_type = media_response.headers.get('Content-Type')
+
+    # A seek needs the whole file locally; fill the cache, then serve the range.
+    # A body too large for the cache is streamed whole below (a 200 answers any Range request).
+    content_length = int(media_response.headers.get('Content-Length') or 0)
+    if request.range and content_length <= media_cache.max_bytes:
+        try:
+            cached = media_cache.store(media_id, media_response.iter_content(CHUNK_SIZE), mime_type)
+        finally:
+            media_response.close()
+        if not cached:
+            # Download aborted or evicted before it could be served; the body is gone
+            return jsonify({"error": "Media could not be cached"}), 502
+        return send_file(cached['path'], mimetype=cached['mime_type'], etag=cached['digest'], conditional=True, max_age=86400)
+
+    def generate():
+        try:
+            yield from media_cache.stream_and_store(media_id, media_response.iter_content(CHUNK_SIZE), mime_type)
+        finally:
+            media_response.close()
+
+    headers = {"Accept-Ranges": "bytes"}
+    if media_response.headers.get('Content-Length'):
+        headers["Content-Length"] = media_response.headers['Content-Length']
+    return Response(generate(), mimetype=mime_type, headers=headers)
+
+@app.route('/api/media/<media_id>/thumbnail', methods=['GET'])
+def get_media_thumbnail(media_id):
+    """Downscaled preview generated at ingestion; falls back to the full media"""
+    cached = media_cache.lookup(thumbnail_key(media_id))
+    if not cached:
+        return get_media(media_id)
+    return send_file(cached['path'], mimetype=cached['mime_type'], etag=cached['digest'], conditional=True, max_age=86400)
+
+@app.route('/api/media/<media_id>/info', methods=['GET'])
+def get_media_info(media_id):
+    asset = MediaAsset.query.get_or_404(media_id)
+    return jsonify(asset.to_dict())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
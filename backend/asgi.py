@@ -0,0 +1,309 @@
+# backend/asgi.py
+# Async serving mode. The webhook, media proxy and the read-only admin list
+# endpoints run on the event loop (async DB via services/async_db.py, Graph
+# media via httpx); every other route is the unchanged Flask app mounted
+# underneath, so endpoints can be migrated one at a time.
+#
+#   uvicorn asgi:app --workers 4
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 4     # keeps gunicorn.conf.py hooks
+#
+# `gunicorn app:app` keeps serving the all-sync app exactly as before.
+import os
+import math
+import asyncio
+from contextlib import asynccontextmanager
+import anyio
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select, func, case
+from sqlalchemy.orm import selectinload
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse, FileResponse
+from starlette.routing import Route, Mount
+
+from app import app as flask_app, db, handle_webhook_message, valid_webhook_signature, media_cache, status_aggregator
+from services.rate_limiter import inbound_limiter
+from models import User, Promo, Payment, Broadcast, SupportTicket, PromoStatus, PaymentStatus
+from services import metrics
+from services.async_db import async_db
+from services.async_whatsapp import AsyncWhatsAppService
+from services.media_ingest import thumbnail_key
+
+# Threads running the (sync) bot for webhook messages
+WEBHOOK_THREADS = int(os.getenv('WEBHOOK_THREADS', 32))
+# Messages accepted but not yet handled; beyond this the webhook answers 503 and Meta redelivers
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', 2000))
+# Threads serving the mounted Flask routes
+FLASK_THREADS = int(os.getenv('FLASK_THREADS', 40))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', 20))
+
+class WebhookDispatcher:
+    """Hands webhook messages to the bot off the event loop.
+
+    The bot's conversation logic is synchronous and transactional, so each
+    message runs in a bounded thread pool inside a Flask app context. The
+    webhook is acknowledged as soon as its messages are queued, so the
+    connection is released while OpenAI/Graph calls are still in flight.
+    Messages from one sender are chained, so they are handled in arrival
+    order like they were under the sync webhook.
+    """
+
+    def __init__(self, threads: int = WEBHOOK_THREADS, max_pending: int = WEBHOOK_MAX_PENDING):
+        self.limiter = anyio.CapacityLimiter(threads)
+        self.max_pending = max_pending
+        self._tails = {}     # sender -> task of their latest message
+        self._tasks = set()  # strong references until done
+
+    def accept(self, messages) -> bool:
+        """Queue all `messages`, or none of them when over capacity"""
+        if len(self._tasks) + len(messages) > self.max_pending:
+            return False
+        for message in messages:
+            sender = message.get('from')
+            task = asyncio.create_task(self._run(self._tails.get(sender), message))
+            self._tails[sender] = task
+            self._tasks.add(task)
+            task.add_done_callback(lambda done, sender=sender: self._finished(sender, done))
+        return True
+
+    async def _run(self, previous, message):
+        if previous is not None:
+            await asyncio.wait([previous])
+        await anyio.to_thread.run_sync(self._handle, message, limiter=self.limiter)
+
+    @staticmethod
+    def _handle(message):
+        with flask_app.app_context():
+            try:
+                handle_webhook_message(message)
+            except Exception as e:
+                db.session.rollback()
+                metrics.WEBHOOK_ERRORS.inc()
+                print(f"Webhook error: {e}")
+
+    def _finished(self, sender, task):
+        self._tasks.discard(task)
+        if self._tails.get(sender) is task:
+            del self._tails[sender]
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_SECONDS):
+        """Let queued messages finish before the worker exits"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+dispatcher = WebhookDispatcher()
+graph: AsyncWhatsAppService = None
+
+# --- Webhook ---------------------------------------------------------------
+
+async def webhook(request):
+    if request.method == 'GET':
+        params = request.query_params
+        if params.get('hub.mode') == 'subscribe' and params.get('hub.verify_token') == os.getenv('WHATSAPP_VERIFY_TOKEN'):
+            return PlainTextResponse(str(params.get('hub.challenge')))
+        return PlainTextResponse('Forbidden', status_code=403)
+
+    body = await request.body()
+    if not valid_webhook_signature(body, request.headers.get('X-Hub-Signature-256', '')):
+        return PlainTextResponse('Invalid signature', status_code=403)
+    try:
+        data = await request.json()
+        messages = []
+        for entry in data.get('entry', []):
+            for change in entry.get('changes', []):
+                value = change.get('value', {})
+                # Delivery/read receipts: buffered in memory, applied in batches
+                if 'statuses' in value:
+                    status_aggregator.add(value['statuses'])
+                messages.extend(value.get('messages', []))
+    except Exception as e:
+        metrics.WEBHOOK_ERRORS.inc()
+        print(f"Webhook error: {e}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+    # Per-number token bucket, checked before anything is queued for the bot
+    if inbound_limiter.shared:
+        messages = await anyio.to_thread.run_sync(inbound_limiter.admit, messages)
+    else:
+        messages = inbound_limiter.admit(messages)
+    if messages and not dispatcher.accept(messages):
+        return JSONResponse({"status": "busy"}, status_code=503)
+    return JSONResponse({"status": "success"})
+
+# --- Media proxy -------------------------------------------------------------
+
+def _cached_file(request, cached):
+    etag = f'"{cached["digest"]}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range requests itself
+    return FileResponse(cached['path'], media_type=cached['mime_type'], headers=headers)
+
+async def get_media(request):
+    """Async twin of app.get_media: same cache, the Graph download holds a socket instead of a thread"""
+    media_id = request.path_params['media_id']
+    if not media_id or len(media_id) < 5 or media_id == "12345":
+        return JSONResponse({"error": "Invalid Media ID"}, status_code=400)
+
+    cached = media_cache.lookup(media_id)
+    if cached:
+        return _cached_file(request, cached)
+
+    info = await graph.get_media_info(media_id)
+    if not info['success']:
+        return JSONResponse({"error": info['error']}, status_code=info.get('status_code', 500))
+    media_url = info['data'].get('url')
+    if not media_url:
+        return PlainTextResponse("Media URL not found", status_code=404)
+
+    try:
+        upstream = await graph.open_media_stream(media_url)
+    except Exception as e:
+        print(f"Error fetching media: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    mime_type = upstream.headers.get('Content-Type')
+
+    # A seek needs the whole file locally; fill the cache, then serve the range.
+    # A body too large for the cache is streamed whole below (a 200 answers any Range request).
+    content_length = int(upstream.headers.get('Content-Length') or 0)
+    if 'range' in request.headers and content_length <= media_cache.max_bytes:
+        try:
+            cached = await media_cache.astore(media_id, graph.iter_media(upstream), mime_type)
+        finally:
+            await upstream.aclose()
+        if not cached:
+            # Download aborted or evicted before it could be served; the body is gone
+            return JSONResponse({"error": "Media could not be cached"}, status_code=502)
+        return _cached_file(request, cached)
+
+    async def body():
+        try:
+            async for chunk in media_cache.astream_and_store(media_id, graph.iter_media(upstream), mime_type):
+                yield chunk
+        finally:
+            await upstream.aclose()
+
+    headers = {"Accept-Ranges": "bytes"}
+    if upstream.headers.get('Content-Length'):
+        headers["Content-Length"] = upstream.headers['Content-Length']
+    return StreamingResponse(body(), media_type=mime_type, headers=headers)
+
+async def get_media_thumbnail(request):
+    cached = media_cache.lookup(thumbnail_key(request.path_params['media_id']))
+    if not cached:
+        return await get_media(request)
+    return _cached_file(request, cached)
+
+# --- Admin API (read-only lists) --------------------------------------------
+
+def _int_arg(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+async def _paginate(request, query, key):
+    """Same response shape as Flask-SQLAlchemy's paginate(error_out=False)"""
+    page = max(_int_arg(request, 'page', 1), 1)
+    per_page = _int_arg(request, 'per_page', 20)
+    per_page = per_page if per_page > 0 else 20
+    async with async_db.session() as session:
+        total = await session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+        rows = (await session.scalars(query.limit(per_page).offset((page - 1) * per_page))).all()
+        items = [row.to_dict() for row in rows]
+    return JSONResponse({key: items, 'total': total, 'pages': math.ceil(total / per_page), 'current_page': page})
+
+async def get_users(request):
+    query = select(User)
+    phone = request.query_params.get('phone')
+    role = request.query_params.get('role')
+    if phone:
+        query = query.where(User.phone_number == phone)
+    if role == 'vendor':
+        query = query.where(User.is_vendor.is_(True))
+    elif role == 'subscriber':
+        query = query.where(User.is_subscriber.is_(True))
+    return await _paginate(request, query.order_by(User.created_at.desc()), 'users')
+
+async def get_promos(request):
+    query = select(Promo).options(selectinload(Promo.vendor))
+    status = request.query_params.get('status')
+    if status:
+        query = query.where(Promo.status == status)
+    return await _paginate(request, query.order_by(Promo.created_at.desc()), 'promos')
+
+async def get_payments(request):
+    return await _paginate(request, select(Payment).order_by(Payment.created_at.desc()), 'payments')
+
+async def get_broadcasts(request):
+    return await _paginate(request, select(Broadcast).order_by(Broadcast.created_at.desc()), 'broadcasts')
+
+async def get_tickets(request):
+    query = select(SupportTicket).options(selectinload(SupportTicket.user))
+    status = request.query_params.get('status')
+    if status:
+        query = query.where(SupportTicket.status == status)
+    return await _paginate(request, query.order_by(SupportTicket.created_at.desc()), 'tickets')
+
+async def get_stats(request):
+    def count_where(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    async with async_db.session() as session:
+        users = (await session.execute(select(
+            func.count(), count_where(User.is_vendor.is_(True)),
+            count_where(User.is_subscriber.is_(True) & User.is_active.is_(True)),
+        ))).one()
+        promos = (await session.execute(select(
+            func.count(), count_where(Promo.status == PromoStatus.PENDING),
+            count_where(Promo.status == PromoStatus.APPROVED), count_where(Promo.status == PromoStatus.BROADCASTED),
+        ))).one()
+        revenue = await session.scalar(
+            select(func.sum(Payment.amount)).where(Payment.status == PaymentStatus.COMPLETED))
+    return JSONResponse({
+        'total_users': users[0],
+        'total_vendors': users[1],
+        'total_subscribers': users[2],
+        'total_promos': promos[0],
+        'pending_promos': promos[1],
+        'approved_promos': promos[2],
+        'broadcasted_promos': promos[3],
+        'total_revenue': revenue or 0
+    })
+
+async def health_check(request):
+    return JSONResponse({"status": "healthy", "message": "EasyEasy WhatsApp Bot is running"})
+
+@asynccontextmanager
+async def lifespan(app):
+    global graph
+    async_db.start()
+    graph = AsyncWhatsAppService()
+    try:
+        yield
+    finally:
+        await dispatcher.drain()
+        await graph.close()
+        await async_db.stop()
+
+app = Starlette(
+    routes=[
+        Route('/health', health_check),
+        Route('/webhook', webhook, methods=['GET', 'POST']),
+        Route('/api/media/{media_id}', get_media),
+        Route('/api/media/{media_id}/thumbnail', get_media_thumbnail),
+        Route('/api/stats', get_stats),
+        Route('/api/users', get_users),
+        Route('/api/promos', get_promos),
+        Route('/api/payments', get_payments),
+        Route('/api/broadcasts', get_broadcasts),
+        Route('/api/support', get_tickets),
+        # Everything not migrated yet
+        Mount('/', app=WSGIMiddleware(flask_app, workers=FLASK_THREADS)),
+    ],
+    # Same open policy as CORS(app) on the Flask side; it sets, not appends, the headers on mounted responses
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
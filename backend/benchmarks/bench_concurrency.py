@@ -0,0 +1,125 @@
+# backend/benchmarks/bench_concurrency.py
+# Compares how many concurrent I/O-bound requests the sync deployment
+# (`gunicorn app:app`) and the async one (`uvicorn asgi:app`) can hold with
+# the same number of workers.
+#
+#   python benchmarks/bench_concurrency.py --workers 2 --levels 50,200,1000 --media-latency-ms 300
+#
+# Each level fires that many simultaneous media proxy requests for distinct
+# (uncached) media ids; every one waits on the fake Graph API
+# (loadtest/fake_graph.py) for the metadata lookup and the download, like a
+# real cache miss. A request counts as served if it completes within
+# --timeout. Uses a throwaway SQLite database and media cache.
+import os
+import sys
+import time
+import uuid
+import socket
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "sync":  lambda port, workers: ["gunicorn", "app:app", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+                                    "--timeout", "120", "--backlog", "4096"],
+    "asgi":  lambda port, workers: ["uvicorn", "asgi:app", "--workers", str(workers), "--port", str(port),
+                                    "--backlog", "4096", "--log-level", "warning", "--no-access-log"],
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+async def fire(base_url, concurrency, timeout):
+    """`concurrency` simultaneous cache-miss media requests; returns (latencies of served requests, failures)"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one():
+            started = time.perf_counter()
+            try:
+                response = await client.get(f"/api/media/bench{uuid.uuid4().hex[:12]}")
+                return time.perf_counter() - started if response.status_code == 200 else None
+            except httpx.HTTPError:
+                return None
+        results = await asyncio.gather(*[one() for _ in range(concurrency)])
+    served = [r for r in results if r is not None]
+    return served, len(results) - len(served)
+
+def bench_server(mode, args, env, levels):
+    port = free_port()
+    server = subprocess.Popen(SERVERS[mode](port, args.workers), cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_for(f"{base_url}/health")
+        asyncio.run(fire(base_url, args.workers * 2, args.timeout))  # warm up connections and imports
+        for level in levels:
+            started = time.perf_counter()
+            served, failed = asyncio.run(fire(base_url, level, args.timeout))
+            wall = time.perf_counter() - started
+            print(f"{mode:<5} c={level:<5}: {len(served):>5} served, {failed:>5} failed/timed out, "
+                  f"{len(served) / wall:7.1f} req/s, p50 {median(served) * 1000 if served else 0:7.0f} ms, "
+                  f"p99 {percentile(served, 99) * 1000:7.0f} ms")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for both servers")
+    parser.add_argument("--levels", default="50,200,1000", help="concurrent requests per round")
+    parser.add_argument("--media-latency-ms", type=float, default=300, help="fake Graph latency per call")
+    parser.add_argument("--timeout", type=float, default=15, help="client timeout per request (seconds)")
+    parser.add_argument("--modes", default="sync,asgi")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="easyeasy_conc_")
+    graph_port = free_port()
+    graph = subprocess.Popen([sys.executable, "loadtest/fake_graph.py", "--port", str(graph_port),
+                              "--media-latency-ms", str(args.media_latency_ms), "--jitter-ms", "0"],
+                             cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+            "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "prometheus"),
+            "WHATSAPP_GRAPH_URL": f"http://127.0.0.1:{graph_port}/v18.0",
+            "BROADCAST_POLL_INTERVAL": "3600",
+        })
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+        subprocess.run([sys.executable, "init_db.py"], cwd=BACKEND, env=env, check=True, capture_output=True)
+        print(f"--- {args.workers} workers per server, Graph latency {args.media_latency_ms:.0f} ms x2 per request, "
+              f"timeout {args.timeout:.0f}s ---")
+        for mode in args.modes.split(","):
+            bench_server(mode, args, env, levels)
+    finally:
+        graph.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
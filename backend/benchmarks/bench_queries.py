@@ -0,0 +1,468 @@
+# backend/benchmarks/bench_queries.py
+# Seeds a database at a chosen scale and times the hot paths of app.py and
+# bot_handler.py by running the app's own code: admin endpoints through the
+# Flask test client, broadcast audiences through the dispatcher and planner.
+#
+#   python benchmarks/bench_queries.py --scale small                   # SQLite in /tmp
+#   python benchmarks/bench_queries.py --scale large --db-url postgresql://localhost/easyeasy_bench
+#   python benchmarks/bench_queries.py --scale medium --reuse --compare benchmarks/results/<previous>.json
+#
+# Results are written as JSON (benchmarks/results/ by default) so runs can be
+# compared over time; --compare prints the median change per query.
+# The target database is dropped and re-seeded unless --reuse is given and it
+# already holds the requested scale. Never point this at production.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timedelta
+from statistics import median, mean
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+from sqlalchemy import event
+from models import db, User, Promo, Order, Payment, Conversation, BroadcastJob, BroadcastDelivery, \
+    PromoStatus, PaymentStatus, OrderStatus
+from services.referral_codes import make_referral_code, normalize_code
+
+SCALES = {
+    # users, promos, orders
+    "tiny": (2_000, 200, 2_000),
+    "small": (20_000, 2_000, 20_000),
+    "medium": (200_000, 20_000, 200_000),
+    "large": (1_000_000, 100_000, 1_000_000),
+}
+
+INTERESTS = ["Business", "Fashion", "Food", "Campus", "Jobs", "Tech", "Entertainment", "Real Estate", "Health", "Education"]
+# Popularity of each interest (Zipf-like: fashion/food/tech dominate)
+INTEREST_WEIGHTS = [0.9, 2.5, 2.2, 1.2, 1.0, 2.0, 1.4, 0.5, 0.6, 0.7]
+NAMES = ["Ada", "Tunde", "Chioma", "Emeka", "Aisha", "Bola", "Ngozi", "Femi", "Zainab", "Ike", "Musa", "Kemi"]
+STATES = ["CUSTOMER_MENU"] * 8 + ["VENDOR_MENU", "WELCOME", "CUSTOMER_INTERESTS", "PROMO_TITLE"]
+VENDOR_FRACTION = 0.02
+SUBSCRIBER_FRACTION = 0.85
+CHUNK = 10_000
+DEFAULT_URL = "sqlite:////tmp/easyeasy_bench.db"
+
+# Background workers of app.py stay idle while it is benchmarked
+IDLE_WORKERS = ("BROADCAST_POLL_INTERVAL", "POINTS_ROLLUP_INTERVAL", "STATS_ROLLUP_INTERVAL",
+                "COUNTER_FLUSH_INTERVAL", "STATUS_FLUSH_INTERVAL")
+
+def make_app(url):
+    """Bare app for seeding"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+def load_app(url):
+    """app.py itself on the bench database; imported once seeding is done, since it reads settings at import"""
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ.pop("AUTO_CREATE_SCHEMA", None)
+    for name in IDLE_WORKERS:
+        os.environ[name] = "3600"
+    from app import app
+    return app
+
+def phone_for(user_id):
+    return f"234{8_000_000_000 + user_id}"
+
+def pick_interests(rng):
+    count = rng.choice([1, 1, 2, 2, 2, 3])
+    chosen = set()
+    while len(chosen) < count:
+        chosen.add(rng.choices(INTERESTS, INTEREST_WEIGHTS)[0])
+    return ", ".join(sorted(chosen))
+
+def insert_chunks(table, rows_iter, label, total):
+    started = time.perf_counter()
+    batch, done = [], 0
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            done += len(batch)
+            batch = []
+            print(f"\r  {label}: {done:,}/{total:,}", end="", flush=True)
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        done += len(batch)
+    print(f"\r  {label}: {done:,} rows in {time.perf_counter() - started:.1f}s")
+
+def seed(users, promos, orders, seed_value):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    vendor_ids = [i for i in range(1, users + 1) if i % int(1 / VENDOR_FRACTION) == 0]
+
+    def user_rows():
+        for i in range(1, users + 1):
+            name = f"{rng.choice(NAMES)} {i}"
+            is_vendor = i % int(1 / VENDOR_FRACTION) == 0
+            yield {
+                "id": i,
+                "phone_number": phone_for(i),
+                "name": name,
+                "is_vendor": is_vendor,
+                "is_subscriber": rng.random() < SUBSCRIBER_FRACTION,
+                "current_mode": "vendor" if is_vendor and rng.random() < 0.5 else "subscriber",
+                "verification_status": "verified" if is_vendor else "unverified",
+                "points": float(rng.randint(0, 20) * 500),
+                "referral_code": make_referral_code(name, i),
+                "referred_by_id": rng.randint(1, i - 1) if i > 1 and rng.random() < 0.3 else None,
+                "referral_count": int(rng.paretovariate(2.0)) - 1,
+                "purchases_confirmed": 0,
+                "sales_confirmed": 0,
+                "free_trials_used": 0,
+                "community_task_done": rng.random() < 0.6,
+                "gender": rng.choice(["Male", "Female", "All"]),
+                "interests": pick_interests(rng),
+                "business_name": f"Biz {i}" if is_vendor else None,
+                "created_at": now - timedelta(minutes=(users - i) * 525_600 / users),
+                "is_active": rng.random() < 0.97,
+                "daily_ai_count": 0,
+                "vendors_patronized_month": 0,
+                "ai_points_today": 0.0,
+                "ai_memory": "",
+            }
+
+    def promo_rows():
+        statuses = [PromoStatus.PENDING.value] * 1 + [PromoStatus.APPROVED.value] * 3 + \
+                   [PromoStatus.BROADCASTED.value] * 5 + [PromoStatus.REJECTED.value] * 1
+        for i in range(1, promos + 1):
+            cats = {rng.choices(INTERESTS, INTEREST_WEIGHTS)[0] for _ in range(rng.choice([1, 1, 2]))}
+            if rng.random() < 0.1:
+                cats = {"General"}
+            created = now - timedelta(minutes=(promos - i) * 525_600 / promos)
+            yield {
+                "id": i,
+                "vendor_id": rng.choice(vendor_ids),
+                "title": f"Product {i}",
+                "description": "Bench seeded product",
+                "price": float(rng.randint(1, 500) * 1000),
+                "contact_info": "08000000000",
+                "media_url": "",
+                "media_type": "image",
+                "promo_type": rng.choice(["free", "paid"]),
+                "target_impressions": rng.choice([0, 500, 1000, 5000]),
+                "total_price": 0.0,
+                "ai_generated_caption": "🔥 Bench caption",
+                "status": rng.choice(statuses),
+                "category": ", ".join(sorted(cats)),
+                "target_gender": rng.choice(["All", "All", "Male", "Female"]),
+                "created_at": created,
+                "approved_at": created,
+                "views": 0,
+                "clicks": 0,
+            }
+
+    promo_vendor = {}
+
+    def order_rows():
+        for i in range(1, orders + 1):
+            promo_id = rng.randint(1, promos)
+            yield {
+                "id": i,
+                "buyer_id": rng.randint(1, users),
+                "vendor_id": promo_vendor.get(promo_id, vendor_ids[promo_id % len(vendor_ids)]),
+                "promo_id": promo_id,
+                "amount": float(rng.randint(1, 500) * 1000),
+                "status": OrderStatus.CONFIRMED.value if rng.random() < 0.4 else OrderStatus.PENDING.value,
+                "created_at": now - timedelta(minutes=(orders - i) * 525_600 / orders),
+            }
+
+    def payment_rows():
+        pid = 0
+        for promo_id in range(1, promos + 1, 2):
+            pid += 1
+            yield {
+                "id": pid,
+                "user_id": vendor_ids[promo_id % len(vendor_ids)],
+                "promo_id": promo_id,
+                "amount": float(rng.randint(5, 100) * 1000),
+                "reference": f"PAY-BENCH-{pid}",
+                "status": PaymentStatus.COMPLETED.value if rng.random() < 0.7 else PaymentStatus.PENDING.value,
+                "created_at": now,
+            }
+
+    def conversation_rows():
+        for i in range(1, users + 1):
+            yield {"id": i, "phone_number": phone_for(i), "state": rng.choice(STATES), "context": "{}",
+                   "last_message_at": now - timedelta(minutes=rng.randint(0, 100_000))}
+
+    print(f"Seeding {users:,} users, {promos:,} promos, {orders:,} orders ...")
+    insert_chunks(User.__table__, user_rows(), "users", users)
+    insert_chunks(Promo.__table__, promo_rows(), "promos", promos)
+    promo_vendor.update(dict(db.session.query(Promo.id, Promo.vendor_id).all()))
+    insert_chunks(Order.__table__, order_rows(), "orders", orders)
+    insert_chunks(Payment.__table__, payment_rows(), "payments", (promos + 1) // 2)
+    insert_chunks(Conversation.__table__, conversation_rows(), "conversations", users)
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+
+# --- the hot paths, run through the app's code ---------------------------------
+
+class Queries:
+    """Each method runs one hot path and returns the number of rows it produced.
+
+    The bot's lookups are single statements inside large handlers that also
+    send messages, so those few are issued exactly as bot_handler.py writes them.
+    """
+
+    def __init__(self, client, users, rng):
+        from services.frequency_cap import FrequencyCap
+        from services.delivery_planner import DeliveryPlanner
+        self.client = client
+        self.users = users
+        self.rng = rng
+        self.planner = DeliveryPlanner(FrequencyCap())
+        sample = User.query.with_entities(User.name, User.id).filter(User.id.in_(
+            [rng.randint(1, users) for _ in range(200)])).all()
+        self.codes = [make_referral_code(name, uid) for name, uid in sample]
+        self.vendor_ids = [v for (v,) in db.session.query(User.id).filter_by(is_vendor=True).limit(500).all()]
+        self.promo_ids = [p for (p,) in db.session.query(Promo.id).filter(
+            Promo.status.in_([PromoStatus.APPROVED, PromoStatus.BROADCASTED])).limit(500).all()]
+        self.impression_budget = max(1, min(1000, users // 10))
+        # Admins browse the first pages; keep the sampled page within the data
+        self.user_pages = max(1, min(50, users // 20))
+        self.vendor_pages = max(1, min(20, User.query.filter_by(is_vendor=True).count() // 20))
+        self.pending_pages = max(1, min(20, Promo.query.filter_by(status="pending").count() // 20))
+
+    def _get(self, path):
+        response = self.client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path}: {response.status_code}")
+        return response.get_json()
+
+    def user_lookup(self):
+        phone = phone_for(self.rng.randint(1, self.users))
+        return int(User.query.filter_by(phone_number=phone).first() is not None)
+
+    def conversation_lookup(self):
+        phone = phone_for(self.rng.randint(1, self.users))
+        return int(Conversation.query.filter_by(phone_number=phone).first() is not None)
+
+    def referral_code_check(self):
+        code = self.rng.choice(self.codes)
+        return int(User.query.filter_by(referral_code=normalize_code(code)).first() is not None)
+
+    def free_audience_walk(self):
+        """Free broadcast: the dispatcher's chunked subscriber walk through matches_audience"""
+        from services.broadcast_scheduler import BroadcastScheduler, matches_audience
+        from services.delivery_planner import promo_categories
+        promo = db.session.get(Promo, self.rng.choice(self.promo_ids))
+        promo_cats = promo_categories(promo)
+        matched, cursor = 0, 0
+        while True:
+            chunk = BroadcastScheduler.subscriber_chunk(cursor)
+            if not chunk:
+                return matched
+            matched += sum(1 for s in chunk if matches_audience(s, promo_cats, promo.target_gender))
+            cursor = chunk[-1].id
+
+    def setup_paid_audience_plan(self):
+        job = BroadcastJob(promo_id=self.rng.choice(self.promo_ids), status="queued", priority=1,
+                           impression_budget=self.impression_budget)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def paid_audience_plan(self, job):
+        """Paid broadcast: DeliveryPlanner ranks and plans `impression_budget` recipients"""
+        return self.planner._allocate({job: job.impression_budget}, datetime.utcnow())
+
+    def teardown_paid_audience_plan(self, job):
+        BroadcastDelivery.query.filter_by(job_id=job.id).delete(synchronize_session=False)
+        db.session.delete(job)
+        db.session.commit()
+
+    def stats(self):
+        """/api/stats"""
+        return len(self._get("/api/stats"))
+
+    def admin_users_page(self):
+        """/api/users?page=N"""
+        return len(self._get(f"/api/users?page={self.rng.randint(1, self.user_pages)}&per_page=20")["users"])
+
+    def admin_vendors_page(self):
+        """/api/users?role=vendor&page=N"""
+        return len(self._get(f"/api/users?role=vendor&page={self.rng.randint(1, self.vendor_pages)}&per_page=20")["users"])
+
+    def admin_pending_promos_page(self):
+        """/api/promos?status=pending&page=N"""
+        return len(self._get(f"/api/promos?status=pending&page={self.rng.randint(1, self.pending_pages)}&per_page=20")["promos"])
+
+    def ai_inventory(self):
+        """handle_customer_ai_chat product context (vendor loaded per row)"""
+        promos = Promo.query.filter_by(status=PromoStatus.APPROVED).order_by(Promo.created_at.desc()).limit(15).all()
+        return len([f"- {p.title} ({p.category}): ₦{p.price:,.0f} by {p.vendor.business_name}" for p in promos])
+
+    def vendor_recent_promos(self):
+        """Vendor menu 'promo_status'"""
+        vendor_id = self.rng.choice(self.vendor_ids)
+        return len(Promo.query.filter_by(vendor_id=vendor_id).order_by(Promo.created_at.desc()).limit(5).all())
+
+    def leaderboard_referrers(self):
+        """/api/leaderboard?type=referrers"""
+        return len(self._get("/api/leaderboard?type=referrers&limit=10")["leaders"])
+
+# name -> heavy? (heavy queries run with --heavy-repeat)
+BENCHMARKS = {
+    "user_lookup": False,
+    "conversation_lookup": False,
+    "referral_code_check": False,
+    "free_audience_walk": True,
+    "paid_audience_plan": True,
+    "stats": True,
+    "admin_users_page": False,
+    "admin_vendors_page": False,
+    "admin_pending_promos_page": False,
+    "ai_inventory": False,
+    "vendor_recent_promos": False,
+    "leaderboard_referrers": False,
+}
+
+def run_benchmarks(queries, repeat, heavy_repeat, only):
+    statements = {"n": 0}
+
+    def count(*args):
+        statements["n"] += 1
+    event.listen(db.engine, "before_cursor_execute", count)
+
+    results = {}
+    for name, heavy in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        fn = getattr(queries, name)
+        # Optional untimed per-run setup (its result is passed to the run) and teardown
+        setup = getattr(queries, f"setup_{name}", lambda: None)
+        teardown = getattr(queries, f"teardown_{name}", lambda arg: None)
+
+        def once():
+            arg = setup()
+            db.session.rollback()  # drop identity map so every run hits the DB
+            issued = statements["n"]
+            started = time.perf_counter()
+            rows = fn(arg) if arg is not None else fn()
+            elapsed = (time.perf_counter() - started) * 1000
+            issued = statements["n"] - issued
+            db.session.rollback()
+            teardown(arg)
+            return rows, elapsed, issued
+
+        once()  # warm up caches / connection
+        timings, rows, issued_total = [], 0, 0
+        runs = heavy_repeat if heavy else repeat
+        for _ in range(runs):
+            rows, elapsed, issued = once()
+            timings.append(elapsed)
+            issued_total += issued
+        timings.sort()
+        results[name] = {
+            "runs": runs,
+            "min_ms": round(timings[0], 3),
+            "median_ms": round(median(timings), 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            "mean_ms": round(mean(timings), 3),
+            "statements_per_run": round(issued_total / runs, 1),
+            "rows": rows,
+        }
+        r = results[name]
+        print(f"  {name:28} median {r['median_ms']:>10.2f} ms   p95 {r['p95_ms']:>10.2f} ms   "
+              f"{r['statements_per_run']:>5} stmts   rows {rows}")
+    event.remove(db.engine, "before_cursor_execute", count)
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+def compare(current, meta, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\n--- vs {previous_path} ({previous['meta'].get('commit')}) ---")
+    for key in ("dialect", "scale"):
+        if previous["meta"].get(key) != meta[key]:
+            print(f"  note: {key} differs ({previous['meta'].get(key)} vs {meta[key]}), timings are not comparable")
+    for name, r in current.items():
+        old = previous["results"].get(name)
+        if not old:
+            continue
+        ratio = r["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        flag = "  REGRESSION" if ratio > 1.2 else "  improved" if ratio < 0.8 else ""
+        print(f"  {name:28} {old['median_ms']:>10.2f} -> {r['median_ms']:>10.2f} ms  (x{ratio:.2f}){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded query benchmarks for the data access layer")
+    parser.add_argument("--db-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_URL))
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--users", type=int, help="override the scale preset")
+    parser.add_argument("--promos", type=int)
+    parser.add_argument("--orders", type=int)
+    parser.add_argument("--reuse", action="store_true", help="keep an existing database of the same scale")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--heavy-repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="run only these benchmarks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="JSON output path (default benchmarks/results/...)")
+    parser.add_argument("--compare", help="previous JSON result to compare against")
+    args = parser.parse_args()
+
+    users, promos, orders = SCALES[args.scale]
+    users, promos, orders = args.users or users, args.promos or promos, args.orders or orders
+
+    app = make_app(args.db_url)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        existing = 0
+        if args.reuse:
+            try:
+                existing = User.query.count()
+            except Exception:
+                db.session.rollback()
+        if existing != users:
+            db.drop_all()
+            db.create_all()
+            seed(users, promos, orders, args.seed)
+        else:
+            print(f"Reusing existing database with {existing:,} users")
+
+    flask_app = load_app(args.db_url)
+    with flask_app.app_context():
+        print(f"Benchmarks on {dialect} ({users:,} users, {promos:,} promos, {orders:,} orders):")
+        queries = Queries(flask_app.test_client(), users, random.Random(args.seed))
+        results = run_benchmarks(queries, args.repeat, args.heavy_repeat, args.only)
+
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    report = {
+        "meta": {
+            "timestamp": stamp,
+            "commit": git_commit(),
+            "dialect": dialect,
+            "scale": {"users": users, "promos": promos, "orders": orders},
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                   f"queries-{dialect}-{users}-{stamp}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {out}")
+    if args.compare:
+        compare(results, report["meta"], args.compare)
+
+if __name__ == "__main__":
+    main()
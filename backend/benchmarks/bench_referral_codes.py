@@ -0,0 +1,116 @@
+# backend/benchmarks/bench_referral_codes.py
+# Simulates signups with Zipf-skewed name prefixes and compares the legacy
+# "prefix + random 4 digits, probe until unused" allocator with the id-derived
+# allocator in services/referral_codes.py.
+#
+#   python benchmarks/bench_referral_codes.py --signups 1000000
+#
+# The legacy allocator is simulated statistically; every probe stands for one
+# `User.query.filter_by(referral_code=...)` round trip.
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.referral_codes import make_referral_code
+
+LEGACY_SLOTS = 9000  # random.randint(1000, 9999)
+
+def skewed_names(count, distinct_prefixes, zipf_s, seed):
+    """Names whose 3-letter prefixes follow a Zipf distribution (a few very common)."""
+    rng = random.Random(seed)
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    prefixes = ["USR", "JOH", "MAR", "DAV", "CHI", "OLU", "EMM", "AIS"]
+    while len(prefixes) < distinct_prefixes:
+        p = "".join(rng.choice(letters) for _ in range(3))
+        if p not in prefixes:
+            prefixes.append(p)
+    weights = [1 / (rank ** zipf_s) for rank in range(1, distinct_prefixes + 1)]
+    return [p + "x" for p in rng.choices(prefixes, weights=weights, k=count)]
+
+def bench_legacy(names, max_attempts, seed):
+    """Probe counts for the legacy loop.
+
+    With k of a prefix's 9,000 codes taken, each random probe succeeds with
+    probability (9000 - k) / 9000, so the attempts per signup are geometric.
+    Sampling that directly gives the same distribution as replaying the loop
+    without spending minutes on the near-full prefixes.
+    """
+    rng = random.Random(seed)
+    taken = {}
+    probes = 0
+    worst = 0
+    failed = 0
+    for name in names:
+        base = name[:3].upper()
+        k = taken.get(base, 0)
+        if k >= LEGACY_SLOTS:
+            # Prefix exhausted: the real loop has no cap and would spin forever
+            failed += 1
+            continue
+
+        p = (LEGACY_SLOTS - k) / LEGACY_SLOTS
+        attempts = 1 if p == 1 else 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - p))
+        if attempts > max_attempts:
+            probes += max_attempts
+            failed += 1
+            continue
+
+        probes += attempts
+        worst = max(worst, attempts)
+        taken[base] = k + 1
+    return {
+        "probes": probes,
+        "probes_per_signup": probes / len(names),
+        "worst_attempts": worst,
+        "failed_signups": failed,
+    }
+
+def bench_allocator(names):
+    codes = set()
+    start = time.perf_counter()
+    for user_id, name in enumerate(names, start=1):
+        codes.add(make_referral_code(name, user_id))
+    elapsed = time.perf_counter() - start
+    lengths = {len(c) for c in codes}
+    return {
+        "seconds": elapsed,
+        "probes": 0,
+        "probes_per_signup": 0.0,
+        "duplicates": len(names) - len(codes),
+        "code_lengths": sorted(lengths),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--signups", type=int, default=1_000_000)
+    parser.add_argument("--prefixes", type=int, default=2000, help="distinct name prefixes")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for prefix popularity")
+    parser.add_argument("--max-attempts", type=int, default=2000, help="cap for the simulated legacy loop")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    names = skewed_names(args.signups, args.prefixes, args.zipf, args.seed)
+    top = {}
+    for n in names:
+        top[n[:3]] = top.get(n[:3], 0) + 1
+    busiest = sorted(top.items(), key=lambda kv: -kv[1])[:3]
+    print(f"--- {args.signups:,} signups, {args.prefixes} prefixes, busiest: "
+          + ", ".join(f"{p}={c:,}" for p, c in busiest)
+          + f" (legacy capacity {LEGACY_SLOTS:,} per prefix) ---")
+
+    legacy = bench_legacy(names, args.max_attempts, args.seed)
+    # Legacy time is simulation time only; its real cost is the DB probes
+    print(f"legacy    : {legacy['probes']:,} DB probes "
+          f"({legacy['probes_per_signup']:.2f}/signup), worst {legacy['worst_attempts']} attempts, "
+          f"{legacy['failed_signups']:,} signups over the attempt cap or on an exhausted prefix (never terminate)")
+
+    new = bench_allocator(names)
+    print(f"allocator : {new['seconds']:.2f}s, 0 DB probes, {new['duplicates']} duplicates, "
+          f"code lengths {new['code_lengths']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# backend/benchmarks/bench_startup.py
+# Measures cold worker boot: a fresh interpreter importing app.py, which is
+# what every gunicorn worker does on start and on every recycle.
+#
+#   python benchmarks/bench_startup.py --runs 7
+#   python benchmarks/bench_startup.py --runs 7 --baseline HEAD~1     # before/after
+#
+# --baseline exports backend/ at that git revision (git archive) and boots it
+# the same way. Both trees run against one throwaway SQLite database whose
+# schema is created beforehand with this tree's init_db.py, so schema creation
+# is not counted for a tree that no longer does it at boot.
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import os, sys, json, time, resource
+started = time.perf_counter()
+import app
+seconds = time.perf_counter() - started
+print("BENCH " + json.dumps({
+    "seconds": seconds,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}))
+sys.stdout.flush()
+os._exit(0)  # skip atexit flushes; only the boot is measured
+"""
+
+def export_tree(ref, dest):
+    """backend/ as of git revision `ref`, unpacked under dest"""
+    repo = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=BACKEND,
+                          capture_output=True, text=True, check=True).stdout.strip()
+    prefix = os.path.relpath(BACKEND, repo)
+    archive = subprocess.run(["git", "archive", ref, prefix], cwd=repo, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", dest], input=archive, check=True)
+    return os.path.join(dest, prefix)
+
+def boot(tree, env):
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=tree, env=env, capture_output=True, text=True)
+    for line in out.stdout.splitlines():
+        if line.startswith("BENCH "):
+            return json.loads(line[len("BENCH "):])
+    raise RuntimeError(f"boot failed in {tree}:\n{out.stderr[-2000:]}")
+
+def bench(label, tree, env, runs):
+    boot(tree, env)  # warm the OS page cache and .pyc files; not counted
+    samples = [boot(tree, env) for _ in range(runs)]
+    result = {
+        "seconds": median(s["seconds"] for s in samples),
+        "rss_mb": median(s["rss_mb"] for s in samples),
+        "modules": samples[-1]["modules"],
+    }
+    print(f"{label:<10}: import app {result['seconds'] * 1000:7.0f} ms median, "
+          f"max RSS {result['rss_mb']:6.1f} MB, {result['modules']} modules loaded")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="boots per tree (median is reported)")
+    parser.add_argument("--baseline", help="git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="easyeasy_boot_")
+    try:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'boot.db')}",
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-bench"),  # older trees build the client at import
+            "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "prometheus"),
+        })
+        env.pop("AUTO_CREATE_SCHEMA", None)
+        os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+        subprocess.run([sys.executable, "init_db.py"], cwd=BACKEND, env=env, check=True, capture_output=True)
+
+        print(f"--- cold worker boot, {args.runs} runs per tree ---")
+        results = {}
+        if args.baseline:
+            results["baseline"] = bench(args.baseline, export_tree(args.baseline, workdir), env, args.runs)
+        results["current"] = bench("current", BACKEND, env, args.runs)
+        if args.baseline:
+            before, after = results["baseline"], results["current"]
+            print(f"change    : {(after['seconds'] - before['seconds']) * 1000:+.0f} ms "
+                  f"({(after['seconds'] / before['seconds'] - 1) * 100:+.0f}%), "
+                  f"{after['rss_mb'] - before['rss_mb']:+.1f} MB per worker")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
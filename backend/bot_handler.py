@@ -1,6 +1,5 @@
 import json
 import uuid
-import random
 import os
 import urllib.parse
 from datetime import datetime, timedelta
@@ -10,16 +9,26 @@ load_dotenv()
 from models import db, User, Promo, Payment, Broadcast, Conversation, SupportTicket, PromoStatus, PaymentStatus, Order, OrderStatus, SystemSetting
 from services.whatsapp_service import WhatsAppService
 from services.openai_service import OpenAIService
+from services.message_templates import templates
+from services.media_ingest import MediaIngestService
+from services.referral_codes import make_referral_code, normalize_code
+from services import user_counters
+from services.points_service import PointsService
+from services.settings_cache import settings
+from services.counter_buffer import counters
+from services.stats_rollup import vendor_stats, top_promos
+from services import metrics
 
 # Configuration
 COMMUNITY_CODE = "EASY50" 
-DAILY_AI_LIMIT = 10
 PAYMENT_LINK = os.getenv("LINK_PAYMENT_FLUTTERWAVE", "https://flutterwave.com/pay/default")
 
 class BotHandler:
     def __init__(self):
         self.whatsapp = WhatsAppService()
         self.openai = OpenAIService()
+        self.media_ingest = MediaIngestService()
+        self.points = PointsService()
 
     def get_interest_map(self):
         return {
@@ -59,7 +68,7 @@ class BotHandler:
                 self.show_vendor_menu(phone_number)
             elif user.is_subscriber and user.current_mode == "subscriber":
                 conversation.state = "CUSTOMER_MENU"
-                self.send_customer_menu(phone_number)
+                self.send_customer_menu(phone_number, user)
             else:
                 conversation.state = "WELCOME"
                 self.send_welcome_message(phone_number, user)
@@ -71,6 +80,13 @@ class BotHandler:
             self.handle_global_entry(phone_number, user, conversation)
             return
 
+        with metrics.timer(metrics.BOT_STATE_SECONDS.labels(state)):
+            self.dispatch_state(phone_number, message_text, conversation, user, state)
+
+        db.session.commit()
+
+    def dispatch_state(self, phone_number, message_text, conversation, user, state):
+        """Route a message to the handler for the conversation's current state"""
         # --- STATE MACHINE ---
         if state == "WELCOME":
             self.handle_role_selection(phone_number, message_text, conversation, user)
@@ -146,16 +162,13 @@ class BotHandler:
         elif user.is_subscriber and user.current_mode == "subscriber" and conversation.state == "CUSTOMER_MENU":
              self.handle_customer_ai_chat(phone_number, message_text, conversation, user)
 
-        db.session.commit()
-
     # GLOBAL & LIMITS
     def check_ai_limits(self, user):
         now = datetime.utcnow()
         if user.last_ai_usage and user.last_ai_usage.date() < now.date():
             user.daily_ai_count = 0 
-        if user.daily_ai_count >= DAILY_AI_LIMIT:
-            return False
-        return True
+        # Budget is enforced in tokens (see OpenAIService), not call counts
+        return self.openai.has_budget(user.id)
 
     # 1. DAILY CHECK-IN 
     def handle_global_entry(self, phone_number, user, conversation):
@@ -164,11 +177,30 @@ class BotHandler:
         
         # Check if 24 hours passed
         if not user.last_checkin or (now - user.last_checkin) >= timedelta(hours=24):
-            user.points += 500  
+            self.points.award(user.id, 500, "daily_checkin")
             user.last_checkin = now
             checkin_msg = "🌟 +500 Points for daily check-in!\n"
             db.session.commit()
 
+        if user.is_vendor and user.is_subscriber:
+            msg = f"Hi {user.name or 'there'}! 👋\n{checkin_msg}\nWhich dashboard would you like to access?"
+            conversation.state = "SELECT_DASHBOARD"
+            buttons = ["Vendor Dashboard", "Customer Dashboard"]
+            self.whatsapp.send_button_message(phone_number, msg, buttons)
+        elif user.is_vendor:
+            conversation.state = "VENDOR_MENU"
+            self.show_vendor_menu(phone_number)
+        elif user.is_subscriber:
+            msg = f"Hi {user.name or 'there'}! 👋\n{checkin_msg}\nWelcome to your dashboard."
+            self.whatsapp.send_text_message(phone_number, msg)
+            conversation.state = "CUSTOMER_MENU"
+            self.send_customer_menu(phone_number, user)
+        else:
+            conversation.state = "WELCOME"
+            self.send_welcome_message(phone_number, user)
+        
+        db.session.commit()
+
     # 2. AI CHAT REWARDS (Controlled)
     def handle_customer_ai_chat(self, phone_number, message, conversation, user):
         
@@ -187,7 +219,7 @@ class BotHandler:
         # Reward specific logic
         reward_msg = ""
         if time_since_last >= 5 and user.ai_points_today < 2000:
-             user.points += 1000
+             self.points.award(user.id, 1000, "ai_chat")
              user.ai_points_today += 1000
              user.last_ai_reward = now
              reward_msg = " (💰 +1,000 Pts)"
@@ -212,7 +244,8 @@ class BotHandler:
                 user_name=user.name,
                 user_memory=user.ai_memory or "",
                 user_message=message,
-                product_data=products_context
+                product_data=products_context,
+                user_id=user.id
             )
             
             # Extract the reply and the new fact
@@ -238,25 +271,6 @@ class BotHandler:
             print(f"AI Chat Error: {e}")
             self.whatsapp.send_text_message(phone_number, "⚠️ My AI brain is offline momentarily. Please try 'Menu' to browse manually.")
 
-        if user.is_vendor and user.is_subscriber:
-            msg = f"Hi {user.name or 'there'}! 👋\n{checkin_msg}\nWhich dashboard would you like to access?"
-            conversation.state = "SELECT_DASHBOARD"
-            buttons = ["Vendor Dashboard", "Customer Dashboard"]
-            self.whatsapp.send_button_message(phone_number, msg, buttons)
-        elif user.is_vendor:
-            conversation.state = "VENDOR_MENU"
-            self.show_vendor_menu(phone_number)
-        elif user.is_subscriber:
-            msg = f"Hi {user.name or 'there'}! 👋\n{checkin_msg}\nWelcome to your dashboard."
-            self.whatsapp.send_text_message(phone_number, msg)
-            conversation.state = "CUSTOMER_MENU"
-            self.send_customer_menu(phone_number)
-        else:
-            conversation.state = "WELCOME"
-            self.send_welcome_message(phone_number, user)
-        
-        db.session.commit()
-
     def handle_dashboard_selection(self, phone_number, message, conversation, user):
         if "vendor" in message.lower() or message == "btn_0":
             user.current_mode = "vendor"
@@ -274,11 +288,10 @@ class BotHandler:
             else:
                 conversation.state = "CUSTOMER_MENU"
                 db.session.commit()
-                self.send_customer_menu(phone_number)
+                self.send_customer_menu(phone_number, user)
 
     def send_welcome_message(self, phone_number, user):
-        buttons = ["Vendor", "Customer"]
-        self.whatsapp.send_button_message(phone_number, "👋 Welcome to EasyEasy!\n\nRegister as:", buttons)
+        self.whatsapp.send_interactive_message(phone_number, templates.welcome_message(user.name if user else None))
 
     def handle_role_selection(self, phone_number, message, conversation, user):
         msg_lower = message.lower()
@@ -300,8 +313,7 @@ class BotHandler:
                 return
             
             # 2. Check Database Setting for "Lock"
-            lock_setting = SystemSetting.query.get('vendor_lock')
-            is_locked = lock_setting.value == 'true' if lock_setting else False
+            is_locked = settings.get_bool('vendor_lock')
             
             if is_locked:
                 # LOCKED: Show the "Sorry" message
@@ -330,8 +342,7 @@ class BotHandler:
         user.name = message.strip()
     
         if not user.referral_code:
-            code_base = user.name[:3].upper().replace(" ", "X")
-            user.referral_code = f"{code_base}{random.randint(100,999)}"
+            user.referral_code = make_referral_code(user.name, user.id)
         
         conversation.state = "VENDOR_BUSINESS"
         db.session.commit()
@@ -362,18 +373,7 @@ class BotHandler:
         self.whatsapp.send_text_message(phone_number, msg)
 
     def show_vendor_menu(self, phone_number):
-        sections = [{
-            "title": "Vendor Options",
-            "rows": [
-                {"id": "upload_product", "title": "Upload Products"},
-                {"id": "run_promo", "title": "Run Promotion"},
-                {"id": "profile", "title": "Profile"},
-                {"id": "promo_status", "title": "View Promotion Status"},
-                {"id": "switch_customer", "title": "Switch to Customer"},
-                {"id": "support", "title": "Support"}
-            ]
-        }]
-        self.whatsapp.send_list_message(phone_number, "Vendor Dashboard", "Open Options", sections)
+        self.whatsapp.send_interactive_message(phone_number, templates.vendor_menu)
 
     def handle_vendor_menu(self, phone_number, message, conversation, user):
         msg_id = message.lower().strip()
@@ -406,7 +406,7 @@ class BotHandler:
                 f"📛 *Owner:* {user.name}\n"
                 f"🔐 *Status:* {user.verification_status.upper()}\n"
                 f"📱 *Phone:* {user.phone_number}\n"
-                f"💎 *Points:* {user.points}\n"
+                f"💎 *Points:* {self.points.balance(user.id)}\n"
                 f"📅 *Joined:* {user.created_at.strftime('%Y-%m-%d')}"
             )
             self.whatsapp.send_text_message(phone_number, txt)
@@ -424,6 +424,10 @@ class BotHandler:
                 self.whatsapp.send_text_message(phone_number, response)
             self.show_vendor_menu(phone_number)
         
+        elif msg_id == "my_stats":
+            self.whatsapp.send_text_message(phone_number, self.format_vendor_stats(user))
+            self.show_vendor_menu(phone_number)
+
         elif msg_id == "switch_customer":
             user.current_mode = "subscriber"
             if not user.interests:
@@ -435,7 +439,7 @@ class BotHandler:
                 conversation.state = "CUSTOMER_MENU"
                 db.session.commit()
                 self.whatsapp.send_text_message(phone_number, "🔄 Switching to Customer Mode...")
-                self.send_customer_menu(phone_number)
+                self.send_customer_menu(phone_number, user)
 
         elif msg_id == "support":
             txt = (
@@ -454,6 +458,25 @@ class BotHandler:
         else:
             self.show_vendor_menu(phone_number)
 
+    def format_vendor_stats(self, user):
+        """'My Stats' summary, read from the daily rollup tables"""
+        week = vendor_stats(user.id, 7)['totals']
+        month = vendor_stats(user.id, 30)['totals']
+        lines = ["📈 *My Stats*", ""]
+        for label, t in (("Last 7 days", week), ("Last 30 days", month)):
+            lines.append(
+                f"*{label}*\n"
+                f"📤 Sent: {t['sent']:,} | 📬 Delivered: {t['delivered']:,}\n"
+                f"🛒 Buy requests: {t['buy_intents']:,} | ✅ Sales: {t['sales_confirmed']:,}\n"
+                f"💰 Revenue: ₦{t['revenue']:,.2f}\n"
+            )
+        best = top_promos(user.id, 30, 3)
+        if best:
+            lines.append("🏆 *Top promotions (30 days)*")
+            lines.extend(f"• {p['title']}: {p['buy_intents']} buy requests, {p['delivered']} delivered" for p in best)
+        lines.append("\n_Stats update every few minutes._")
+        return "\n".join(lines)
+
     def handle_support_message(self, phone_number, message, conversation, user):
         # Create ticket
         ticket = SupportTicket(
@@ -473,7 +496,7 @@ class BotHandler:
             conversation.state = "CUSTOMER_MENU"
             self.whatsapp.send_text_message(phone_number, "✅ Complaint received! We will reach out to you shortly.")
             db.session.commit()
-            self.send_customer_menu(phone_number)
+            self.send_customer_menu(phone_number, user)
 
     # --- AD CREATION FLOW ---
     def handle_promo_title(self, phone_number, message, conversation):
@@ -582,7 +605,8 @@ class BotHandler:
             title=context.get('title'),
             description=context.get('description'),
             price=context.get('price'),
-            business_name=user.business_name
+            business_name=user.business_name,
+            user_id=user.id
         )
         
         context['ai_caption'] = ai_caption
@@ -620,7 +644,8 @@ class BotHandler:
             description=context.get('description'),
             price=context.get('price'),
             business_name=user.business_name,
-            instruction=f"Refine this caption based on this feedback: {message}. Previous draft: {current_caption}"
+            instruction=f"Refine this caption based on this feedback: {message}. Previous draft: {current_caption}",
+            user_id=user.id
         )
         
         context['ai_caption'] = new_caption
@@ -705,8 +730,7 @@ class BotHandler:
     def handle_free_screenshot_1(self, phone_number, message, conversation, user):
         # 1. Ensure they have a referral code
         if not user.referral_code:
-            code_base = (user.name or "USR")[:3].upper().replace(" ", "X")
-            user.referral_code = f"{code_base}{random.randint(100,999)}"
+            user.referral_code = make_referral_code(user.name, user.id)
             db.session.commit()
 
         # 2. Generate their unique link
@@ -787,7 +811,8 @@ class BotHandler:
                 title=context.get('title'),
                 description=context.get('description'),
                 price=context.get('price'),
-                business_name=user.business_name
+                business_name=user.business_name,
+                user_id=user.id
             )
             
         promo = Promo(
@@ -818,22 +843,9 @@ class BotHandler:
         # 1. Capture the name first!
         user.name = message.strip()
         
-        # 2. Generate Referral Code 
+        # 2. Generate Referral Code (derived from the user id, unique without DB probes)
         if not user.referral_code:
-            clean_name = "".join(e for e in user.name if e.isalnum())
-            base = (clean_name[:3] if len(clean_name) >= 3 else "USR").upper()
-            
-            unique = False
-            while not unique:
-                # Increased range to 1000-9999 for less collision
-                rand_suffix = random.randint(1000, 9999) 
-                new_code = f"{base}{rand_suffix}"
-                
-                # Check if this code exists
-                existing = User.query.filter_by(referral_code=new_code).first()
-                if not existing:
-                    user.referral_code = new_code
-                    unique = True
+            user.referral_code = make_referral_code(user.name, user.id)
         
         # 3. Move to next state
         conversation.state = "CUSTOMER_GENDER"
@@ -875,10 +887,11 @@ class BotHandler:
 
     def handle_customer_referral(self, phone_number, message, conversation, user):
         if message.lower() != 'no':
-            referrer = User.query.filter_by(referral_code=message.strip()).first()
-            if referrer:
+            referrer = User.query.filter_by(referral_code=normalize_code(message)).first()
+            if referrer and referrer.id != user.id and not user.referred_by_id:
                 user.referred_by_id = referrer.id
-                referrer.points += 15
+                self.points.award(referrer.id, 15, "referral")
+                user_counters.increment(referrer.id, referral_count=1)
         conversation.state = "CUSTOMER_COMMUNITY_TASK"
         db.session.commit()
         user_link = os.getenv('LINK_USER_COMMUNITY', '#')
@@ -895,7 +908,7 @@ class BotHandler:
         code = message.strip().upper()
         if code == COMMUNITY_CODE:
             if not user.community_task_done:
-                user.points += 50
+                self.points.award(user.id, 50, "community_task")
                 user.community_task_done = True
                 db.session.commit()
                 self.whatsapp.send_text_message(phone_number, "✅ Correct Code! 🎉 +50 Points Added!")
@@ -904,33 +917,13 @@ class BotHandler:
             user.is_subscriber = True 
             conversation.state = "CUSTOMER_MENU"
             db.session.commit()
-            self.send_customer_menu(phone_number)
+            self.send_customer_menu(phone_number, user)
         else:
             self.whatsapp.send_text_message(phone_number, "❌ Incorrect code.")
 
-    def send_customer_menu(self, phone_number):
-        sections = [{
-            "title": "Menu",
-            "rows": [
-                {"id": "earn", "title": "How to earn"},
-                {"id": "status", "title": "Account status"},
-                {"id": "update_interests", "title": "Update Interests"},
-                {"id": "support", "title": "Support"},
-                {"id": "unsub", "title": "Subscribe/Unsub"},
-                {"id": "redeem", "title": "Redeem Points"},     
-                {"id": "join_socials", "title": "Social Media"}
-            ]
-        }]
-        user = User.query.filter_by(phone_number=phone_number).first()
-        if user.is_vendor:
-             sections[0]["rows"].append({"id": "switch_vendor", "title": "🔄 Switch to Vendor"})
-        else:
-             sections[0]["rows"].append({"id": "become_vendor", "title": "🆕 Become a Vendor"})
-        
-        body_text = "Customer Dashboard\n\n💡 Tip: You can also type any question to ask our AI Assistant about products!"
-        button_text = "Open Menu"
-        
-        self.whatsapp.send_list_message(phone_number, body_text, button_text, sections)
+    def send_customer_menu(self, phone_number, user):
+        # Caller passes the already-loaded user so the menu costs no extra query
+        self.whatsapp.send_interactive_message(phone_number, templates.customer_menu(user.is_vendor))
 
     def handle_customer_menu(self, phone_number, message, conversation, user):
         # FIX 5: Defined 'msg' at the top to avoid UnboundLocalError
@@ -950,11 +943,11 @@ class BotHandler:
                 "• Patronize 5 Vendors/month to unlock."
              )
              self.whatsapp.send_text_message(phone_number, txt)
-             self.send_customer_menu(phone_number)
+             self.send_customer_menu(phone_number, user)
 
         elif "status" in msg:
-             pts = user.points if user.points else 0.0
-             ref_count = len(user.referrals) if user.referrals else 0
+             pts = self.points.balance(user.id)
+             ref_count = user.referral_count or 0
              code = user.referral_code if user.referral_code else "None"
              txt = (
                 f"📊 Status\n\n"
@@ -965,7 +958,7 @@ class BotHandler:
                 f"Interests: {user.interests}"
              )
              self.whatsapp.send_text_message(phone_number, txt)
-             self.send_customer_menu(phone_number) 
+             self.send_customer_menu(phone_number, user) 
 
         elif "update" in msg or "interest" in msg:
              msg = (
@@ -986,11 +979,12 @@ class BotHandler:
              db.session.commit()
         
         elif "redeem" in msg:
-             if user.points >= 100000:
-                 self.whatsapp.send_text_message(phone_number, f"🎉 You have {user.points} points! Please contact support to redeem.")
+             balance = self.points.balance(user.id)
+             if balance >= 100000:
+                 self.whatsapp.send_text_message(phone_number, f"🎉 You have {balance} points! Please contact support to redeem.")
              else:
-                 self.whatsapp.send_text_message(phone_number, f"❌ You need at least 100,000 points to redeem. You currently have {user.points}.")
-             self.send_customer_menu(phone_number)
+                 self.whatsapp.send_text_message(phone_number, f"❌ You need at least 100,000 points to redeem. You currently have {balance}.")
+             self.send_customer_menu(phone_number, user)
         
         elif "join" in msg and "social" in msg:
              txt = (
@@ -1000,7 +994,7 @@ class BotHandler:
                  f"Instagram: {os.getenv('LINK_INSTAGRAM', '#')}\n"
              )
              self.whatsapp.send_text_message(phone_number, txt)
-             self.send_customer_menu(phone_number)
+             self.send_customer_menu(phone_number, user)
 
         elif "support" in msg:
              txt = (
@@ -1027,7 +1021,7 @@ class BotHandler:
              
              db.session.commit()
              self.whatsapp.send_text_message(phone_number, txt)
-             self.send_customer_menu(phone_number)
+             self.send_customer_menu(phone_number, user)
         
         elif "switch" in msg or "become" in msg or "vendor" in msg:
              
@@ -1041,14 +1035,13 @@ class BotHandler:
                  return
 
              # 2. If they are NOT a fully set up vendor, apply the LOCK.
-             lock_setting = SystemSetting.query.get('vendor_lock')
-             is_locked = lock_setting.value == 'true' if lock_setting else False
+             is_locked = settings.get_bool('vendor_lock')
              
              if is_locked:
                  msg = "🚫 Sorry, we are not accepting new Vendors at the moment.\n\nPlease continue enjoying our services as a customer!"
                  self.whatsapp.send_text_message(phone_number, msg)
                  # Re-send customer menu so they aren't stuck
-                 self.send_customer_menu(phone_number)
+                 self.send_customer_menu(phone_number, user)
              else:
                  # UNLOCKED: Start Registration
                  conversation.state = "VENDOR_NAME"
@@ -1067,7 +1060,7 @@ class BotHandler:
         conversation.state = "CUSTOMER_MENU"
         db.session.commit()
         self.whatsapp.send_text_message(phone_number, f"✅ Interests updated! List: {user.interests}")
-        self.send_customer_menu(phone_number)
+        self.send_customer_menu(phone_number, user)
 
     def handle_customer_buy_intent(self, phone_number, promo_id_str, user):
         """Called when user clicks 'Contact Vendor' on an ad"""
@@ -1079,6 +1072,8 @@ class BotHandler:
                 return
 
             vendor = promo.vendor
+            counters.add(Promo, promo.id, clicks=1)
+            counters.add(User, vendor.id, leads_received=1)
             
             # 1. Create a Pending Order Record
             order = Order(
@@ -1127,17 +1122,20 @@ class BotHandler:
                 self.whatsapp.send_text_message(phone_number, "⚠️ Order not found.")
                 return
             
-            if order.status == OrderStatus.CONFIRMED:
+            # Execute Confirmation (conditional UPDATE so a double tap can't count twice)
+            confirmed = Order.query.filter(
+                Order.id == order.id, Order.status != OrderStatus.CONFIRMED
+            ).update({Order.status: OrderStatus.CONFIRMED, Order.confirmed_at: datetime.utcnow()}, synchronize_session=False)
+            if not confirmed:
                 self.whatsapp.send_text_message(phone_number, "✅ This order was already confirmed.")
                 return
-                
-            # Execute Confirmation
-            order.status = OrderStatus.CONFIRMED
             
             # Reward Buyer
             buyer = order.buyer
-            buyer.points += 5000 
+            self.points.award(buyer.id, 5000, "purchase_confirmed")
             buyer.vendors_patronized_month += 1 
+            user_counters.increment(buyer.id, purchases_confirmed=1)
+            user_counters.increment(order.vendor_id, sales_confirmed=1)
             
             db.session.commit()
             
@@ -1229,6 +1227,9 @@ class BotHandler:
             context['media_type'] = media_type
             conversation.context = json.dumps(context)
             db.session.commit()
+
+            # Rehost the upload now so broadcasts and the dashboard reuse it
+            self.media_ingest.enqueue(media_id, media_type)
             
             self.finalize_promo_creation(phone_number, conversation, user)
             
@@ -1245,6 +1246,7 @@ class BotHandler:
             
             conversation.state = "VENDOR_MENU"
             db.session.commit()
+            self.media_ingest.enqueue(media_id, media_type)
             
             self.whatsapp.send_text_message(phone_number, "✅ Document Received! Your account is now Pending Approval.\n\nYou can access the menu, but ad posting is restricted until verified.")
             self.show_vendor_menu(phone_number)
\ No newline at end of file
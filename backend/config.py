@@ -0,0 +1,24 @@
+# backend/config.py
+# Flask/SQLAlchemy settings shared by the web app (app.py) and the release
+# step (init_db.py), which builds a bare app so it never starts workers.
+import os
+
+def database_url() -> str:
+    url = os.getenv('DATABASE_URL', 'sqlite:///easyeasy.db')
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def configure(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+
+    # --- THIS IS THE CRITICAL FIX ---
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        "pool_pre_ping": True,   # Pings DB before every query to ensure connection is alive
+        "pool_recycle": 300,     # Refreshes connection every 5 minutes
+        "pool_size": 10,         # Keeps 10 connections open
+        "max_overflow": 20       # Allows temporary extra connections
+    }
+    # --------------------------------
@@ -0,0 +1,27 @@
+# Loaded automatically by `gunicorn app:app` (see Procfile)
+import os
+import shutil
+
+# Each worker writes its metric samples here; /metrics aggregates them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/easyeasy_prometheus')
+
+def on_starting(server):
+    # Start from an empty directory so samples from a previous run don't leak in
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    # Drop live gauges of the dead worker
+    multiprocess.mark_process_dead(worker.pid)
+
+def worker_exit(server, worker):
+    # Write back in-process buffers (status callbacks, write-behind counters) before the worker goes
+    from services.status_ingest import status_aggregator
+    from services.counter_buffer import counters
+    status_aggregator.flush_at_exit()
+    counters.flush_at_exit()
@@ -1,28 +1,45 @@
 # backend/init_db.py
-from app import app, db
+# Release step (see Procfile): creates missing tables, columns, indexes and the
+# search index once per deploy, so web workers don't manage schema at boot.
+#
+#   python init_db.py            # safe: only adds what is missing
+#   python init_db.py --reset    # drops every table first (DESTROYS DATA)
+#
+# Builds a bare Flask app instead of importing app.py, which would start the
+# background workers.
+import sys
+import argparse
 import logging
+from flask import Flask
+from dotenv import load_dotenv
+from config import configure
+from models import db
+from services.schema import upgrade_schema, reset_schema
 
-# Configure logging
-logging.basicConfig()
-logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
-
-def init_database():
+def init_database(reset: bool = False):
+    load_dotenv()
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
     with app.app_context():
         print("--- Connecting to Database ---")
-        
-        # Option A: SAFE MODE (Only creates missing tables)
-        # db.create_all()
-        # print("--- Tables Created (Safe Mode) ---")
-
-        # Option B: RESET MODE (Deletes everything and rebuilds)
-        # USE THIS if your database is empty or broken from the recent changes
-        print("!!! DROPPING ALL TABLES !!!")
-        db.drop_all()
-        
-        print("--- Creating New Tables ---")
-        db.create_all()
-        
+        if reset:
+            print("!!! DROPPING ALL TABLES !!!")
+            reset_schema()
+        else:
+            upgrade_schema()
         print("--- Database Initialized Successfully ---")
 
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reset', action='store_true', help="drop all tables before creating them")
+    parser.add_argument('--echo', action='store_true', help="log every SQL statement")
+    args = parser.parse_args()
+    if args.echo:
+        logging.basicConfig()
+        logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
+    try:
+        init_database(reset=args.reset)
+    except Exception as e:
+        print(f"❌ Schema update failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,195 @@
+# backend/loadtest/fake_graph.py
+# Local stand-in for the WhatsApp Graph API (and the OpenAI chat endpoint) so
+# the bot can be load tested without touching Meta or spending tokens.
+#
+#   python loadtest/fake_graph.py --port 9999 --latency-ms 80 --jitter-ms 40 --rate-429 0.02
+#   python loadtest/fake_graph.py --port 9999 --media-latency-ms 300     # slow media (bench_concurrency.py)
+#
+# Point the app at it with:
+#   WHATSAPP_GRAPH_URL=http://127.0.0.1:9999/v18.0
+#   OPENAI_BASE_URL=http://127.0.0.1:9999/v1
+#
+# Inspection endpoints used by webhook_load.py:
+#   GET  /_stats            sends per message type / status, 429s injected
+#   GET  /_sent?to=<phone>  messages recorded for one recipient (newest last)
+#   POST /_reset            clear recorded messages and counters
+import json
+import time
+import zlib
+import struct
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def _png(width, height):
+    """Minimal valid RGB PNG, so media ingest exercises the real decode path"""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    rows = b"".join(
+        b"\x00" + bytes(channel for x in range(width) for channel in (x * 4 % 256, y * 4 % 256, 128))
+        for y in range(height)
+    )
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b""))
+
+# Served for every media download
+PIXEL_PNG = _png(64, 64)
+
+class FakeGraphState:
+    def __init__(self, latency_ms, jitter_ms, rate_429, openai_latency_ms, media_latency_ms=0, keep_per_recipient=50):
+        self.latency_ms = latency_ms
+        self.media_latency_ms = media_latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.openai_latency_ms = openai_latency_ms
+        self.keep = keep_per_recipient
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.sent = defaultdict(lambda: deque(maxlen=self.keep))
+            self.counts = Counter()
+            self.next_id = 0
+
+    def delay(self, base_ms):
+        if base_ms or self.jitter_ms:
+            time.sleep(max(0.0, base_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+
+    def record(self, payload):
+        with self.lock:
+            self.next_id += 1
+            kind = payload.get("type", "status" if "status" in payload else "unknown")
+            self.counts[f"sent.{kind}"] += 1
+            to = payload.get("to")
+            if to:
+                self.sent[to].append(payload)
+            return f"wamid.fake.{self.next_id}"
+
+class Handler(BaseHTTPRequestHandler):
+    state: FakeGraphState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if url.path == "/_stats":
+            with self.state.lock:
+                return self._json(200, dict(self.state.counts))
+        if url.path == "/_sent":
+            to = parse_qs(url.query).get("to", [""])[0]
+            with self.state.lock:
+                return self._json(200, {"messages": list(self.state.sent.get(to, []))})
+        if len(parts) == 2 and parts[0] == "_media":
+            self.state.delay(self.state.media_latency_ms)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(PIXEL_PNG)))
+            self.end_headers()
+            self.wfile.write(PIXEL_PNG)
+            return
+        if len(parts) == 2:
+            # GET /<version>/<media_id>: media metadata with a download URL on this server
+            self.state.delay(self.state.media_latency_ms)
+            host = self.headers.get("Host")
+            return self._json(200, {
+                "id": parts[1],
+                "url": f"http://{host}/_media/{parts[1]}",
+                "mime_type": "image/png",
+                "file_size": len(PIXEL_PNG),
+                "sha256": "fake",
+            })
+        self._json(404, {"error": {"message": "unknown path"}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._body()
+        state = self.state
+
+        if url.path == "/_reset":
+            state.reset()
+            return self._json(200, {"ok": True})
+
+        if url.path.endswith("/chat/completions"):
+            state.delay(state.openai_latency_ms)
+            with state.lock:
+                state.counts["openai.chat"] += 1
+            request = json.loads(body or b"{}")
+            wants_json = (request.get("response_format") or {}).get("type") == "json_object"
+            content = json.dumps({"reply": "Here are some great deals for you!", "new_fact": None}) if wants_json \
+                else "🔥 Fresh deal alert! Grab it before it's gone."
+            return self._json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 40, "total_tokens": 160},
+            })
+
+        state.delay(state.latency_ms)
+        if state.rate_429 and random.random() < state.rate_429:
+            with state.lock:
+                state.counts["throttled.429"] += 1
+            return self._json(429, {"error": {"message": "(#130429) Rate limit hit", "code": 130429}})
+
+        if url.path.endswith("/media"):
+            with state.lock:
+                state.next_id += 1
+                state.counts["media.upload"] += 1
+                return self._json(200, {"id": f"upl.fake.{state.next_id}"})
+
+        if url.path.endswith("/messages"):
+            payload = json.loads(body or b"{}")
+            message_id = state.record(payload)
+            return self._json(200, {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+                "messages": [{"id": message_id}],
+            })
+
+        self._json(404, {"error": {"message": "unknown path"}})
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake WhatsApp Graph API / OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency-ms", type=float, default=50, help="mean Graph API latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of sends answered with 429")
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--media-latency-ms", type=float, default=0, help="media lookup and download latency")
+    args = parser.parse_args()
+
+    Handler.state = FakeGraphState(args.latency_ms, args.jitter_ms, args.rate_429, args.openai_latency_ms,
+                                  args.media_latency_ms)
+    # The default listen backlog of 5 drops connections under bursty load and skews latencies
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"Fake Graph API on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}±{args.jitter_ms}ms, 429 rate {args.rate_429:.1%})")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
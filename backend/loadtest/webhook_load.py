@@ -0,0 +1,325 @@
+# backend/loadtest/webhook_load.py
+# Replays realistic multi-step WhatsApp journeys against /webhook and reports
+# throughput, latency percentiles and error rates per journey step.
+#
+#   # 1. fake Graph/OpenAI backend
+#   python loadtest/fake_graph.py --port 9999
+#   # 2. the app, pointed at it, with the per-number inbound rate limit off
+#   WHATSAPP_GRAPH_URL=http://127.0.0.1:9999/v18.0 OPENAI_BASE_URL=http://127.0.0.1:9999/v1 \
+#   WHATSAPP_APP_SECRET=loadtest INBOUND_RATE_BACKEND=off gunicorn app:app -w 4
+#   # 3. traffic
+#   python loadtest/webhook_load.py --target http://127.0.0.1:8000 --graph http://127.0.0.1:9999 \
+#       --app-secret loadtest --rate 5 --duration 60 --mix customer_signup=4,ai_chat=3,vendor_promo=1,buy_confirm=2
+#
+# Journeys start at --rate per second (open model, so a slow server builds a
+# backlog instead of silently lowering the offered load) and each one plays
+# its steps in order with --think-ms between them. Payloads are signed with
+# X-Hub-Signature-256 like Meta does when --app-secret is given.
+#
+# With --think-ms 0 a journey sends its steps back to back (vendor_promo sends
+# 17 messages, ai_chat 12+). Unless the app runs with INBOUND_RATE_BACKEND=off,
+# the inbound limiter (services/rate_limiter.py) sheds the excess while the
+# webhook still answers 200, so later steps silently measure nothing. Keep it
+# off, or pace journeys with --think-ms of at least 60000 / INBOUND_RATE_PER_MINUTE.
+import json
+import hmac
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+COMMUNITY_CODE = "EASY50"
+FIRST_NAMES = ["Ada", "Tunde", "Chioma", "Emeka", "Aisha", "Bola", "Ngozi", "Femi", "Zainab", "Ike"]
+CHAT_LINES = ["I need cheap sneakers", "Any phones under 100k?", "What food deals do you have?",
+              "How do I earn more points?", "Show me fashion items"]
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+class StepStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # step -> [ms]
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, step, ms, status, ok):
+        with self.lock:
+            self.latencies[step].append(ms)
+            self.statuses[step][status] += 1
+            if not ok:
+                self.errors[step] += 1
+
+class LoadRunner:
+    def __init__(self, args):
+        self.target = args.target.rstrip("/")
+        self.graph = args.graph.rstrip("/") if args.graph else None
+        self.secret = args.app_secret.encode() if args.app_secret else None
+        self.think = args.think_ms / 1000.0
+        self.timeout = args.timeout
+        self.stats = StepStats()
+        self.promos = []  # (promo_id, vendor_phone) available to buy_confirm
+        self.local = threading.local()
+        self._phone_seq = random.randint(0, 10 ** 6)
+        self._phone_lock = threading.Lock()
+
+    # --- plumbing -------------------------------------------------------
+
+    def http(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def new_phone(self):
+        with self._phone_lock:
+            self._phone_seq += 1
+            return f"99900{self._phone_seq:07d}"
+
+    def _timed(self, step, fn):
+        started = time.perf_counter()
+        status, ok = "exception", False
+        try:
+            response = fn()
+            status = str(response.status_code)
+            ok = response.status_code < 400
+            return response
+        except requests.RequestException:
+            return None
+        finally:
+            self.stats.record(step, (time.perf_counter() - started) * 1000, status, ok)
+            if self.think:
+                time.sleep(self.think)
+
+    def post_webhook(self, step, phone, message):
+        message = {"from": phone, "id": f"wamid.load.{random.getrandbits(48):x}", "timestamp": str(int(time.time())), **message}
+        payload = {
+            "object": "whatsapp_business_account",
+            "entry": [{"id": "LOADTEST", "changes": [{"field": "messages", "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "000", "phone_number_id": "LOADTEST"},
+                "contacts": [{"profile": {"name": "Load"}, "wa_id": phone}],
+                "messages": [message],
+            }}]}],
+        }
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        return self._timed(step, lambda: self.http().post(f"{self.target}/webhook", data=body, headers=headers, timeout=self.timeout))
+
+    def text(self, step, phone, body):
+        return self.post_webhook(step, phone, {"type": "text", "text": {"body": body}})
+
+    def button(self, step, phone, button_id, title="ok"):
+        return self.post_webhook(step, phone, {"type": "interactive", "interactive": {
+            "type": "button_reply", "button_reply": {"id": button_id, "title": title}}})
+
+    def image(self, step, phone, caption=""):
+        media_id = f"media.load.{random.getrandbits(48):x}"
+        return self.post_webhook(step, phone, {"type": "image", "image": {
+            "id": media_id, "mime_type": "image/png", "sha256": "fake", "caption": caption}})
+
+    def admin(self, step, method, path, **kwargs):
+        return self._timed(step, lambda: self.http().request(method, f"{self.target}{path}", timeout=self.timeout, **kwargs))
+
+    def sent_to(self, phone):
+        if not self.graph:
+            return []
+        return self.http().get(f"{self.graph}/_sent", params={"to": phone}, timeout=self.timeout).json()["messages"]
+
+    # --- journeys ---------------------------------------------------------
+
+    def customer_signup(self, prefix="customer_signup", phone=None):
+        phone = phone or self.new_phone()
+        self.text(f"{prefix}.greet", phone, "hi")
+        self.button(f"{prefix}.choose_customer", phone, "btn_1", "Customer")
+        self.text(f"{prefix}.name", phone, f"{random.choice(FIRST_NAMES)} Load")
+        self.button(f"{prefix}.gender", phone, random.choice(["btn_0", "btn_1"]))
+        self.text(f"{prefix}.interests", phone, ",".join(random.sample([str(i) for i in range(1, 11)], 3)))
+        self.text(f"{prefix}.referral", phone, "No")
+        self.button(f"{prefix}.joined_community", phone, "btn_0", "I have joined")
+        self.text(f"{prefix}.community_code", phone, COMMUNITY_CODE)
+        return phone
+
+    def ai_chat(self):
+        phone = self.customer_signup(prefix="ai_chat.signup")
+        for i in range(3):
+            self.text(f"ai_chat.message_{i + 1}", phone, random.choice(CHAT_LINES))
+        self.text("ai_chat.status", phone, "status")
+
+    def vendor_promo(self, approve=False):
+        phone = self.new_phone()
+        business = f"LoadTest Biz {phone}"
+        self.text("vendor_promo.greet", phone, "hi")
+        self.button("vendor_promo.choose_vendor", phone, "btn_0", "Vendor")
+        self.text("vendor_promo.name", phone, f"{random.choice(FIRST_NAMES)} Vendor")
+        self.text("vendor_promo.business", phone, business)
+        self.text("vendor_promo.description", phone, "We sell affordable sneakers")
+        self.image("vendor_promo.verification_doc", phone)
+
+        users = self.admin("vendor_promo.admin_lookup", "GET", "/api/users", params={"phone": phone})
+        found = users.json().get("users") if users is not None and users.ok else None
+        if not found:
+            return None
+        self.admin("vendor_promo.admin_verify", "POST", f"/api/users/{found[0]['id']}/verify")
+
+        self.text("vendor_promo.start_promo", phone, "1")
+        self.text("vendor_promo.title", phone, "Air Max 90")
+        self.text("vendor_promo.description_promo", phone, "Clean pair, size 42-45")
+        self.text("vendor_promo.category", phone, "2,6")
+        self.button("vendor_promo.target", phone, "btn_0", "All")
+        self.text("vendor_promo.price", phone, "25000")
+        self.text("vendor_promo.contact", phone, phone)
+        self.text("vendor_promo.skip_media", phone, "Skip")
+        self.text("vendor_promo.accept_caption", phone, "yes")
+        self.button("vendor_promo.paid", phone, "btn_0", "Paid Promotion")
+        self.text("vendor_promo.impressions", phone, "1000")
+
+        if approve:
+            promos = self.admin("vendor_promo.admin_find_promo", "GET", "/api/promos",
+                                params={"status": "pending", "per_page": 100})
+            if promos is not None and promos.ok:
+                for promo in promos.json().get("promos", []):
+                    if promo.get("vendor_name") == business:
+                        self.admin("vendor_promo.admin_approve", "POST", f"/api/promos/{promo['id']}/approve")
+                        return promo["id"], phone
+        return None
+
+    def buy_confirm(self):
+        if not self.promos:
+            return
+        promo_id, vendor_phone = random.choice(self.promos)
+        buyer = self.customer_signup(prefix="buy_confirm.signup")
+        self.button("buy_confirm.buy", buyer, f"buy_promo_{promo_id}", "Buy")
+
+        # The vendor confirms with the button the bot just sent them for this buyer
+        order_button = None
+        for payload in reversed(self.sent_to(vendor_phone)):
+            interactive = payload.get("interactive") or {}
+            if buyer in json.dumps(interactive.get("body", {})):
+                buttons = (interactive.get("action") or {}).get("buttons", [])
+                order_button = next((b["reply"]["id"] for b in buttons if b["reply"]["id"].startswith("confirm_order_")), None)
+                break
+        if order_button is None:
+            self.stats.record("buy_confirm.find_order", 0.0, "missing", False)
+            return
+        self.button("buy_confirm.confirm_sale", vendor_phone, order_button, "Confirm Sale")
+
+    # --- driver ---------------------------------------------------------------
+
+    def setup(self, promo_count):
+        """Create approved promos for buy_confirm to purchase"""
+        for _ in range(promo_count):
+            created = self.vendor_promo(approve=True)
+            if created:
+                self.promos.append(created)
+        print(f"setup: {len(self.promos)} approved promos ready")
+
+    def run(self, mix, rate, duration, max_journeys, concurrency):
+        journeys = {
+            "customer_signup": self.customer_signup,
+            "ai_chat": self.ai_chat,
+            "vendor_promo": self.vendor_promo,
+            "buy_confirm": self.buy_confirm,
+        }
+        names = [n for n in mix if mix[n] > 0]
+        weights = [mix[n] for n in names]
+        started = time.perf_counter()
+        launched = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = []
+            while True:
+                elapsed = time.perf_counter() - started
+                if elapsed >= duration or (max_journeys and launched >= max_journeys):
+                    break
+                due = int(elapsed * rate) + 1
+                while launched < due and not (max_journeys and launched >= max_journeys):
+                    futures.append(pool.submit(journeys[random.choices(names, weights)[0]]))
+                    launched += 1
+                time.sleep(min(0.05, 1.0 / rate))
+            for f in futures:
+                exc = f.exception()
+                if exc:
+                    print(f"journey failed: {exc!r}")
+        return launched, time.perf_counter() - started
+
+    def report(self, launched, wall):
+        total = sum(len(v) for v in self.stats.latencies.values())
+        errors = sum(self.stats.errors.values())
+        lines = [f"{launched} journeys, {total} requests in {wall:.1f}s -> {total / wall:.1f} req/s, "
+                 f"error rate {errors / max(total, 1):.2%}", ""]
+        header = f"{'step':42} {'count':>6} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  statuses"
+        lines.append(header)
+        lines.append("-" * len(header))
+        rows = {}
+        for step in sorted(self.stats.latencies):
+            values = sorted(self.stats.latencies[step])
+            row = {
+                "count": len(values),
+                "error_rate": self.stats.errors[step] / len(values),
+                "p50_ms": percentile(values, 50),
+                "p90_ms": percentile(values, 90),
+                "p99_ms": percentile(values, 99),
+                "max_ms": values[-1],
+                "statuses": dict(self.stats.statuses[step]),
+            }
+            rows[step] = row
+            statuses = ",".join(f"{k}:{v}" for k, v in sorted(row["statuses"].items()))
+            lines.append(f"{step:42} {row['count']:>6} {row['error_rate']:>6.1%} {row['p50_ms']:>8.1f} "
+                         f"{row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}  {statuses}")
+        graph_stats = None
+        if self.graph:
+            try:
+                graph_stats = self.http().get(f"{self.graph}/_stats", timeout=self.timeout).json()
+                lines += ["", "fake graph: " + ", ".join(f"{k}={v}" for k, v in sorted(graph_stats.items()))]
+            except requests.RequestException:
+                pass
+        print("\n".join(lines))
+        return {"journeys": launched, "requests": total, "seconds": wall, "throughput_rps": total / wall,
+                "error_rate": errors / max(total, 1), "steps": rows, "graph": graph_stats}
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="WhatsApp webhook load generator")
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="app base URL")
+    parser.add_argument("--graph", default="http://127.0.0.1:9999", help="fake_graph.py base URL ('' to disable)")
+    parser.add_argument("--app-secret", default=None, help="sign payloads like Meta (match WHATSAPP_APP_SECRET)")
+    parser.add_argument("--rate", type=float, default=2.0, help="journeys started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting journeys")
+    parser.add_argument("--journeys", type=int, default=0, help="stop after this many journeys (0 = no cap)")
+    parser.add_argument("--concurrency", type=int, default=50, help="max journeys in flight")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between steps of a journey")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--mix", default="customer_signup=4,ai_chat=3,vendor_promo=1,buy_confirm=2")
+    parser.add_argument("--setup-promos", type=int, default=3, help="approved promos to create for buy_confirm")
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    runner = LoadRunner(args)
+    mix = parse_mix(args.mix)
+    if mix.get("buy_confirm"):
+        runner.setup(args.setup_promos)
+        runner.stats = StepStats()  # report only the measured run
+    launched, wall = runner.run(mix, args.rate, args.duration, args.journeys, args.concurrency)
+    result = runner.report(launched, wall)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
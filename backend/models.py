@@ -4,6 +4,70 @@ from enum import Enum
 
 db = SQLAlchemy()
 
+def upsert_increment(model, keys, increments):
+    """Add `increments` to the row identified by `keys`, creating it if needed.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE so concurrent workers never lose an
+    increment. `keys` must match a unique constraint on the model.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+
+    if insert is not None:
+        table = model.__table__
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys.keys()),
+            set_={col: table.c[col] + stmt.excluded[col] for col in increments}
+        )
+        db.session.execute(stmt)
+        return
+
+    updated = model.query.filter_by(**keys).update(
+        {getattr(model, col): getattr(model, col) + value for col, value in increments.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(model(**keys, **increments))
+
+def upsert_increment_many(model, keys, rows, increments):
+    """Bulk form of upsert_increment: one statement for many key rows.
+
+    `rows` are dicts holding the `keys` columns; each gets `increments` added,
+    or its own value where the row has that column. Any other columns in a
+    row are only written when it is inserted.
+    """
+    if not rows:
+        return
+    values = [{**row, **{c: row.get(c, v) for c, v in increments.items()}} for row in rows]
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in values:
+            updated = model.query.filter_by(**{k: row[k] for k in keys}).update(
+                {getattr(model, col): getattr(model, col) + row[col] for col in increments},
+                synchronize_session=False
+            )
+            if not updated:
+                db.session.add(model(**row))
+        return
+
+    table = model.__table__
+    stmt = insert(table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={col: table.c[col] + stmt.excluded[col] for col in increments}
+    )
+    db.session.execute(stmt)
+
 class UserRole(str, Enum):
     VENDOR = "vendor"
     SUBSCRIBER = "subscriber"
@@ -50,6 +114,13 @@ class User(db.Model):
     community_task_done = db.Column(db.Boolean, default=False)
     last_checkin = db.Column(db.DateTime)
     
+    # --- DENORMALIZED COUNTERS (see services/user_counters.py) ---
+    referral_count = db.Column(db.Integer, default=0, index=True)
+    purchases_confirmed = db.Column(db.Integer, default=0, index=True)  # as buyer
+    sales_confirmed = db.Column(db.Integer, default=0, index=True)  # as vendor
+    # Write-behind (services/counter_buffer.py); may lag by one flush interval
+    leads_received = db.Column(db.Integer, default=0)  # as vendor: "Contact Vendor" taps
+
     # --- WEALTH PLAN TRACKING ---
     vendors_patronized_month = db.Column(db.Integer, default=0)
     last_ai_reward = db.Column(db.DateTime)
@@ -92,6 +163,10 @@ class User(db.Model):
             'verification_doc': self.verification_doc,
             'points': self.points,
             'vendors_patronized_month': self.vendors_patronized_month,
+            'referral_count': self.referral_count or 0,
+            'purchases_confirmed': self.purchases_confirmed or 0,
+            'sales_confirmed': self.sales_confirmed or 0,
+            'leads_received': self.leads_received or 0,
             'ai_memory': self.ai_memory,
             'referral_code': self.referral_code,
             'created_at': self.created_at.isoformat(),
@@ -136,6 +211,11 @@ class Promo(db.Model):
             'category': self.category,
             'target_gender': self.target_gender,
             'vendor_name': self.vendor.business_name if self.vendor else "Unknown",
+            'media_url': self.media_url,
+            'media_type': self.media_type,
+            'media_thumbnail_url': f"/api/media/{self.media_url}/thumbnail" if self.media_url else None,
+            'views': self.views or 0,
+            'clicks': self.clicks or 0,
             'created_at': self.created_at.isoformat()
         }
 
@@ -150,7 +230,7 @@ class Payment(db.Model):
     payment_method = db.Column(db.String(50))
     provider_reference = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime, index=True)
 
     def to_dict(self):
         return {
@@ -171,7 +251,8 @@ class Order(db.Model):
     promo_id = db.Column(db.Integer, db.ForeignKey('promos.id'))
     amount = db.Column(db.Float)
     status = db.Column(db.String(20), default=OrderStatus.PENDING)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    confirmed_at = db.Column(db.DateTime, index=True)
     
     vendor = db.relationship('User', foreign_keys=[vendor_id], backref='sales')
     buyer = db.relationship('User', foreign_keys=[buyer_id], backref='purchases')
@@ -199,6 +280,81 @@ class SystemSetting(db.Model):
     key = db.Column(db.String(50), primary_key=True) # e.g. "vendor_onboarding"
     value = db.Column(db.String(50)) # "true" or "false"
 
+class AIUsage(db.Model):
+    """Daily token rollup per user and feature (caption, chat, welcome)."""
+    __tablename__ = 'ai_usage_daily'
+    __table_args__ = (db.UniqueConstraint('user_id', 'feature', 'day', name='uq_ai_usage_user_feature_day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    feature = db.Column(db.String(20), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    calls = db.Column(db.Integer, default=0)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    completion_tokens = db.Column(db.Integer, default=0)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'feature': self.feature,
+            'day': self.day.isoformat(),
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens
+        }
+
+class PointsLedger(db.Model):
+    """Append-only record of every points award; rolled up into User.points in batches."""
+    __tablename__ = 'points_ledger'
+    __table_args__ = (db.Index('ix_points_ledger_user_batch', 'user_id', 'rollup_batch'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rollup_batch = db.Column(db.String(32), index=True)  # NULL until applied to User.points
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'amount': self.amount,
+            'reason': self.reason,
+            'created_at': self.created_at.isoformat(),
+            'applied': self.rollup_batch is not None
+        }
+
+class MediaAsset(db.Model):
+    """A WhatsApp media upload rehosted in the local media cache at ingestion time."""
+    __tablename__ = 'media_assets'
+    media_id = db.Column(db.String(128), primary_key=True)  # inbound WhatsApp media id
+    media_type = db.Column(db.String(20))
+    status = db.Column(db.String(20), default="pending")  # pending, ready, failed
+    sha256 = db.Column(db.String(64))
+    mime_type = db.Column(db.String(100))
+    size_bytes = db.Column(db.Integer)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    has_thumbnail = db.Column(db.Boolean, default=False)
+    outbound_media_id = db.Column(db.String(128))  # re-uploaded copy used for sending
+    outbound_uploaded_at = db.Column(db.DateTime)
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ingested_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'media_id': self.media_id,
+            'media_type': self.media_type,
+            'status': self.status,
+            'sha256': self.sha256,
+            'mime_type': self.mime_type,
+            'size_bytes': self.size_bytes,
+            'width': self.width,
+            'height': self.height,
+            'thumbnail_url': f"/api/media/{self.media_id}/thumbnail" if self.has_thumbnail else None,
+            'ingested_at': self.ingested_at.isoformat() if self.ingested_at else None
+        }
+
 class Conversation(db.Model):
     __tablename__ = 'conversations'
     id = db.Column(db.Integer, primary_key=True)
@@ -214,6 +370,9 @@ class Broadcast(db.Model):
     total_recipients = db.Column(db.Integer, default=0)
     sent_count = db.Column(db.Integer, default=0)
     failed_count = db.Column(db.Integer, default=0)
+    # From WhatsApp status callbacks (services/status_ingest.py)
+    delivered_count = db.Column(db.Integer, default=0)
+    read_count = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
@@ -224,7 +383,146 @@ class Broadcast(db.Model):
             'id': self.id,
             'status': self.status,
             'sent_count': self.sent_count,
+            'delivered_count': self.delivered_count,
+            'read_count': self.read_count,
             'total_recipients': self.total_recipients,
             'created_at': self.created_at.isoformat()
         }
     
+
+class BroadcastJob(db.Model):
+    """Persistent broadcast queue entry, drained by the single broadcast dispatcher."""
+    __tablename__ = 'broadcast_jobs'
+    __table_args__ = (db.Index('ix_broadcast_jobs_queue', 'status', 'priority', 'spend', 'scheduled_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    promo_id = db.Column(db.Integer, db.ForeignKey('promos.id'), nullable=False, index=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcasts.id'))
+    status = db.Column(db.String(20), default="queued")  # queued, running, done, failed, cancelled
+    priority = db.Column(db.Integer, default=0)  # 1 = paid, 0 = free
+    spend = db.Column(db.Float, default=0.0)
+    scheduled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Allowed send window in local hours [start, end); wraps past midnight when start > end
+    window_start_hour = db.Column(db.Integer, default=8)
+    window_end_hour = db.Column(db.Integer, default=21)
+    # Resume point: subscribers are walked in id order
+    cursor_user_id = db.Column(db.Integer, default=0)
+    recipients = db.Column(db.Integer, default=0)
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    capped_count = db.Column(db.Integer, default=0)  # matched but skipped by frequency caps
+    # Paid reach: deliver exactly this many impressions from a planned recipient list (None = every match)
+    impression_budget = db.Column(db.Integer)
+    planned_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0)  # runs that ended in an error
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    promo = db.relationship('Promo')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'promo_id': self.promo_id,
+            'promo_title': self.promo.title if self.promo else None,
+            'broadcast_id': self.broadcast_id,
+            'status': self.status,
+            'priority': self.priority,
+            'spend': self.spend,
+            'scheduled_at': self.scheduled_at.isoformat() if self.scheduled_at else None,
+            'window_start_hour': self.window_start_hour,
+            'window_end_hour': self.window_end_hour,
+            'recipients': self.recipients,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'capped_count': self.capped_count,
+            'impression_budget': self.impression_budget,
+            'planned_at': self.planned_at.isoformat() if self.planned_at else None,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class BroadcastDelivery(db.Model):
+    """One planned recipient of an impression-budgeted broadcast job."""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'user_id', name='uq_broadcast_delivery_job_user'),
+        db.Index('ix_broadcast_deliveries_pending', 'job_id', 'status', 'score'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('broadcast_jobs.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    score = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default="pending")  # pending, sent, failed, capped, dropped
+    sent_at = db.Column(db.DateTime)
+    user = db.relationship('User')
+
+class BroadcastMessage(db.Model):
+    """Graph message id of a broadcast send, so status callbacks map back to it.
+
+    A digest message covers several broadcasts and has one row per broadcast.
+    """
+    __tablename__ = 'broadcast_messages'
+    wamid = db.Column(db.String(128), primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcasts.id'), primary_key=True)
+    promo_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default="sent")  # sent, delivered, read, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    delivered_at = db.Column(db.DateTime, index=True)
+
+class Lease(db.Model):
+    """Named, expiring ownership record so only one worker runs a singleton task."""
+    __tablename__ = 'leases'
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(64))
+    expires_at = db.Column(db.DateTime)
+
+class SubscriberSendCount(db.Model):
+    """Broadcasts delivered to a subscriber per local day; backs frequency caps."""
+    __tablename__ = 'subscriber_send_counts'
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='uq_subscriber_send_user_day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+# --- DAILY ROLLUPS (services/stats_rollup.py) ---
+# Days are UTC. Counts are only ever incremented by the rollup job.
+
+class PromoDailyStat(db.Model):
+    __tablename__ = 'promo_daily_stats'
+    __table_args__ = (db.UniqueConstraint('promo_id', 'day', name='uq_promo_daily_stat'),)
+    id = db.Column(db.Integer, primary_key=True)
+    promo_id = db.Column(db.Integer, db.ForeignKey('promos.id'), nullable=False)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    sent = db.Column(db.Integer, default=0, nullable=False)
+    delivered = db.Column(db.Integer, default=0, nullable=False)
+    buy_intents = db.Column(db.Integer, default=0, nullable=False)
+    sales_confirmed = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    ad_spend = db.Column(db.Float, default=0.0, nullable=False)
+
+class VendorDailyStat(db.Model):
+    __tablename__ = 'vendor_daily_stats'
+    __table_args__ = (db.UniqueConstraint('vendor_id', 'day', name='uq_vendor_daily_stat'),)
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    sent = db.Column(db.Integer, default=0, nullable=False)
+    delivered = db.Column(db.Integer, default=0, nullable=False)
+    buy_intents = db.Column(db.Integer, default=0, nullable=False)
+    sales_confirmed = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    ad_spend = db.Column(db.Float, default=0.0, nullable=False)
+
+class RollupWatermark(db.Model):
+    """How far the rollup job has consumed one event source (by event timestamp)."""
+    __tablename__ = 'rollup_watermarks'
+    name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,21 @@
+# backend/reconcile_counters.py
+# Repairs drift in the denormalized referral/order counters on users.
+# Safe to run at any time (e.g. nightly cron); only rows that differ are rewritten.
+#
+# Builds a bare Flask app like init_db.py, so no background workers are started.
+from flask import Flask
+from dotenv import load_dotenv
+from config import configure
+from models import db
+from services import user_counters
+
+if __name__ == "__main__":
+    load_dotenv()
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    with app.app_context():
+        print("--- Reconciling user counters ---")
+        repaired = user_counters.reconcile()
+        for column, count in repaired.items():
+            print(f"{column}: {count} users repaired")
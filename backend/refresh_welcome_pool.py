@@ -0,0 +1,22 @@
+# backend/refresh_welcome_pool.py
+# Regenerates the pool of welcome greetings served by services/message_templates.py.
+# Run offline (e.g. weekly); workers pick up the new pool on their next restart.
+import sys
+import json
+from dotenv import load_dotenv
+load_dotenv()
+from services.openai_service import OpenAIService
+from services.message_templates import WELCOME_POOL_PATH
+
+def refresh_pool(count=10):
+    variants = OpenAIService().generate_welcome_variants(count)
+    if not variants:
+        print("--- No variants generated, keeping the existing pool ---")
+        return
+
+    with open(WELCOME_POOL_PATH, 'w', encoding='utf-8') as f:
+        json.dump(variants, f, ensure_ascii=False, indent=2)
+    print(f"--- Wrote {len(variants)} welcome variants to {WELCOME_POOL_PATH} ---")
+
+if __name__ == "__main__":
+    refresh_pool(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,21 @@
+# backend/reindex_search.py
+# Rebuilds the full-text search index (search_documents) from promos, users and
+# support tickets. Normal writes keep it current; run this after bulk imports
+# or raw SQL edits that bypass the ORM.
+#
+# Builds a bare Flask app like init_db.py, so no background workers are started.
+from flask import Flask
+from dotenv import load_dotenv
+from config import configure
+from models import db
+from services.search_index import search_index
+
+if __name__ == "__main__":
+    load_dotenv()
+    app = Flask(__name__)
+    configure(app)
+    db.init_app(app)
+    with app.app_context():
+        print("--- Rebuilding search index ---")
+        search_index.ensure_schema()
+        print(f"{search_index.reindex_all()} documents indexed")
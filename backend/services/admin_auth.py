@@ -0,0 +1,21 @@
+import os
+import hmac
+from functools import wraps
+from flask import request, jsonify
+
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
+
+def require_admin_key(view):
+    """Allow the request only with a matching X-Admin-Key header.
+
+    Fails closed: when ADMIN_API_KEY is not configured the endpoint is disabled.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_API_KEY:
+            return jsonify({"success": False, "error": "ADMIN_API_KEY is not configured"}), 403
+        supplied = request.headers.get('X-Admin-Key', '')
+        if not hmac.compare_digest(supplied.encode(), ADMIN_API_KEY.encode()):
+            return jsonify({"success": False, "error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,52 @@
+import os
+from typing import Optional
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from config import database_url
+
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 10))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv('ASYNC_DB_MAX_OVERFLOW', 20))
+
+# Sync driver URL prefix -> asyncio driver
+_ASYNC_DRIVERS = {
+    'postgresql://': 'postgresql+asyncpg://',
+    'postgresql+psycopg2://': 'postgresql+asyncpg://',
+    'sqlite://': 'sqlite+aiosqlite://',
+}
+
+def async_database_url(url: Optional[str] = None) -> str:
+    """DATABASE_URL rewritten for an asyncio driver (asyncpg / aiosqlite)"""
+    url = url or database_url()
+    for prefix, replacement in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return replacement + url[len(prefix):]
+    return url
+
+class AsyncDatabase:
+    """Async engine and session factory for the ASGI routes (asgi.py).
+
+    Uses the same tables and models as Flask-SQLAlchemy, but a separate pool,
+    so async handlers never block the event loop on a DB round trip. Created
+    in the ASGI lifespan, disposed on shutdown.
+    """
+
+    def __init__(self):
+        self.engine: Optional[AsyncEngine] = None
+        self.session: Optional[async_sessionmaker] = None
+
+    def start(self, url: Optional[str] = None):
+        self.engine = create_async_engine(
+            async_database_url(url),
+            pool_pre_ping=True,
+            pool_recycle=300,
+            pool_size=ASYNC_DB_POOL_SIZE,
+            max_overflow=ASYNC_DB_MAX_OVERFLOW,
+        )
+        # expire_on_commit=False: rows stay readable (to_dict) after the session closes
+        self.session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def stop(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+async_db = AsyncDatabase()
@@ -0,0 +1,52 @@
+import os
+from typing import Any, AsyncIterator, Dict
+import httpx
+from services.media_cache import CHUNK_SIZE
+
+GRAPH_TIMEOUT = float(os.getenv('GRAPH_TIMEOUT_SECONDS', 30))
+GRAPH_MAX_CONNECTIONS = int(os.getenv('GRAPH_MAX_CONNECTIONS', 500))  # per worker
+GRAPH_MAX_KEEPALIVE = int(os.getenv('GRAPH_MAX_KEEPALIVE', 20))
+
+class AsyncWhatsAppService:
+    """Graph API media calls on httpx's async client, for the ASGI routes.
+
+    Mirrors the media half of WhatsAppService (same env settings and
+    result dicts) so an in-flight download holds a socket, not a thread.
+    One pooled client per process; close() it on shutdown.
+    """
+
+    def __init__(self):
+        self.api_token = os.getenv('WHATSAPP_API_TOKEN')
+        self.graph_url = os.getenv('WHATSAPP_GRAPH_URL', "https://graph.facebook.com/v18.0").rstrip('/')
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            timeout=GRAPH_TIMEOUT,
+            limits=httpx.Limits(max_connections=GRAPH_MAX_CONNECTIONS, max_keepalive_connections=GRAPH_MAX_KEEPALIVE),
+        )
+
+    async def get_media_info(self, media_id: str) -> Dict[str, Any]:
+        """Resolve a media id to its temporary download URL and metadata"""
+        try:
+            response = await self.client.get(f"{self.graph_url}/{media_id}")
+            if response.status_code == 400:
+                return {"success": False, "status_code": 400, "error": "Media ID invalid or expired"}
+            response.raise_for_status()
+            return {"success": True, "data": response.json()}
+        except Exception as e:
+            print(f"Error fetching media info: {e}")
+            return {"success": False, "status_code": 500, "error": str(e)}
+
+    async def open_media_stream(self, media_url: str) -> httpx.Response:
+        """Start downloading a media binary; the caller iterates and aclose()s the response"""
+        response = await self.client.send(self.client.build_request("GET", media_url), stream=True)
+        if response.is_error:
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    @staticmethod
+    def iter_media(response: httpx.Response) -> AsyncIterator[bytes]:
+        return response.aiter_bytes(CHUNK_SIZE)
+
+    async def close(self):
+        await self.client.aclose()
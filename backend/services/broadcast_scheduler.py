@@ -0,0 +1,554 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from models import db, User, Broadcast, BroadcastJob, BroadcastDelivery, BroadcastMessage, PromoStatus
+from services.whatsapp_service import WhatsAppService
+from services import leases
+from services import metrics
+from services.frequency_cap import FrequencyCap
+from services.delivery_planner import DeliveryPlanner, promo_categories
+from services.message_templates import templates, DIGEST_MAX_ITEMS
+from services.status_ingest import STATUS_RETRY_FLUSHES, STATUS_FLUSH_INTERVAL
+
+# Global Graph API budget for broadcast sends, shared by all broadcasts
+BROADCAST_RATE_PER_SEC = float(os.getenv('BROADCAST_RATE_PER_SEC', 20))
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', 200))
+BROADCAST_POLL_INTERVAL = int(os.getenv('BROADCAST_POLL_INTERVAL', 10))  # seconds
+BROADCAST_LEASE_TTL = int(os.getenv('BROADCAST_LEASE_TTL', 60))  # seconds
+# A job whose run raises is requeued, and failed once this many runs have raised
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', 3))
+# Commit progress (and sent message ids, which status callbacks look up) at least this often within a chunk
+BROADCAST_CHECKPOINT_SECONDS = float(os.getenv('BROADCAST_CHECKPOINT_SECONDS', 5))
+# Send windows are in local hours; WAT is UTC+1
+BROADCAST_UTC_OFFSET_HOURS = int(os.getenv('BROADCAST_UTC_OFFSET_HOURS', 1))
+DEFAULT_WINDOW = (int(os.getenv('BROADCAST_WINDOW_START', 8)), int(os.getenv('BROADCAST_WINDOW_END', 21)))
+LEASE_NAME = 'broadcast-dispatcher'
+# Free promos due together go out as one list message per subscriber
+BROADCAST_DIGEST = os.getenv('BROADCAST_DIGEST', '1') == '1'
+# Hold free promos to the next slot of this many minutes so more of them share a digest (0 = no hold)
+BROADCAST_DIGEST_WINDOW_MINUTES = int(os.getenv('BROADCAST_DIGEST_WINDOW_MINUTES', 0))
+
+def build_broadcast_message(promo) -> str:
+    message = promo.ai_generated_caption
+    message += "\n\n---------------------------------------------------------------\n"
+    if promo.price > 0:
+        message += "💰 Price: ₦{:,.2f}".format(promo.price)
+    else:
+        message += "💰 Price: Negotiable"
+    message += "\n📞 Contact: {}".format(promo.contact_info)
+    message += "\n---------------------------------------------------------------"
+    return message
+
+def matches_audience(subscriber, promo_cats, target_gender) -> bool:
+    if subscriber.current_mode == 'vendor':
+        return False
+    if target_gender != 'All' and subscriber.gender:
+        if subscriber.gender != 'All' and subscriber.gender != target_gender:
+            return False
+    if "general" in promo_cats:
+        return True
+    user_interests = (subscriber.interests or "").lower()
+    return any(cat in user_interests for cat in promo_cats)
+
+def in_window(start_hour: int, end_hour: int, now: Optional[datetime] = None) -> bool:
+    """Whether local time falls in [start_hour, end_hour), wrapping past midnight"""
+    hour = ((now or datetime.utcnow()) + timedelta(hours=BROADCAST_UTC_OFFSET_HOURS)).hour
+    if start_hour == end_hour:
+        return True
+    if start_hour < end_hour:
+        return start_hour <= hour < end_hour
+    return hour >= start_hour or hour < end_hour
+
+def digest_slot(when: datetime) -> datetime:
+    """Round `when` up to the next digest slot boundary"""
+    if not BROADCAST_DIGEST or BROADCAST_DIGEST_WINDOW_MINUTES <= 0:
+        return when
+    slot = BROADCAST_DIGEST_WINDOW_MINUTES * 60
+    epoch = datetime(1970, 1, 1)
+    seconds = (when - epoch).total_seconds()
+    return epoch + timedelta(seconds=-(-seconds // slot) * slot)
+
+def is_digestible(job: BroadcastJob) -> bool:
+    return job.priority == 0 and not job.impression_budget
+
+class BroadcastScheduler:
+    """Persistent priority queue of broadcasts drained by one dispatcher.
+
+    Every worker runs a dispatcher thread, but only the holder of the
+    `broadcast-dispatcher` lease sends. Jobs run one at a time, paid before
+    free and higher spend first, only inside their send window, and every
+    send is paced against BROADCAST_RATE_PER_SEC. Progress is checkpointed
+    per chunk of subscribers, so a paused or interrupted job resumes where it
+    stopped. Subscribers at their frequency cap are skipped and counted in
+    `capped_count`.
+
+    Paid jobs with an impression budget send to a recipient list chosen by
+    DeliveryPlanner instead of walking every subscriber, and stop once the
+    budget is delivered.
+
+    Free jobs that are due at the same time are sent as a digest: one walk
+    of the subscriber list, and each subscriber gets a single list message
+    covering every promo they match, instead of one message per promo.
+    """
+
+    def __init__(self, media_ingest, rate_per_sec: float = BROADCAST_RATE_PER_SEC):
+        self.whatsapp = WhatsAppService()
+        self.media_ingest = media_ingest
+        self.frequency_cap = FrequencyCap()
+        self.planner = DeliveryPlanner(self.frequency_cap)
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self.owner = leases.make_owner_id()
+        self._next_send_at = 0.0
+        self._held = False
+        self._lease_renewed_at = 0.0  # monotonic
+        # Short enough to keep the lease, and to store message ids well before
+        # status_ingest stops retrying callbacks it couldn't match yet
+        self.checkpoint_interval = min(BROADCAST_CHECKPOINT_SECONDS, BROADCAST_LEASE_TTL / 3.0,
+                                       STATUS_RETRY_FLUSHES * STATUS_FLUSH_INTERVAL / 2.0)
+        # Graph message ids sent since the last checkpoint, for status callbacks
+        self._sent_messages = []
+
+    # --- queue -----------------------------------------------------------
+
+    def enqueue(self, promo, scheduled_at: Optional[datetime] = None,
+                window_start_hour: Optional[int] = None, window_end_hour: Optional[int] = None) -> BroadcastJob:
+        scheduled_at = scheduled_at or datetime.utcnow()
+        job = BroadcastJob(
+            promo_id=promo.id,
+            priority=1 if promo.promo_type == 'paid' else 0,
+            impression_budget=promo.target_impressions if promo.promo_type == 'paid' and promo.target_impressions else None,
+            spend=promo.total_price or 0.0,
+            scheduled_at=digest_slot(scheduled_at) if promo.promo_type != 'paid' else scheduled_at,
+            window_start_hour=DEFAULT_WINDOW[0] if window_start_hour is None else window_start_hour,
+            window_end_hour=DEFAULT_WINDOW[1] if window_end_hour is None else window_end_hour,
+            status="queued",
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def queue_order():
+        return (BroadcastJob.priority.desc(), BroadcastJob.spend.desc(),
+                BroadcastJob.scheduled_at.asc(), BroadcastJob.id.asc())
+
+    def next_job(self, now: Optional[datetime] = None) -> Optional[BroadcastJob]:
+        """Highest-priority due job whose send window is open"""
+        now = now or datetime.utcnow()
+        due = BroadcastJob.query.filter(
+            BroadcastJob.status == "queued", BroadcastJob.scheduled_at <= now
+        ).order_by(*self.queue_order()).limit(50).all()
+        for job in due:
+            if in_window(job.window_start_hour, job.window_end_hour, now):
+                return job
+        return None
+
+    # --- dispatcher ----------------------------------------------------------
+
+    def start(self, app, poll_interval: int = BROADCAST_POLL_INTERVAL):
+        def run():
+            while True:
+                ran = False
+                with app.app_context():
+                    try:
+                        ran = self.dispatch_once()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Broadcast dispatcher error: {e}")
+                if not ran:
+                    time.sleep(poll_interval)
+
+        thread = threading.Thread(target=run, name="broadcast-dispatcher", daemon=True)
+        thread.start()
+        return thread
+
+    def dispatch_once(self) -> bool:
+        """Run the next eligible job if this worker holds the lease. Returns True if a job ran."""
+        if not self._renew_lease():
+            return False
+        if not self._held:
+            # Newly acquired: jobs left 'running' by a previous holder resume from their cursor
+            BroadcastJob.query.filter_by(status="running").update({BroadcastJob.status: "queued"}, synchronize_session=False)
+            db.session.commit()
+            self._held = True
+
+        job = self.next_job()
+        if job is None:
+            return False
+        group = self.digest_group(job) if BROADCAST_DIGEST and is_digestible(job) else [job]
+        try:
+            if len(group) > 1:
+                self.run_digest(group)
+            else:
+                self.run_job(job)
+        except Exception as e:
+            db.session.rollback()
+            self._sent_messages = []
+            print(f"Broadcast run error: {e}")
+            self._requeue(group, e)
+        return True
+
+    def _requeue(self, jobs, error):
+        """Put jobs a failed run left 'running' back in the queue, or fail them after BROADCAST_MAX_ATTEMPTS"""
+        try:
+            for job in jobs:
+                if job.status != "running":
+                    continue
+                job.attempts = (job.attempts or 0) + 1
+                job.error = str(error)[:255]
+                if job.attempts < BROADCAST_MAX_ATTEMPTS:
+                    job.status = "queued"
+                    continue
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                broadcast = db.session.get(Broadcast, job.broadcast_id) if job.broadcast_id else None
+                if broadcast:
+                    broadcast.status = 'failed'
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # Requeue on the next dispatch, as after a lease handover
+            self._held = False
+            print(f"Broadcast requeue error: {e}")
+
+    def digest_group(self, job: BroadcastJob, now: Optional[datetime] = None):
+        """`job` plus other due free jobs whose window is open, up to one list message worth"""
+        now = now or datetime.utcnow()
+        due = BroadcastJob.query.filter(
+            BroadcastJob.status == "queued", BroadcastJob.scheduled_at <= now,
+            BroadcastJob.priority == 0, BroadcastJob.impression_budget.is_(None),
+            BroadcastJob.id != job.id
+        ).order_by(*self.queue_order()).limit(DIGEST_MAX_ITEMS * 5).all()
+        group = [job]
+        for other in due:
+            if len(group) >= DIGEST_MAX_ITEMS:
+                break
+            if in_window(other.window_start_hour, other.window_end_hour, now):
+                group.append(other)
+        return group
+
+    @staticmethod
+    def subscriber_chunk(after_id: int):
+        """Next BROADCAST_CHUNK_SIZE active subscribers after `after_id`, in id order"""
+        return User.query.filter(
+            User.is_subscriber == True, User.is_active == True, User.id > after_id
+        ).order_by(User.id).limit(BROADCAST_CHUNK_SIZE).all()
+
+    def _pace(self):
+        now = time.monotonic()
+        if self._next_send_at > now:
+            time.sleep(self._next_send_at - now)
+        self._next_send_at = max(now, self._next_send_at) + self.interval
+
+    def _send(self, promo, phone, message, media_ref):
+        if media_ref and promo.media_type == 'image':
+            return self.whatsapp.send_image_message(phone, media_ref, message)
+        if media_ref and promo.media_type == 'video':
+            return self.whatsapp.send_video_message(phone, media_ref, message)
+        return self.whatsapp.send_text_message(phone, message)
+
+    def _start(self, job: BroadcastJob) -> bool:
+        """Mark the job running with a Broadcast record. False if its promo can't be sent."""
+        promo = job.promo
+        if promo is None or promo.status not in (PromoStatus.APPROVED, PromoStatus.BROADCASTED):
+            job.status = "failed"
+            job.error = "Promo missing or not approved"
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return False
+
+        if job.impression_budget and job.planned_at is None:
+            # Plan alongside every other due paid job so they share out the audience
+            self.planner.plan_due()
+
+        job.status = "running"
+        job.started_at = job.started_at or datetime.utcnow()
+        if job.broadcast_id is None:
+            broadcast = Broadcast(promo_id=promo.id, total_recipients=0, status='in_progress')
+            db.session.add(broadcast)
+            db.session.flush()
+            job.broadcast_id = broadcast.id
+        db.session.commit()
+        return True
+
+    def run_job(self, job: BroadcastJob):
+        if not self._start(job):
+            return
+        promo = job.promo
+        message = build_broadcast_message(promo)
+        # Resolve the stored asset once instead of per recipient
+        media_ref = self.media_ingest.outbound_media_ref(promo.media_url)
+
+        metrics.BROADCASTS_IN_PROGRESS.inc()
+        try:
+            if job.impression_budget:
+                finished = self._send_planned(job, promo, message, media_ref)
+            else:
+                finished = self._send_chunks(job, promo, message, media_ref, promo_categories(promo))
+        finally:
+            metrics.BROADCASTS_IN_PROGRESS.dec()
+        if finished:
+            self._complete(job, promo)
+
+    def run_digest(self, jobs):
+        jobs = [job for job in jobs if self._start(job)]
+        if not jobs:
+            return
+        items = {job.id: (build_broadcast_message(job.promo),
+                          self.media_ingest.outbound_media_ref(job.promo.media_url),
+                          promo_categories(job.promo)) for job in jobs}
+
+        metrics.BROADCASTS_IN_PROGRESS.inc(len(jobs))
+        try:
+            while jobs:
+                jobs = [job for job in jobs if self._in_window(job)]
+                if not jobs or not self._renew_lease():
+                    return
+
+                chunk = self.subscriber_chunk(min(job.cursor_user_id for job in jobs))
+                if not chunk:
+                    break
+
+                # Audience x promo join for the whole chunk in memory
+                matches = {}
+                for subscriber in chunk:
+                    matched = [job for job in jobs if subscriber.id > job.cursor_user_id
+                               and matches_audience(subscriber, items[job.id][2], job.promo.target_gender)]
+                    if matched:
+                        matches[subscriber] = matched
+                capped = self.frequency_cap.capped_ids([s.id for s in matches])
+                metrics.BROADCAST_REMAINING.inc(len(matches))
+
+                delivered = []
+                for i, (subscriber, matched) in enumerate(matches.items()):
+                    if self._checkpoint_due():
+                        # Save progress so far, renew before sending more
+                        self._checkpoint_digest(jobs, delivered)
+                        delivered = []
+                        if not self._renew_lease():
+                            metrics.BROADCAST_REMAINING.dec(len(matches) - i)
+                            return
+                    metrics.BROADCAST_REMAINING.dec()
+                    if subscriber.id in capped:
+                        for job in matched:
+                            job.capped_count += 1
+                    elif len(matched) == 1:
+                        job = matched[0]
+                        message, media_ref, _ = items[job.id]
+                        if self._deliver(job, job.promo, subscriber, message, media_ref):
+                            delivered.append(subscriber.id)
+                    elif self._deliver_digest(matched, subscriber):
+                        delivered.append(subscriber.id)
+                    for job in matched:
+                        job.cursor_user_id = subscriber.id
+
+                for job in jobs:
+                    job.cursor_user_id = max(job.cursor_user_id, chunk[-1].id)
+                self._checkpoint_digest(jobs, delivered)
+        finally:
+            metrics.BROADCASTS_IN_PROGRESS.dec(len(items))
+
+        for job in jobs:
+            self._complete(job, job.promo)
+
+    def _in_window(self, job) -> bool:
+        if in_window(job.window_start_hour, job.window_end_hour):
+            return True
+        job.status = "queued"
+        db.session.commit()
+        print(f"Broadcast job {job.id} paused at user {job.cursor_user_id}: outside send window")
+        return False
+
+    def _renew_lease(self) -> bool:
+        if leases.acquire(LEASE_NAME, self.owner, BROADCAST_LEASE_TTL):
+            self._lease_renewed_at = time.monotonic()
+            return True
+        self._held = False
+        return False
+
+    def _checkpoint_due(self) -> bool:
+        """checkpoint_interval has passed since the lease was last renewed"""
+        return time.monotonic() - self._lease_renewed_at >= self.checkpoint_interval
+
+    def _may_continue(self, job) -> bool:
+        """Re-check the send window and renew the lease before each chunk.
+
+        Within a chunk progress is checkpointed and the lease renewed whenever
+        _checkpoint_due(), so a slow chunk never outlives BROADCAST_LEASE_TTL.
+        """
+        return self._in_window(job) and self._renew_lease()
+
+    def _deliver_digest(self, jobs, subscriber) -> bool:
+        """One list message covering several promos; counts toward each job"""
+        for job in jobs:
+            job.recipients += 1
+        self._pace()
+        try:
+            result = self.whatsapp.send_interactive_message(subscriber.phone_number, templates.promo_digest([job.promo for job in jobs]))
+            ok = bool(result and result.get('success'))
+        except Exception as e:
+            print(f"Error sending digest to {subscriber.phone_number}: {e}")
+            ok = False
+        if ok:
+            self._track(result, subscriber.id, jobs)
+        for job in jobs:
+            if ok:
+                job.sent_count += 1
+            else:
+                job.failed_count += 1
+        metrics.BROADCAST_MESSAGES.labels('sent' if ok else 'failed').inc()
+        return ok
+
+    def _deliver(self, job, promo, subscriber, message, media_ref) -> bool:
+        job.recipients += 1
+        self._pace()
+        try:
+            result = self._send(promo, subscriber.phone_number, message, media_ref)
+            ok = bool(result and result.get('success'))
+        except Exception as e:
+            print(f"Error sending to {subscriber.phone_number}: {e}")
+            ok = False
+        if ok:
+            self._track(result, subscriber.id, [job])
+            job.sent_count += 1
+            metrics.BROADCAST_MESSAGES.labels('sent').inc()
+        else:
+            job.failed_count += 1
+            metrics.BROADCAST_MESSAGES.labels('failed').inc()
+        return ok
+
+    def _track(self, result, user_id, jobs):
+        messages = (result.get('data') or {}).get('messages') or []
+        wamid = messages[0].get('id') if messages else None
+        if wamid:
+            self._sent_messages.extend({'wamid': wamid, 'broadcast_id': job.broadcast_id, 'promo_id': job.promo_id,
+                                        'user_id': user_id, 'status': 'sent', 'created_at': datetime.utcnow()} for job in jobs)
+
+    def _store_messages(self):
+        if self._sent_messages:
+            db.session.execute(BroadcastMessage.__table__.insert(), self._sent_messages)
+            self._sent_messages = []
+
+    def _sync_broadcast(self, job):
+        broadcast = db.session.get(Broadcast, job.broadcast_id)
+        broadcast.total_recipients = job.recipients
+        broadcast.sent_count = job.sent_count
+        broadcast.failed_count = job.failed_count
+
+    def _checkpoint_digest(self, jobs, delivered):
+        for job in jobs:
+            self._sync_broadcast(job)
+        if delivered:
+            self.frequency_cap.record_sends(delivered)
+        self._store_messages()
+        db.session.commit()
+
+    def _checkpoint(self, job, delivered):
+        # Cap counters commit with the job progress
+        if delivered:
+            self.frequency_cap.record_sends(delivered)
+        self._store_messages()
+        self._sync_broadcast(job)
+        db.session.commit()
+
+    def _send_chunks(self, job, promo, message, media_ref, promo_cats) -> bool:
+        """Walk subscribers in id order from the job cursor. False if paused or the lease was lost."""
+        while True:
+            if not self._may_continue(job):
+                return False
+
+            chunk = self.subscriber_chunk(job.cursor_user_id)
+            if not chunk:
+                return True
+
+            metrics.BROADCAST_REMAINING.inc(len(chunk))
+            audience = [s for s in chunk if matches_audience(s, promo_cats, promo.target_gender)]
+            metrics.BROADCAST_REMAINING.dec(len(chunk) - len(audience))
+            # One grouped lookup for the whole chunk
+            capped = self.frequency_cap.capped_ids([s.id for s in audience])
+            delivered = []
+            for i, subscriber in enumerate(audience):
+                if self._checkpoint_due():
+                    # Save progress so far, renew before sending more
+                    self._checkpoint(job, delivered)
+                    delivered = []
+                    if not self._renew_lease():
+                        metrics.BROADCAST_REMAINING.dec(len(audience) - i)
+                        return False
+                metrics.BROADCAST_REMAINING.dec()
+                if subscriber.id in capped:
+                    job.capped_count += 1
+                elif self._deliver(job, promo, subscriber, message, media_ref):
+                    delivered.append(subscriber.id)
+                job.cursor_user_id = subscriber.id
+
+            job.cursor_user_id = chunk[-1].id
+            self._checkpoint(job, delivered)
+
+    def _send_planned(self, job, promo, message, media_ref) -> bool:
+        """Send the job's planned deliveries, best score first, until the budget is met.
+
+        Failed, capped or lapsed recipients are replaced by topping up the plan,
+        so the job ends on exactly `impression_budget` sends or an exhausted audience.
+        """
+        while True:
+            if not self._may_continue(job):
+                return False
+            needed = job.impression_budget - job.sent_count
+            if needed <= 0:
+                return True
+
+            rows = BroadcastDelivery.query.options(db.joinedload(BroadcastDelivery.user)).filter(
+                BroadcastDelivery.job_id == job.id, BroadcastDelivery.status == "pending"
+            ).order_by(BroadcastDelivery.score.desc(), BroadcastDelivery.id).limit(min(needed, BROADCAST_CHUNK_SIZE)).all()
+            if not rows:
+                if self.planner.top_up(job, needed) == 0:
+                    return True
+                continue
+
+            metrics.BROADCAST_REMAINING.inc(len(rows))
+            capped = self.frequency_cap.capped_ids([row.user_id for row in rows])
+            delivered = []
+            for i, row in enumerate(rows):
+                if self._checkpoint_due():
+                    # Save progress so far, renew before sending more
+                    self._checkpoint(job, delivered)
+                    delivered = []
+                    if not self._renew_lease():
+                        metrics.BROADCAST_REMAINING.dec(len(rows) - i)
+                        return False
+                metrics.BROADCAST_REMAINING.dec()
+                if not (row.user.is_subscriber and row.user.is_active):
+                    row.status = "dropped"
+                    continue
+                if row.user_id in capped:
+                    row.status = "capped"
+                    job.capped_count += 1
+                    continue
+                ok = self._deliver(job, promo, row.user, message, media_ref)
+                row.status = "sent" if ok else "failed"
+                row.sent_at = datetime.utcnow()
+                if ok:
+                    delivered.append(row.user_id)
+
+            self._checkpoint(job, delivered)
+
+    def _complete(self, job, promo):
+        now = datetime.utcnow()
+        broadcast = db.session.get(Broadcast, job.broadcast_id)
+        broadcast.status = 'completed'
+        broadcast.completed_at = now
+        promo.status = PromoStatus.BROADCASTED
+        promo.broadcasted_at = now
+        job.status = "done"
+        job.finished_at = now
+        db.session.commit()
+
+        if job.impression_budget:
+            summary = "📊 Delivered {:,} of {:,} paid impressions.".format(job.sent_count, job.impression_budget)
+        else:
+            summary = "📊 Sent to {} active customers.".format(job.sent_count)
+        self.whatsapp.send_text_message(promo.vendor.phone_number, "🎉 Your promotion has been broadcasted!\n\n" + summary)
+        self.frequency_cap.prune()
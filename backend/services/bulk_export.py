@@ -0,0 +1,89 @@
+import io
+import os
+import csv
+import json
+import zlib
+from datetime import datetime, date
+from enum import Enum
+from typing import Dict, Iterator, Optional
+from sqlalchemy import select
+from models import User, Payment, Order, Broadcast
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 2000))
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# entity -> (model, exported columns); rows are read straight from the table, never as ORM objects
+EXPORTS = {
+    'users': (User, ('id', 'phone_number', 'name', 'is_vendor', 'is_subscriber', 'verification_status',
+                     'points', 'referral_code', 'referral_count', 'purchases_confirmed', 'sales_confirmed',
+                     'leads_received', 'gender', 'interests', 'business_name', 'business_category',
+                     'is_active', 'created_at')),
+    'payments': (Payment, ('id', 'user_id', 'promo_id', 'amount', 'reference', 'status', 'payment_method',
+                           'provider_reference', 'created_at', 'completed_at')),
+    'orders': (Order, ('id', 'buyer_id', 'vendor_id', 'promo_id', 'amount', 'status', 'created_at', 'confirmed_at')),
+    'broadcasts': (Broadcast, ('id', 'promo_id', 'status', 'total_recipients', 'sent_count', 'failed_count',
+                               'delivered_count', 'read_count', 'created_at', 'completed_at')),
+}
+
+def export_query(entity: str, filters: Dict[str, Optional[str]]):
+    """SELECT for one export, with the same filters as the entity's list endpoint"""
+    model, columns = EXPORTS[entity]
+    table = model.__table__
+    query = select(*[table.c[name] for name in columns])
+    if entity == 'users':
+        if filters.get('phone'):
+            query = query.where(table.c.phone_number == filters['phone'])
+        if filters.get('role') == 'vendor':
+            query = query.where(table.c.is_vendor.is_(True))
+        elif filters.get('role') == 'subscriber':
+            query = query.where(table.c.is_subscriber.is_(True))
+    elif entity == 'orders' and filters.get('status'):
+        query = query.where(table.c.status == filters['status'])
+    # Primary-key order: an index walk the database can stream without sorting
+    return query.order_by(table.c.id)
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _encode_csv(columns, rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([[_value(v) for v in row] for row in rows])
+    return buffer.getvalue()
+
+def _encode_ndjson(columns, rows) -> str:
+    return "".join(json.dumps({c: _value(v) for c, v in zip(columns, row)}, default=str) + "\n" for row in rows)
+
+def stream_export(engine, entity: str, fmt: str, filters: Dict[str, Optional[str]],
+                  gzip: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield the export as encoded chunks of `chunk_rows` rows.
+
+    Uses its own connection with a server-side cursor (stream_results), so
+    only one chunk is ever in memory whatever the table size, and it does
+    not depend on the request's app context once the response is streaming.
+    """
+    columns = EXPORTS[entity][1]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits 31 = gzip container
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_rows) \
+            .execute(export_query(entity, filters))
+        header = _encode_csv(columns, [], header=True) if fmt == 'csv' else ''
+        for rows in result.partitions():
+            chunk = (header + (_encode_csv(columns, rows, header=False) if fmt == 'csv'
+                               else _encode_ndjson(columns, rows))).encode()
+            header = ''
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    tail = header.encode()  # an empty CSV export is just the header
+    if compressor:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
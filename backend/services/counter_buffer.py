@@ -0,0 +1,134 @@
+import os
+import atexit
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Tuple
+from sqlalchemy import bindparam, func
+from models import db, Promo, Broadcast, User
+
+COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', 5))  # seconds
+# Flush early once this many distinct rows are buffered
+COUNTER_FLUSH_MAX = int(os.getenv('COUNTER_FLUSH_MAX', 5000))
+COUNTER_SHARDS = 16
+
+# Columns that may be incremented through the buffer
+BUFFERED_COLUMNS = {
+    Promo: ('views', 'clicks'),
+    Broadcast: ('delivered_count', 'read_count'),
+    User: ('leads_received',),
+}
+
+class _Shard:
+    __slots__ = ('lock', 'deltas')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas: Dict[Tuple[type, int], Counter] = defaultdict(Counter)
+
+class CounterBuffer:
+    """Write-behind increments for hot counter columns.
+
+    add() only touches an in-process dict, spread over shards so concurrent
+    handlers rarely wait on the same lock. flush() merges the shards and
+    writes one executemany UPDATE per model (`col = col + :delta`), in id
+    order so concurrent workers lock rows in the same order. Counts lag the
+    events by at most one flush interval and are flushed when the worker
+    exits. Unlike services/user_counters.py, these commit separately from the
+    event, so use it only for counts that may be approximate.
+    """
+
+    def __init__(self, shards: int = COUNTER_SHARDS):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._size = 0  # approximate row count, only used to trigger an early flush
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._app = None
+
+    def add(self, model, row_id: int, **deltas):
+        columns = BUFFERED_COLUMNS.get(model, ())
+        for column in deltas:
+            if column not in columns:
+                raise ValueError(f"Unbuffered counter: {model.__name__}.{column}")
+        shard = self._shards[hash((model, row_id)) % len(self._shards)]
+        with shard.lock:
+            counts = shard.deltas[(model, row_id)]
+            if not counts:
+                self._size += 1
+            counts.update(deltas)
+        if self._size >= COUNTER_FLUSH_MAX:
+            self._wake.set()
+
+    def pending(self, model, row_id: int) -> Counter:
+        """Increments for one row not yet written"""
+        shard = self._shards[hash((model, row_id)) % len(self._shards)]
+        with shard.lock:
+            return Counter(shard.deltas.get((model, row_id), {}))
+
+    def _drain(self) -> Dict[type, Dict[int, Counter]]:
+        merged: Dict[type, Dict[int, Counter]] = defaultdict(dict)
+        for shard in self._shards:
+            with shard.lock:
+                deltas, shard.deltas = shard.deltas, defaultdict(Counter)
+            for (model, row_id), counts in deltas.items():
+                merged[model][row_id] = counts
+        self._size = 0
+        return merged
+
+    def flush(self) -> int:
+        """Write buffered increments. Returns rows updated; deltas are kept on failure."""
+        with self._flush_lock:
+            merged = self._drain()
+            if not merged:
+                return 0
+            try:
+                for model, rows in merged.items():
+                    table = model.__table__
+                    columns = BUFFERED_COLUMNS[model]
+                    db.session.execute(
+                        table.update().where(table.c.id == bindparam('row_id')).values({
+                            column: func.coalesce(table.c[column], 0) + bindparam(f'd_{column}') for column in columns
+                        }),
+                        [dict(row_id=row_id, **{f'd_{column}': counts[column] for column in columns})
+                         for row_id, counts in sorted(rows.items())]
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for model, rows in merged.items():
+                    for row_id, counts in rows.items():
+                        self.add(model, row_id, **counts)
+                raise
+            return sum(len(rows) for rows in merged.values())
+
+    def start(self, app, interval: float = COUNTER_FLUSH_INTERVAL):
+        """Flush on an interval (or early when the buffer fills) and at exit"""
+        self._app = app
+
+        def run():
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                with app.app_context():
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        print(f"Counter flush error: {e}")
+
+        thread = threading.Thread(target=run, name="counter-flush", daemon=True)
+        thread.start()
+        atexit.register(self.flush_at_exit)
+        return thread
+
+    def flush_at_exit(self):
+        """Final flush on worker shutdown (atexit and gunicorn's worker_exit hook)"""
+        if self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                flushed = self.flush()
+                if flushed:
+                    print(f"Flushed {flushed} buffered counters on shutdown")
+            except Exception as e:
+                print(f"Counter flush on shutdown failed: {e}")
+
+counters = CounterBuffer()
@@ -0,0 +1,131 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy import select, func, case, cast, literal, or_, and_, Float
+from models import db, User, BroadcastJob, BroadcastDelivery
+from services.frequency_cap import FrequencyCap, local_day
+
+# Score = match quality + RECENCY_WEIGHT * (days since last broadcast, capped at a week) / 7
+PLANNER_RECENCY_WEIGHT = float(os.getenv('PLANNER_RECENCY_WEIGHT', 1.0))
+
+def promo_categories(promo) -> List[str]:
+    return [c.strip().lower() for c in (promo.category or "general").split(',')]
+
+def match_score(promo_cats, target_gender):
+    """(audience condition, match score) for a promo, as SQL expressions over `users`.
+
+    Same audience as broadcast_scheduler.matches_audience. Score: 1 per
+    interest hit, +0.25 for an explicit gender match, 0.5 for a "general"
+    promo without hits.
+    """
+    interests = func.lower(func.coalesce(User.interests, ''))
+    hits = sum((case((interests.contains(cat, autoescape=True), 1), else_=0)
+                for cat in promo_cats if cat != "general"), literal(0))
+    conditions = [or_(User.current_mode.is_(None), User.current_mode != 'vendor')]
+    score = hits
+    if target_gender != 'All':
+        has_gender = and_(User.gender.isnot(None), User.gender != '', User.gender != 'All')
+        conditions.append(or_(~has_gender, User.gender == target_gender))
+        score = score + case((has_gender, 0.25), else_=0)
+    if "general" in promo_cats:
+        score = score + case((hits == 0, 0.5), else_=0)
+    else:
+        conditions.append(hits > 0)
+    return and_(*conditions), score
+
+class DeliveryPlanner:
+    """Chooses exactly `impression_budget` recipients for paid broadcast jobs.
+
+    Candidates are ranked by how well they match the promo and how long ago
+    they last received a broadcast. Due jobs are planned together: every
+    (job, subscriber) pair is ranked and each subscriber is given to at most
+    one job, so overlapping paid promos split the audience instead of
+    messaging the same people twice. Subscribers still pending in another
+    active plan, or already at their frequency cap, are left out.
+
+    Matching, exclusion and ranking run in the database; each job reads only
+    its best-scored candidates, never the whole subscriber table.
+    """
+
+    def __init__(self, frequency_cap: FrequencyCap):
+        self.frequency_cap = frequency_cap
+
+    def plan_due(self, now: Optional[datetime] = None) -> List[BroadcastJob]:
+        """Plan every due, queued, budgeted job that has no plan yet. Commits."""
+        now = now or datetime.utcnow()
+        jobs = BroadcastJob.query.filter(
+            BroadcastJob.status == "queued",
+            BroadcastJob.scheduled_at <= now,
+            BroadcastJob.impression_budget > 0,
+            BroadcastJob.planned_at.is_(None),
+        ).order_by(BroadcastJob.priority.desc(), BroadcastJob.spend.desc(), BroadcastJob.id).all()
+        if jobs:
+            self._allocate({job: job.impression_budget for job in jobs}, now)
+        return jobs
+
+    def top_up(self, job: BroadcastJob, needed: int) -> int:
+        """Plan up to `needed` more recipients after failures or caps. Returns rows added."""
+        return self._allocate({job: needed}, datetime.utcnow())
+
+    def _allocate(self, budgets: Dict[BroadcastJob, int], now: datetime) -> int:
+        # Other jobs can take at most the rest of the total budget from a job's
+        # list, so its top `total` candidates always cover its own share
+        total = sum(budgets.values())
+        pairs = []
+        for rank, job in enumerate(budgets):
+            for user_id, score in self._ranked_candidates(job, list(budgets), now, total):
+                # Ties go to the job earlier in queue order
+                pairs.append((-score, rank, user_id, job, score))
+        pairs.sort(key=lambda p: p[:3])
+
+        remaining = dict(budgets)
+        taken: Set[int] = set()
+        rows = []
+        for _, _, user_id, job, score in pairs:
+            if remaining[job] <= 0 or user_id in taken:
+                continue
+            taken.add(user_id)
+            remaining[job] -= 1
+            rows.append({'job_id': job.id, 'user_id': user_id, 'score': round(score, 4), 'status': 'pending'})
+
+        if rows:
+            db.session.execute(BroadcastDelivery.__table__.insert(), rows)
+        for job in budgets:
+            job.planned_at = job.planned_at or now
+            if remaining[job] > 0:
+                print(f"Broadcast job {job.id}: audience short by {remaining[job]} of {budgets[job]} planned impressions")
+        db.session.commit()
+        return len(rows)
+
+    def _ranked_candidates(self, job: BroadcastJob, jobs: List[BroadcastJob], now: datetime, limit: int):
+        """(user_id, score) of the job's best `limit` eligible subscribers, best first"""
+        promo = job.promo
+        audience, score = match_score(promo_categories(promo), promo.target_gender)
+
+        recent = self.frequency_cap.recent_sends(now)
+        today = local_day(now)
+        days_idle = case(*[(recent.c.last_day >= today - timedelta(days=d), d) for d in range(7)], else_=7)
+        score = cast(score + days_idle * (PLANNER_RECENCY_WEIGHT / 7.0), Float)
+
+        # Already in one of these jobs' plans, or still pending in another active plan
+        reserved = select(BroadcastDelivery.id).join(BroadcastJob, BroadcastJob.id == BroadcastDelivery.job_id).where(
+            BroadcastDelivery.user_id == User.id,
+            or_(
+                BroadcastDelivery.job_id.in_([j.id for j in jobs]),
+                and_(BroadcastJob.status.in_(["queued", "running"]), BroadcastDelivery.status == "pending"),
+            ),
+        ).exists()
+
+        return db.session.execute(
+            select(User.id, score)
+            .outerjoin(recent, recent.c.user_id == User.id)
+            .where(
+                User.is_subscriber == True,
+                User.is_active == True,
+                audience,
+                self.frequency_cap.under_cap(recent),
+                ~reserved,
+            )
+            .order_by(score.desc(), User.id)
+            .limit(limit)
+        ).all()
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta, date
+from typing import Iterable, Optional, Set
+from sqlalchemy import func, case, and_, true
+from models import db, SubscriberSendCount, upsert_increment_many
+
+# Max broadcasts one subscriber receives per local day / rolling 7 days (0 disables a cap)
+FREQ_CAP_DAILY = int(os.getenv('FREQ_CAP_DAILY', 2))
+FREQ_CAP_WEEKLY = int(os.getenv('FREQ_CAP_WEEKLY', 7))
+# Day buckets follow the broadcast send-window clock (WAT by default)
+UTC_OFFSET_HOURS = int(os.getenv('BROADCAST_UTC_OFFSET_HOURS', 1))
+RETENTION_DAYS = 8
+
+def local_day(now: Optional[datetime] = None) -> date:
+    return ((now or datetime.utcnow()) + timedelta(hours=UTC_OFFSET_HOURS)).date()
+
+class FrequencyCap:
+    """Per-subscriber broadcast caps backed by daily counter buckets.
+
+    One row per (user, day) in subscriber_send_counts. The dispatcher checks
+    a whole chunk of recipients with a single grouped query and records the
+    chunk's deliveries with a single upsert, so capping adds two statements
+    per chunk rather than per recipient.
+    """
+
+    def __init__(self, daily: int = FREQ_CAP_DAILY, weekly: int = FREQ_CAP_WEEKLY):
+        self.daily = daily
+        self.weekly = weekly
+
+    @property
+    def enabled(self) -> bool:
+        return self.daily > 0 or self.weekly > 0
+
+    def capped_ids(self, user_ids: Iterable[int], now: Optional[datetime] = None) -> Set[int]:
+        """Subset of `user_ids` already at their daily or weekly cap"""
+        user_ids = list(user_ids)
+        if not user_ids or not self.enabled:
+            return set()
+        today = local_day(now)
+        week_start = today - timedelta(days=6)
+        rows = db.session.query(
+            SubscriberSendCount.user_id,
+            func.sum(case((SubscriberSendCount.day == today, SubscriberSendCount.count), else_=0)),
+            func.sum(SubscriberSendCount.count),
+        ).filter(
+            SubscriberSendCount.user_id.in_(user_ids),
+            SubscriberSendCount.day >= week_start,
+        ).group_by(SubscriberSendCount.user_id).all()
+
+        capped = set()
+        for user_id, today_count, week_count in rows:
+            if (self.daily and (today_count or 0) >= self.daily) or (self.weekly and (week_count or 0) >= self.weekly):
+                capped.add(user_id)
+        return capped
+
+    def recent_sends(self, now: Optional[datetime] = None):
+        """Subquery over the weekly window: user_id, last_day, today_count, week_count.
+
+        Only users messaged in the window have a row; outer-join it to users.
+        """
+        today = local_day(now)
+        return db.session.query(
+            SubscriberSendCount.user_id.label('user_id'),
+            func.max(SubscriberSendCount.day).label('last_day'),
+            func.sum(case((SubscriberSendCount.day == today, SubscriberSendCount.count), else_=0)).label('today_count'),
+            func.sum(SubscriberSendCount.count).label('week_count'),
+        ).filter(
+            SubscriberSendCount.day >= today - timedelta(days=6),
+        ).group_by(SubscriberSendCount.user_id).subquery()
+
+    def under_cap(self, recent):
+        """SQL condition: the user outer-joined to recent_sends() is below both caps"""
+        conditions = []
+        if self.daily:
+            conditions.append(func.coalesce(recent.c.today_count, 0) < self.daily)
+        if self.weekly:
+            conditions.append(func.coalesce(recent.c.week_count, 0) < self.weekly)
+        return and_(true(), *conditions)
+
+    def record_sends(self, user_ids: Iterable[int], now: Optional[datetime] = None):
+        """Count one delivery for each user today. Runs in the caller's transaction."""
+        today = local_day(now)
+        upsert_increment_many(SubscriberSendCount, ('user_id', 'day'),
+                              [{'user_id': uid, 'day': today} for uid in user_ids], {'count': 1})
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Drop buckets older than the weekly window"""
+        cutoff = local_day(now) - timedelta(days=RETENTION_DAYS)
+        deleted = SubscriberSendCount.query.filter(SubscriberSendCount.day < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
@@ -0,0 +1,44 @@
+import os
+import uuid
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Lease
+
+def make_owner_id() -> str:
+    """Identity of this process for lease ownership"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def acquire(name: str, owner: str, ttl_seconds: int) -> bool:
+    """Take or renew the lease `name` for `ttl_seconds`.
+
+    A single conditional UPDATE succeeds only if we already own the lease or
+    it has expired, so at most one owner holds it at any time. Commits.
+    """
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=ttl_seconds)
+    updated = Lease.query.filter(
+        Lease.name == name,
+        db.or_(Lease.owner == owner, Lease.expires_at < now)
+    ).update({Lease.owner: owner, Lease.expires_at: expires}, synchronize_session=False)
+    if updated:
+        db.session.commit()
+        return True
+    db.session.rollback()
+
+    if db.session.get(Lease, name) is not None:
+        return False
+    try:
+        db.session.add(Lease(name=name, owner=owner, expires_at=expires))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Another worker created it first
+        db.session.rollback()
+        return False
+
+def release(name: str, owner: str):
+    Lease.query.filter_by(name=name, owner=owner).update(
+        {Lease.expires_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
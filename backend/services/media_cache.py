@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+from typing import Optional, Dict, Any, Iterable, Iterator, AsyncIterable, AsyncIterator
+
+MEDIA_CACHE_DIR = os.getenv(
+    'MEDIA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'media_cache')
+)
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+class MediaCache:
+    """Content-addressed on-disk cache for WhatsApp media.
+
+    Layout under `root`:
+      blobs/<sha256>       file bodies, shared by every media id with the same content
+      pinned/<sha256>      bodies stored with pinned=True (ingested uploads); never evicted
+      index/<media_id>     small JSON entry: digest, mime type, size, pinned
+      tmp/                 partial downloads, renamed into blobs/ once complete
+
+    Blob mtime is the LRU clock: hits touch it, eviction removes the oldest
+    blobs until the cache is back under `max_bytes`. Pinned bodies are not
+    counted and stay until removed by hand. Every write is a rename, so
+    several gunicorn workers can share one directory.
+    """
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blobs_dir = os.path.join(root, 'blobs')
+        self.pinned_dir = os.path.join(root, 'pinned')
+        self.index_dir = os.path.join(root, 'index')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        for path in (self.blobs_dir, self.pinned_dir, self.index_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def _index_path(self, media_id: str) -> str:
+        name = media_id if _SAFE_ID.match(media_id) else hashlib.sha256(media_id.encode()).hexdigest()
+        return os.path.join(self.index_dir, name)
+
+    def blob_path(self, digest: str, pinned: bool = False) -> str:
+        return os.path.join(self.pinned_dir if pinned else self.blobs_dir, digest)
+
+    def lookup(self, media_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cache entry for a media id (with `path`), or None on a miss."""
+        try:
+            with open(self._index_path(media_id)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        path = self.blob_path(entry['digest'], entry.get('pinned', False))
+        try:
+            os.utime(path)
+        except OSError:
+            # Blob was evicted; drop the dangling index entry
+            self._remove(self._index_path(media_id))
+            return None
+        entry['path'] = path
+        return entry
+
+    def stream_and_store(self, media_id: str, chunks: Iterable[bytes], mime_type: Optional[str],
+                         pinned: bool = False) -> Iterator[bytes]:
+        """Yield `chunks` through unchanged while writing them to the cache.
+
+        The entry is only published once the whole body has been read; an
+        aborted download (client disconnect, upstream error) leaves nothing behind.
+        """
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                self._publish(media_id, tmp_path, digest.hexdigest(), size, mime_type, pinned)
+            else:
+                self._remove(tmp_path)
+
+    def store(self, media_id: str, chunks: Iterable[bytes], mime_type: Optional[str],
+              pinned: bool = False) -> Optional[Dict[str, Any]]:
+        """Download `chunks` fully into the cache and return the new entry."""
+        for _ in self.stream_and_store(media_id, chunks, mime_type, pinned):
+            pass
+        return self.lookup(media_id)
+
+    def pin(self, media_id: str) -> Optional[Dict[str, Any]]:
+        """Copy a cached entry out of eviction's reach; returns the pinned entry, or None on a miss."""
+        entry = self.lookup(media_id)
+        if entry is None or entry.get('pinned'):
+            return entry
+        with open(entry['path'], 'rb') as f:
+            return self.store(media_id, iter(lambda: f.read(CHUNK_SIZE), b''), entry['mime_type'], pinned=True)
+
+    async def astream_and_store(self, media_id: str, chunks: AsyncIterable[bytes],
+                                mime_type: Optional[str]) -> AsyncIterator[bytes]:
+        """stream_and_store for an async body (the ASGI media proxy)"""
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                self._publish(media_id, tmp_path, digest.hexdigest(), size, mime_type)
+            else:
+                self._remove(tmp_path)
+
+    async def astore(self, media_id: str, chunks: AsyncIterable[bytes], mime_type: Optional[str]) -> Optional[Dict[str, Any]]:
+        async for _ in self.astream_and_store(media_id, chunks, mime_type):
+            pass
+        return self.lookup(media_id)
+
+    def _publish(self, media_id: str, tmp_path: str, digest: str, size: int, mime_type: Optional[str],
+                 pinned: bool = False):
+        blob = self.blob_path(digest, pinned)
+        if os.path.exists(blob):
+            self._remove(tmp_path)
+            os.utime(blob)
+        else:
+            os.replace(tmp_path, blob)
+
+        entry = {'digest': digest, 'mime_type': mime_type or 'application/octet-stream', 'size': size}
+        if pinned:
+            entry['pinned'] = True
+        index_tmp = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        with open(index_tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(index_tmp, self._index_path(media_id))
+        if not pinned:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used blobs until the cache fits in `max_bytes`."""
+        blobs = []
+        total = 0
+        with os.scandir(self.blobs_dir) as it:
+            for item in it:
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, item.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        # Trim to 90% so a full cache doesn't rescan on every store
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(blobs):
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
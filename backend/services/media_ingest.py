@@ -0,0 +1,134 @@
+import io
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from flask import current_app
+from models import db, MediaAsset
+from services.whatsapp_service import WhatsAppService
+from services.media_cache import MediaCache, CHUNK_SIZE
+
+try:
+    from PIL import Image
+except ImportError:  # dimensions and thumbnails are skipped without Pillow
+    Image = None
+
+THUMBNAIL_SIZE = (320, 320)
+
+# Uploaded WhatsApp media ids expire after 30 days; re-upload a little earlier
+OUTBOUND_MEDIA_TTL = timedelta(days=29)
+
+def thumbnail_key(media_id: str) -> str:
+    return f"{media_id}_thumb"
+
+class MediaIngestService:
+    """Downloads WhatsApp uploads once, at upload time, into the local media cache.
+
+    Originals and thumbnails are stored pinned, so proxy traffic can't evict
+    them and outbound_media_ref can always re-upload an expired outbound id.
+    Each asset gets its metadata extracted (size, mime, image dimensions), a
+    JPEG thumbnail for the admin UI, and for promo images/videos a re-uploaded
+    outbound media id that broadcasts reuse instead of re-resolving the original.
+    """
+
+    def __init__(self):
+        self.whatsapp = WhatsAppService()
+        self.cache = MediaCache()
+
+    def enqueue(self, media_id: str, media_type: str):
+        """Record the asset and ingest it in a background thread. Needs an app context."""
+        asset = MediaAsset.query.get(media_id)
+        if not asset:
+            asset = MediaAsset(media_id=media_id, media_type=media_type, status="pending")
+            db.session.add(asset)
+            db.session.commit()
+        elif asset.status == "ready":
+            return
+
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=self.ingest, args=(media_id, media_type, app.app_context()), daemon=True)
+        thread.start()
+
+    def ingest(self, media_id: str, media_type: str, app_context):
+        with app_context:
+            asset = MediaAsset.query.get(media_id)
+            if not asset:
+                asset = MediaAsset(media_id=media_id, media_type=media_type)
+                db.session.add(asset)
+
+            try:
+                entry = self.cache.pin(media_id) or self._download(media_id)
+                asset.sha256 = entry['digest']
+                asset.mime_type = entry['mime_type']
+                asset.size_bytes = entry['size']
+
+                if entry['mime_type'].startswith('image/'):
+                    self._extract_image(asset, entry['path'])
+                if media_type in ('image', 'video'):
+                    self._upload_outbound(asset, entry)
+
+                asset.status = "ready"
+                asset.error = None
+                asset.ingested_at = datetime.utcnow()
+            except Exception as e:
+                print(f"Error ingesting media {media_id}: {e}")
+                asset.status = "failed"
+                asset.error = str(e)[:255]
+
+            db.session.commit()
+
+    def _download(self, media_id: str):
+        info = self.whatsapp.get_media_info(media_id)
+        if not info['success']:
+            raise RuntimeError(info['error'])
+
+        response = self.whatsapp.open_media_stream(info['data']['url'])
+        try:
+            mime_type = info['data'].get('mime_type') or response.headers.get('Content-Type')
+            return self.cache.store(media_id, response.iter_content(CHUNK_SIZE), mime_type, pinned=True)
+        finally:
+            response.close()
+
+    def _extract_image(self, asset: MediaAsset, path: str):
+        if Image is None:
+            return
+
+        with Image.open(path) as img:
+            asset.width, asset.height = img.size
+            img.thumbnail(THUMBNAIL_SIZE)
+            buf = io.BytesIO()
+            img.convert('RGB').save(buf, 'JPEG', quality=80)
+
+        self.cache.store(thumbnail_key(asset.media_id), [buf.getvalue()], 'image/jpeg', pinned=True)
+        asset.has_thumbnail = True
+
+    def _upload_outbound(self, asset: MediaAsset, entry) -> bool:
+        result = self.whatsapp.upload_media(entry['path'], entry['mime_type'])
+        if not result['success'] or not result['data'].get('id'):
+            return False
+        asset.outbound_media_id = result['data']['id']
+        asset.outbound_uploaded_at = datetime.utcnow()
+        return True
+
+    def outbound_media_ref(self, media_id: Optional[str]) -> Optional[str]:
+        """Media reference to send for a promo, resolved once per broadcast.
+
+        Returns the stored asset's outbound id, re-uploading it from the local
+        store if it has expired. Falls back to the original id when the asset
+        was never ingested or is no longer cached.
+        """
+        if not media_id or media_id.startswith("http"):
+            return media_id
+
+        asset = MediaAsset.query.get(media_id)
+        if not asset or asset.status != "ready":
+            return media_id
+
+        fresh = asset.outbound_uploaded_at and asset.outbound_uploaded_at > datetime.utcnow() - OUTBOUND_MEDIA_TTL
+        if asset.outbound_media_id and fresh:
+            return asset.outbound_media_id
+
+        entry = self.cache.lookup(media_id)
+        if entry and self._upload_outbound(asset, entry):
+            db.session.commit()
+            return asset.outbound_media_id
+        return media_id
@@ -0,0 +1,126 @@
+import os
+import json
+import random
+from typing import Optional, Dict, Any, List
+
+# Pool of pre-generated welcome greetings, refreshed offline by refresh_welcome_pool.py
+WELCOME_POOL_PATH = os.getenv(
+    'WELCOME_POOL_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'welcome_variants.json')
+)
+
+# Used when the pool file is missing or empty
+DEFAULT_WELCOME_VARIANTS = [
+    "👋 Welcome to EasyEasy! Your marketplace for amazing deals and promotions. 🎉"
+]
+
+def _list_interactive(body_text: str, button_text: str, sections: list) -> Dict[str, Any]:
+    return {
+        "type": "list",
+        "body": {"text": body_text},
+        "action": {"button": button_text, "sections": sections}
+    }
+
+def _button_interactive(body_text: str, buttons: list, button_ids: Optional[list] = None) -> Dict[str, Any]:
+    return {
+        "type": "button",
+        "body": {"text": body_text},
+        "action": {
+            "buttons": [{
+                "type": "reply",
+                "reply": {
+                    "id": button_ids[idx] if button_ids and idx < len(button_ids) else f"btn_{idx}",
+                    "title": text[:20]
+                }
+            } for idx, text in enumerate(buttons[:3])]
+        }
+    }
+
+VENDOR_MENU_ROWS = [
+    {"id": "upload_product", "title": "Upload Products"},
+    {"id": "run_promo", "title": "Run Promotion"},
+    {"id": "profile", "title": "Profile"},
+    {"id": "promo_status", "title": "View Promotion Status"},
+    {"id": "my_stats", "title": "My Stats"},
+    {"id": "switch_customer", "title": "Switch to Customer"},
+    {"id": "support", "title": "Support"}
+]
+
+CUSTOMER_MENU_ROWS = [
+    {"id": "earn", "title": "How to earn"},
+    {"id": "status", "title": "Account status"},
+    {"id": "update_interests", "title": "Update Interests"},
+    {"id": "support", "title": "Support"},
+    {"id": "unsub", "title": "Subscribe/Unsub"},
+    {"id": "redeem", "title": "Redeem Points"},
+    {"id": "join_socials", "title": "Social Media"}
+]
+
+# WhatsApp list messages hold at most 10 rows
+DIGEST_MAX_ITEMS = 10
+
+CUSTOMER_MENU_BODY = "Customer Dashboard\n\n💡 Tip: You can also type any question to ask our AI Assistant about products!"
+
+class MessageTemplates:
+    """Interactive payloads built once at startup.
+
+    Menus are identical for every user apart from the recipient, so the
+    `interactive` objects are shared and only the `to` slot is filled per send.
+    Payloads must be treated as read-only.
+    """
+
+    def __init__(self, pool_path: str = WELCOME_POOL_PATH):
+        self.vendor_menu = _list_interactive(
+            "Vendor Dashboard", "Open Options",
+            [{"title": "Vendor Options", "rows": VENDOR_MENU_ROWS}]
+        )
+        self.customer_menu_for_vendor = _list_interactive(
+            CUSTOMER_MENU_BODY, "Open Menu",
+            [{"title": "Menu", "rows": CUSTOMER_MENU_ROWS + [{"id": "switch_vendor", "title": "🔄 Switch to Vendor"}]}]
+        )
+        self.customer_menu_for_subscriber = _list_interactive(
+            CUSTOMER_MENU_BODY, "Open Menu",
+            [{"title": "Menu", "rows": CUSTOMER_MENU_ROWS + [{"id": "become_vendor", "title": "🆕 Become a Vendor"}]}]
+        )
+        self.welcome_variants = self.load_welcome_variants(pool_path)
+        self.role_buttons = ["Vendor", "Customer"]
+
+    @staticmethod
+    def load_welcome_variants(path: str) -> List[str]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                variants = [v.strip() for v in json.load(f) if isinstance(v, str) and v.strip()]
+            return variants or DEFAULT_WELCOME_VARIANTS
+        except (OSError, ValueError) as e:
+            print(f"Welcome pool not loaded ({e}), using default greeting")
+            return DEFAULT_WELCOME_VARIANTS
+
+    def customer_menu(self, is_vendor: bool) -> Dict[str, Any]:
+        return self.customer_menu_for_vendor if is_vendor else self.customer_menu_for_subscriber
+
+    def welcome_text(self, user_name: Optional[str] = None) -> str:
+        name_part = f"Hello {user_name}! " if user_name else ""
+        return name_part + random.choice(self.welcome_variants)
+
+    def welcome_message(self, user_name: Optional[str] = None) -> Dict[str, Any]:
+        """Welcome greeting with the role-selection buttons"""
+        return _button_interactive(f"{self.welcome_text(user_name)}\n\nRegister as:", self.role_buttons)
+
+    @staticmethod
+    def promo_digest(promos) -> Dict[str, Any]:
+        """One list message for several promos; each row replies buy_promo_<id> (Contact Vendor)"""
+        rows = []
+        for promo in promos[:DIGEST_MAX_ITEMS]:
+            price = "₦{:,.0f}".format(promo.price) if promo.price and promo.price > 0 else "Negotiable"
+            vendor = promo.vendor.business_name if promo.vendor and promo.vendor.business_name else "Vendor"
+            rows.append({
+                "id": f"buy_promo_{promo.id}",
+                "title": promo.title[:24],
+                "description": f"{price} · {vendor} · Tap to contact vendor"[:72]
+            })
+        body = "🔥 *{} new deals picked for you!*\n\n".format(len(rows)) + "\n".join(
+            f"• {promo.title}" for promo in promos[:DIGEST_MAX_ITEMS]
+        ) + "\n\n👇 Open the list and tap an item to contact the vendor."
+        return _list_interactive(body[:1024], "Contact Vendor", [{"title": "Today's deals", "rows": rows}])
+
+templates = MessageTemplates()
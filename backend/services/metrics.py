@@ -0,0 +1,135 @@
+import os
+import time
+from flask import g, request, has_request_context
+
+try:
+    from prometheus_client import (
+        Counter, Histogram, Gauge, CollectorRegistry, REGISTRY,
+        generate_latest, CONTENT_TYPE_LATEST, multiprocess,
+    )
+except ImportError:  # metrics become no-ops without prometheus_client
+    Counter = Histogram = Gauge = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Under gunicorn each worker writes samples here and /metrics merges them
+# (gunicorn.conf.py sets it up and cleans up after dead workers)
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class _Noop:
+    """Stand-in for a metric when prometheus_client is not installed"""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+def _metric(kind, *args, **kwargs):
+    if kind is None:
+        return _Noop()
+    if kind is not Gauge:
+        kwargs.pop('multiprocess_mode', None)
+    return kind(*args, **kwargs)
+
+HTTP_REQUEST_SECONDS = _metric(Histogram, 'easyeasy_http_request_seconds', 'HTTP request latency', ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+WEBHOOK_MESSAGE_SECONDS = _metric(Histogram, 'easyeasy_webhook_message_seconds', 'Time to handle one inbound WhatsApp message', ['message_type'], buckets=LATENCY_BUCKETS)
+WEBHOOK_ERRORS = _metric(Counter, 'easyeasy_webhook_errors_total', 'Webhook payloads that raised')
+WEBHOOK_STATUSES = _metric(Counter, 'easyeasy_webhook_statuses_total', 'Message status callbacks received')
+WEBHOOK_SHED = _metric(Counter, 'easyeasy_webhook_shed_total', 'Inbound messages dropped by the per-number rate limit', ['message_type'])
+BOT_STATE_SECONDS = _metric(Histogram, 'easyeasy_bot_state_seconds', 'BotHandler latency per conversation state', ['state'], buckets=LATENCY_BUCKETS)
+
+DB_QUERY_SECONDS = _metric(Histogram, 'easyeasy_db_query_seconds', 'SQL statement latency', buckets=SQL_BUCKETS)
+DB_QUERIES_PER_REQUEST = _metric(Histogram, 'easyeasy_db_queries_per_request', 'SQL statements issued per HTTP request', ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+DB_QUERY_ERRORS = _metric(Counter, 'easyeasy_db_query_errors_total', 'SQL statements that raised')
+DB_SECONDS_PER_REQUEST = _metric(Histogram, 'easyeasy_db_seconds_per_request', 'Total SQL time per HTTP request', ['endpoint'], buckets=LATENCY_BUCKETS)
+
+OPENAI_SECONDS = _metric(Histogram, 'easyeasy_openai_request_seconds', 'OpenAI call latency', ['method'], buckets=LATENCY_BUCKETS)
+OPENAI_ERRORS = _metric(Counter, 'easyeasy_openai_errors_total', 'Failed OpenAI calls', ['method'])
+
+WHATSAPP_SEND_SECONDS = _metric(Histogram, 'easyeasy_whatsapp_send_seconds', 'Graph API send latency', ['message_type'], buckets=LATENCY_BUCKETS)
+WHATSAPP_RESPONSES = _metric(Counter, 'easyeasy_whatsapp_responses_total', 'Graph API responses by status code', ['message_type', 'status'])
+
+BROADCASTS_IN_PROGRESS = _metric(Gauge, 'easyeasy_broadcasts_in_progress', 'Broadcasts currently sending', multiprocess_mode='livesum')
+BROADCAST_REMAINING = _metric(Gauge, 'easyeasy_broadcast_remaining_recipients', 'Subscribers still to be processed by running broadcasts', multiprocess_mode='livesum')
+BROADCAST_MESSAGES = _metric(Counter, 'easyeasy_broadcast_messages_total', 'Broadcast deliveries by result', ['result'])
+
+class timer:
+    """Context manager observing elapsed seconds on a (labelled) histogram"""
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+def observe_since(histogram, started: float):
+    histogram.observe(time.perf_counter() - started)
+
+# The start time rides on the statement's execution context, which is
+# dropped with the statement whether it succeeds or raises
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_query(context)
+
+def _handle_error(exception_context):
+    """Failed statements skip after_cursor_execute; time and count them here"""
+    if _record_query(exception_context.execution_context):
+        DB_QUERY_ERRORS.inc()
+
+def _record_query(context) -> bool:
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return False
+    # Once per statement, even if a later fetch on it raises
+    context._metrics_started = None
+    elapsed = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(elapsed)
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + elapsed
+    return True
+
+def init_app(app, db):
+    """Hook SQL and request timing into the app"""
+    from sqlalchemy import event
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(db.engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint != 'metrics' and 'request_started' in g:
+            HTTP_REQUEST_SECONDS.labels(endpoint, request.method, str(response.status_code)).observe(
+                time.perf_counter() - g.request_started
+            )
+            DB_QUERIES_PER_REQUEST.labels(endpoint).observe(g.get('db_queries', 0))
+            DB_SECONDS_PER_REQUEST.labels(endpoint).observe(g.get('db_seconds', 0.0))
+        return response
+
+def render():
+    """Exposition body and content type for /metrics"""
+    if Counter is None:
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
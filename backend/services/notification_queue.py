@@ -0,0 +1,30 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Iterable, Tuple, List
+from services.whatsapp_service import WhatsAppService
+
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', 8))
+
+class NotificationQueue:
+    """Delivers WhatsApp text notifications off the request thread.
+
+    Admin endpoints enqueue and respond immediately; a small thread pool
+    sends concurrently. Jobs carry only the phone number and text, so they
+    never touch the DB session of the request that queued them.
+    """
+
+    def __init__(self, max_workers: int = NOTIFY_WORKERS):
+        self.whatsapp = WhatsAppService()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notify")
+
+    def _send(self, to: str, message: str):
+        result = self.whatsapp.send_text_message(to, message)
+        if not result.get('success'):
+            print(f"Notification to {to} failed: {result.get('error')}")
+        return result
+
+    def send_text(self, to: str, message: str) -> Future:
+        return self.executor.submit(self._send, to, message)
+
+    def send_many(self, messages: Iterable[Tuple[str, str]]) -> List[Future]:
+        return [self.send_text(to, message) for to, message in messages]
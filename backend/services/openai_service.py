@@ -1,14 +1,83 @@
 import os
 import json
-from openai import OpenAI
-from typing import Optional
+import time
+import threading
+from datetime import datetime
+from typing import Optional, List
+from models import db, AIUsage, upsert_increment
+from services.message_templates import templates
+from services import metrics
+
+# Token budget per user per day, shared across caption, chat and welcome calls
+DAILY_AI_TOKEN_BUDGET = int(os.getenv('DAILY_AI_TOKEN_BUDGET', 20000))
+
+# USD per 1K tokens, used to estimate cost on the admin usage report
+PROMPT_COST_PER_1K = float(os.getenv('OPENAI_PROMPT_COST_PER_1K', 0.0005))
+COMPLETION_COST_PER_1K = float(os.getenv('OPENAI_COMPLETION_COST_PER_1K', 0.0015))
 
 class OpenAIService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """OpenAI client, built on first use: importing the SDK is the slowest part of worker boot"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._client
+
+    def _complete(self, method: str, **kwargs):
+        """Chat completion call with latency and error metrics labelled by caller"""
+        started = time.perf_counter()
+        try:
+            return self.client.chat.completions.create(**kwargs)
+        except Exception:
+            metrics.OPENAI_ERRORS.labels(method).inc()
+            raise
+        finally:
+            metrics.observe_since(metrics.OPENAI_SECONDS.labels(method), started)
+
+    def tokens_used_today(self, user_id: int) -> int:
+        """Total tokens a user has spent today across all AI features."""
+        total = db.session.query(
+            db.func.sum(AIUsage.prompt_tokens + AIUsage.completion_tokens)
+        ).filter(AIUsage.user_id == user_id, AIUsage.day == datetime.utcnow().date()).scalar()
+        return total or 0
 
-    def generate_ad_caption(self, title: str, description: str, price: Optional[float] = None, business_name: Optional[str] = None, instruction: Optional[str] = None) -> str:
+    def has_budget(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return True
+        return self.tokens_used_today(user_id) < DAILY_AI_TOKEN_BUDGET
+
+    def record_usage(self, user_id: Optional[int], feature: str, response) -> None:
+        """Add the token usage of an OpenAI response to today's rollup row.
+
+        Rows are only written for known users; the caller's commit persists them.
+        The upsert runs in a savepoint, so a failure here can't abort the
+        caller's transaction.
+        """
+        usage = getattr(response, 'usage', None)
+        if user_id is None or usage is None:
+            return
+        try:
+            with db.session.begin_nested():
+                upsert_increment(
+                    AIUsage,
+                    {'user_id': user_id, 'feature': feature, 'day': datetime.utcnow().date()},
+                    {'calls': 1, 'prompt_tokens': usage.prompt_tokens or 0, 'completion_tokens': usage.completion_tokens or 0}
+                )
+        except Exception as e:
+            print(f"Error recording AI usage: {e}")
+
+    def generate_ad_caption(self, title: str, description: str, price: Optional[float] = None, business_name: Optional[str] = None, instruction: Optional[str] = None, user_id: Optional[int] = None) -> str:
         """Generate a creative, high-converting ad caption."""
+        fallback = f"🔥 {title}\n\n{description}\n\n✅ Sold by: {business_name}"
+        if not self.has_budget(user_id):
+            return fallback
         
         # 1. CHANGE: Give it a creative personality, not a robotic one.
         system_instruction = """You are a world-class Copywriter for WhatsApp Ads.
@@ -35,7 +104,7 @@ class OpenAIService:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            response = self._complete("generate_ad_caption",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_instruction},
@@ -44,15 +113,19 @@ class OpenAIService:
                 max_tokens=250,
                 temperature=0.8  # <--- CHANGE: Increased from 0.5 to 0.8 for more creativity/variety
             )
+            self.record_usage(user_id, "caption", response)
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error generating caption: {e}")
-            return f"🔥 {title}\n\n{description}\n\n✅ Sold by: {business_name}"
+            return fallback
 
-    def smart_chat(self, user_name, user_memory, user_message, product_data):
+    def smart_chat(self, user_name, user_memory, user_message, product_data, user_id=None):
         """
         Analyzes message, replies naturally, and acts as Customer Support.
         """
+        if not self.has_budget(user_id):
+            return {"reply": "⏳ You've reached your daily AI chat limit. Please try again tomorrow!", "new_fact": None}
+
         system_prompt = f"""
         You are EasyEasy, a smart, helpful shopping assistant and customer support agent on WhatsApp.
         
@@ -82,7 +155,7 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
+            response = self._complete("smart_chat",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -90,25 +163,32 @@ class OpenAIService:
                 ],
                 response_format={"type": "json_object"} 
             )
+            self.record_usage(user_id, "chat", response)
             return json.loads(response.choices[0].message.content)
         except Exception as e:
             print(f"AI Error: {e}")
             return {"reply": "I'm having trouble thinking right now. Type 'Menu' to see your options!", "new_fact": None}
 
     def generate_welcome_message(self, user_name: Optional[str] = None) -> str:
-        name_part = f"Hello {user_name}! " if user_name else "Hello! "
-        prompt = f"""{name_part}Generate a warm, friendly welcome message for a WhatsApp bot that helps vendors advertise their products and helps users discover great deals. Keep it brief (2-3 sentences) and inviting."""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a friendly bot assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=100,
-                temperature=0.7
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Error generating welcome message: {e}")
-            return f"{name_part}Welcome to EasyEasy! 🎉 Your marketplace for amazing deals and promotions."
\ No newline at end of file
+        """Greeting picked from the pre-generated pool, so no LLM round trip per user."""
+        return templates.welcome_text(user_name)
+
+    def generate_welcome_variants(self, count: int = 10) -> List[str]:
+        """Generate fresh greetings for the welcome pool. Run offline via refresh_welcome_pool.py."""
+        prompt = """Generate a warm, friendly welcome message for a WhatsApp bot that helps vendors advertise their products and helps users discover great deals. Keep it brief (2-3 sentences) and inviting. Do not address the user by name."""
+        variants = []
+        for _ in range(count):
+            try:
+                response = self._complete("generate_welcome_variants",
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are a friendly bot assistant."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=100,
+                    temperature=0.9
+                )
+                variants.append(response.choices[0].message.content.strip())
+            except Exception as e:
+                print(f"Error generating welcome variant: {e}")
+        return variants
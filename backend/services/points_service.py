@@ -0,0 +1,93 @@
+import os
+import time
+import uuid
+import threading
+from typing import Iterable, Tuple
+from sqlalchemy import select, func
+from models import db, User, PointsLedger
+
+POINTS_ROLLUP_INTERVAL = int(os.getenv('POINTS_ROLLUP_INTERVAL', 30))  # seconds
+POINTS_ROLLUP_BATCH = int(os.getenv('POINTS_ROLLUP_BATCH', 5000))
+
+class PointsService:
+    """Points as an append-only ledger with periodic balance rollups.
+
+    Awards only INSERT into points_ledger, so handlers never read-modify-write
+    the hot `users` row. A rollup claims a batch of unapplied entries and adds
+    their per-user sums to User.points with one set-based UPDATE. Claiming is
+    a conditional UPDATE on the ledger, so concurrent workers never apply the
+    same entry twice.
+    """
+
+    def award(self, user_id: int, amount: float, reason: str):
+        """Queue an award in the caller's transaction; it commits with the caller.
+
+        Kept per-award on purpose: every handler awards at most once per
+        transaction, together with the guard it updates (last_checkin,
+        community_task_done, order status), so the award can't be lost or
+        doubled. Use award_many for bulk grants.
+        """
+        db.session.add(PointsLedger(user_id=user_id, amount=amount, reason=reason))
+
+    def award_many(self, awards: Iterable[Tuple[int, float, str]]):
+        """Insert many awards with one multi-row INSERT"""
+        rows = [{'user_id': user_id, 'amount': amount, 'reason': reason} for user_id, amount, reason in awards]
+        if rows:
+            db.session.execute(PointsLedger.__table__.insert(), rows)
+
+    def balance(self, user_id: int) -> float:
+        """Rolled-up balance plus pending awards, read in a single statement."""
+        db.session.flush()
+        pending = select(func.coalesce(func.sum(PointsLedger.amount), 0)).where(
+            PointsLedger.user_id == user_id, PointsLedger.rollup_batch.is_(None)
+        ).scalar_subquery()
+        total = db.session.execute(
+            select(func.coalesce(User.points, 0) + pending).where(User.id == user_id)
+        ).scalar()
+        return total or 0.0
+
+    def rollup(self, batch_size: int = POINTS_ROLLUP_BATCH) -> int:
+        """Apply up to `batch_size` pending entries to User.points. Returns entries applied."""
+        pending = (
+            select(PointsLedger.id).where(PointsLedger.rollup_batch.is_(None))
+            .order_by(PointsLedger.id).limit(batch_size).subquery()
+        )
+        upper = db.session.execute(select(func.max(pending.c.id))).scalar()
+        if upper is None:
+            db.session.rollback()
+            return 0
+
+        token = uuid.uuid4().hex
+        claimed = PointsLedger.query.filter(
+            PointsLedger.rollup_batch.is_(None), PointsLedger.id <= upper
+        ).update({PointsLedger.rollup_batch: token}, synchronize_session=False)
+
+        if claimed:
+            batch_sum = select(func.sum(PointsLedger.amount)).where(
+                PointsLedger.user_id == User.id, PointsLedger.rollup_batch == token
+            ).scalar_subquery()
+            db.session.execute(
+                User.__table__.update()
+                .where(User.id.in_(select(PointsLedger.user_id).where(PointsLedger.rollup_batch == token)))
+                .values(points=func.coalesce(User.points, 0) + batch_sum)
+            )
+        db.session.commit()
+        return claimed
+
+    def start_rollup_worker(self, app, interval: int = POINTS_ROLLUP_INTERVAL):
+        """Run rollups forever in a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                with app.app_context():
+                    try:
+                        # Drain a backlog in consecutive batches
+                        while self.rollup() >= POINTS_ROLLUP_BATCH:
+                            pass
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Points rollup error: {e}")
+
+        thread = threading.Thread(target=run, name="points-rollup", daemon=True)
+        thread.start()
+        return thread
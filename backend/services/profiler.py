@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import uuid
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from flask import g, request, has_request_context
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/easyeasy_profiles')
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 120))
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 1000))
+SLOW_REQUEST_BUFFER = int(os.getenv('SLOW_REQUEST_BUFFER', 50))
+SQL_LOG_LIMIT = 200  # statements kept per request
+SQL_TEXT_LIMIT = 500  # characters kept per statement in a capture
+
+def _collapse(frame) -> str:
+    """Frame chain as a collapsed stack line, root first: mod:func;mod:func"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(f"{module}:{code.co_name}:{frame.f_lineno}" if not names else f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    """Wall-clock sampler over every thread in this process.
+
+    A session runs in a background thread so the profiled worker keeps
+    serving; the collapsed stacks (flamegraph.pl / speedscope input) are
+    written to PROFILE_DIR so any worker can return them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = None
+
+    def start(self, seconds: float, interval: float = 0.005) -> str:
+        seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+        interval = max(0.001, float(interval))
+        with self._lock:
+            if self._running:
+                raise RuntimeError(f"Profile {self._running} is already running in this worker")
+            session_id = uuid.uuid4().hex[:12]
+            self._running = session_id
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        thread = threading.Thread(target=self._run, args=(session_id, seconds, interval), name="profiler", daemon=True)
+        thread.start()
+        return session_id
+
+    def _run(self, session_id: str, seconds: float, interval: float):
+        me = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+                samples += 1
+                time.sleep(interval)
+
+            lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+            path = os.path.join(PROFILE_DIR, f"{session_id}.folded")
+            with open(path + ".tmp", "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(path + ".tmp", path)
+            print(f"Profile {session_id}: {samples} samples, {len(stacks)} distinct stacks (pid {os.getpid()})")
+        except Exception as e:
+            print(f"Profiler error: {e}")
+        finally:
+            with self._lock:
+                self._running = None
+
+    @staticmethod
+    def result(session_id: str):
+        """Collapsed stacks for a finished session, or None while it is still running"""
+        if not session_id.isalnum():
+            return None
+        path = os.path.join(PROFILE_DIR, f"{session_id}.folded")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+class SlowRequestRecorder:
+    """Captures a stack sample and the SQL log of requests over SLOW_REQUEST_MS.
+
+    Requests register themselves in a dict; a watchdog thread wakes every
+    threshold/2 and snapshots the stack of any request past the threshold
+    while it is still running. Fast requests only pay for a dict insert and
+    a list append per SQL statement. Captures go into a bounded, per-worker
+    ring buffer.
+    """
+
+    def __init__(self, threshold_ms: int = SLOW_REQUEST_MS, size: int = SLOW_REQUEST_BUFFER):
+        self.threshold = threshold_ms / 1000.0
+        self.captures = deque(maxlen=size)
+        self._active = {}  # thread ident -> [started, stack or None]
+        self._watchdog = None
+
+    def init_app(self, app, db):
+        from sqlalchemy import event
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(db.engine, 'handle_error', self._handle_error)
+
+        @app.before_request
+        def _track_request():
+            entry = [time.monotonic(), None]
+            g.sql_log = []
+            self._active[threading.get_ident()] = entry
+
+        @app.teardown_request
+        def _finish_request(exc):
+            entry = self._active.pop(threading.get_ident(), None)
+            if entry is None:
+                return
+            elapsed = time.monotonic() - entry[0]
+            if elapsed >= self.threshold:
+                self._capture(elapsed, entry[1], exc)
+
+        self._watchdog = threading.Thread(target=self._watch, name="slow-request-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which goes away with the statement even if it raises
+        if context is not None:
+            context._profiler_started = time.monotonic()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._log_query(context, statement, None)
+
+    def _handle_error(self, exception_context):
+        self._log_query(exception_context.execution_context, exception_context.statement,
+                        exception_context.original_exception)
+
+    def _log_query(self, context, statement, error):
+        started = getattr(context, '_profiler_started', None)
+        if started is None:
+            return
+        context._profiler_started = None
+        if has_request_context():
+            log = g.get('sql_log')
+            if log is not None and len(log) < SQL_LOG_LIMIT:
+                log.append((statement, time.monotonic() - started, error))
+
+    def _watch(self):
+        interval = max(self.threshold / 2, 0.05)
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            frames = None
+            for ident, entry in list(self._active.items()):
+                if entry[1] is None and now - entry[0] >= self.threshold:
+                    frames = frames or sys._current_frames()
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        entry[1] = _collapse(frame)
+
+    def _capture(self, elapsed: float, stack, exc):
+        sql = g.get('sql_log') or []
+        self.captures.append({
+            'at': datetime.utcnow().isoformat(),
+            'pid': os.getpid(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'duration_ms': round(elapsed * 1000, 1),
+            'error': str(exc) if exc else None,
+            'stack': stack,
+            'sql_count': len(sql),
+            'sql_ms': round(sum(d for _, d, _ in sql) * 1000, 1),
+            'sql': [{'statement': s[:SQL_TEXT_LIMIT], 'ms': round(d * 1000, 2), 'error': str(e) if e else None}
+                    for s, d, e in sql],
+        })
+
+    def recent(self):
+        return list(reversed(self.captures))
+
+profiler = SamplingProfiler()
+slow_requests = SlowRequestRecorder()
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+from services import metrics
+
+# Token bucket per sender: INBOUND_RATE_BURST messages at once, refilled at
+# INBOUND_RATE_PER_MINUTE. Messages over the limit are dropped before any DB work.
+# The burst covers a whole vendor signup (17 steps) sent back to back.
+INBOUND_RATE_BURST = float(os.getenv('INBOUND_RATE_BURST', 20))
+INBOUND_RATE_PER_MINUTE = float(os.getenv('INBOUND_RATE_PER_MINUTE', 20))
+# local: per worker process. redis: one bucket per number across all workers (needs REDIS_URL). off: disabled.
+INBOUND_RATE_BACKEND = os.getenv('INBOUND_RATE_BACKEND', 'local')
+REDIS_URL = os.getenv('REDIS_URL')
+RATE_LIMIT_SHARDS = 16
+# Idle (full) buckets are dropped once a shard tracks more than this many numbers
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 50000))
+SHED_TOP_KEYS = 1000  # senders remembered for the admin report
+# Sent once per throttled episode (until a message from that sender is admitted again)
+INBOUND_RATE_NOTICE = "⏳ You're sending messages faster than we can reply. Please wait a few seconds, then send your last message again."
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, list] = {}  # key -> [tokens, last refill (monotonic)]
+
+class LocalTokenBucket:
+    """In-process token buckets, sharded like services/counter_buffer.py.
+
+    Limits are per worker: with N workers behind a load balancer a sender
+    can get up to N times the rate. Use RedisTokenBucket for a shared limit.
+    """
+    shared = False
+
+    def __init__(self, burst: float = INBOUND_RATE_BURST, per_minute: float = INBOUND_RATE_PER_MINUTE,
+                 shards: int = RATE_LIMIT_SHARDS):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                if len(shard.buckets) >= RATE_LIMIT_MAX_KEYS:
+                    self._prune(shard, now)
+                bucket = shard.buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def allow_many(self, keys: Sequence[str]) -> List[bool]:
+        now = time.monotonic()
+        return [self.allow(key, now) for key in keys]
+
+    def _prune(self, shard: _Shard, now: float):
+        # A bucket that has refilled completely behaves exactly like a new one
+        full_after = self.burst / self.rate if self.rate else float('inf')
+        for key in [k for k, (_, last) in shard.buckets.items() if now - last >= full_after]:
+            del shard.buckets[key]
+
+# Atomic refill-and-take on a hash {tokens, ts}; uses the Redis clock so every worker agrees on time
+_TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / math.max(rate, 0.000001)) + 1)
+return allowed
+"""
+
+class RedisTokenBucket:
+    """Token buckets in Redis, shared by every worker and host.
+
+    One pipelined round trip per webhook payload. If Redis is unreachable
+    messages are let through (fail open): the bot must keep answering.
+    """
+    shared = True
+    KEY_PREFIX = 'easyeasy:inbound:'
+
+    def __init__(self, url: str, burst: float = INBOUND_RATE_BURST, per_minute: float = INBOUND_RATE_PER_MINUTE,
+                 client=None):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self.client = client
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+
+    def allow(self, key: str) -> bool:
+        return self.allow_many([key])[0]
+
+    def allow_many(self, keys: Sequence[str]) -> List[bool]:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                self._take(keys=[self.KEY_PREFIX + key], args=[self.burst, self.rate], client=pipe)
+            return [bool(allowed) for allowed in pipe.execute()]
+        except Exception as e:
+            print(f"Rate limiter unavailable, allowing messages: {e}")
+            return [True] * len(keys)
+
+class InboundRateLimiter:
+    """Per-number limit applied to webhook messages before they reach the bot.
+
+    Shed messages are counted (metrics.WEBHOOK_SHED) and the busiest shed
+    senders of this worker are kept for /api/admin/rate-limit. The first
+    shed message of an episode calls `on_throttled(phone)` (if set), so the
+    sender is told to slow down instead of being silently ignored.
+    """
+
+    def __init__(self, backend: str = INBOUND_RATE_BACKEND):
+        self.backend = backend
+        self.buckets = None
+        if backend == 'redis':
+            try:
+                if not REDIS_URL:
+                    raise ValueError("REDIS_URL is not set")
+                self.buckets = RedisTokenBucket(REDIS_URL)
+            except (ImportError, ValueError) as e:
+                # The shared limiter needs redis-py and REDIS_URL; the local one works without them
+                print(f"Redis rate limiter unavailable ({e}); using the local limiter")
+                self.backend = 'local'
+        if self.backend == 'local':
+            self.buckets = LocalTokenBucket()
+        self._shed_lock = threading.Lock()
+        self._shed_by_sender = Counter()
+        self._throttled = set()  # senders notified in their current episode
+        self.on_throttled = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.buckets is not None
+
+    @property
+    def shared(self) -> bool:
+        """True when checks make a network round trip (keep them off the event loop)"""
+        return bool(self.buckets and self.buckets.shared)
+
+    def admit(self, messages: List[dict]) -> List[dict]:
+        """The messages whose sender is within their limit; the rest are counted and dropped"""
+        if not self.enabled or not messages:
+            return messages
+        allowed = self.buckets.allow_many([str(message.get('from')) for message in messages])
+        admitted = []
+        notify = []
+        for message, ok in zip(messages, allowed):
+            sender = message.get('from')
+            if ok:
+                admitted.append(message)
+                if sender in self._throttled:
+                    with self._shed_lock:
+                        self._throttled.discard(sender)
+                continue
+            metrics.WEBHOOK_SHED.labels(message.get('type', 'unknown')).inc()
+            with self._shed_lock:
+                self._shed_by_sender[sender] += 1
+                if len(self._shed_by_sender) > SHED_TOP_KEYS * 2:
+                    self._shed_by_sender = Counter(dict(self._shed_by_sender.most_common(SHED_TOP_KEYS)))
+                if sender not in self._throttled:
+                    if len(self._throttled) >= RATE_LIMIT_MAX_KEYS:
+                        self._throttled.clear()
+                    self._throttled.add(sender)
+                    notify.append(sender)
+        if self.on_throttled:
+            for sender in notify:
+                self.on_throttled(sender)
+        return admitted
+
+    def report(self, limit: int = 20) -> dict:
+        with self._shed_lock:
+            top = self._shed_by_sender.most_common(limit)
+        return {
+            "backend": self.backend if self.enabled else "off",
+            "burst": INBOUND_RATE_BURST,
+            "per_minute": INBOUND_RATE_PER_MINUTE,
+            "top_shed_senders": [{"phone_number": phone, "shed": count} for phone, count in top],
+        }
+
+inbound_limiter = InboundRateLimiter()
@@ -0,0 +1,56 @@
+"""Referral codes derived from the user's primary key.
+
+A code is a 3-character name prefix plus the user id run through a
+bijective scramble and written in Crockford base32. Distinct ids always
+give distinct suffixes, so allocation is O(1) with no uniqueness probes
+against the database, and consecutive signups don't get guessable codes.
+
+The suffix is 5 characters (33.5M ids) and grows by one character past
+that. New codes are therefore 8+ characters long and can never collide
+with the legacy 6/7 character codes (prefix + 3 or 4 random digits).
+"""
+
+# Crockford base32: no I, L, O or U, so codes survive being read out or retyped
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+SUFFIX_LEN = 5
+PREFIX_LEN = 3
+DEFAULT_PREFIX = "USR"
+
+# Odd multiplier => multiplication is a bijection modulo 2^bits
+_MULTIPLIER = 0x5BD1E995
+_MIX = 0x2B3C4D5E6F
+
+# Characters people commonly type for the ones Crockford leaves out
+_CONFUSABLE = str.maketrans({"O": "0", "I": "1", "L": "1"})
+
+def _scramble(n: int, bits: int) -> int:
+    mask = (1 << bits) - 1
+    return ((n * _MULTIPLIER) & mask) ^ (_MIX & mask)
+
+def encode_id(n: int) -> str:
+    """Encode a non-negative integer as a scrambled, fixed-width base32 suffix."""
+    width = SUFFIX_LEN
+    while n >= 32 ** width:
+        width += 1
+    value = _scramble(n, 5 * width)
+    chars = []
+    for _ in range(width):
+        value, rem = divmod(value, 32)
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+def name_prefix(name: str) -> str:
+    clean = "".join(c for c in (name or "") if c.isalnum())
+    return clean[:PREFIX_LEN].upper() if len(clean) >= PREFIX_LEN else DEFAULT_PREFIX
+
+def make_referral_code(name: str, user_id: int) -> str:
+    """Unique, human-friendly code for a persisted user (needs `user.id`)."""
+    return f"{name_prefix(name)}{encode_id(user_id)}"
+
+def normalize_code(text: str) -> str:
+    """Canonicalise a typed code: upper case, and fix O/I/L typos in the suffix."""
+    code = (text or "").strip().upper()
+    if len(code) <= PREFIX_LEN + 4:
+        # Legacy code (prefix + random digits); leave as typed
+        return code
+    return code[:PREFIX_LEN] + code[PREFIX_LEN:].translate(_CONFUSABLE)
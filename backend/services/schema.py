@@ -0,0 +1,61 @@
+from sqlalchemy import text
+from models import db
+from services.search_index import search_index
+
+def upgrade_schema():
+    """Create missing tables and apply in-place column/index additions.
+
+    Idempotent. Run once per deploy by the release step (init_db.py) rather
+    than by every worker at boot. Needs an app context.
+    """
+    # Tables first: the ALTERs below need `users` & co. to exist on a fresh database.
+    # create_all commits on its own connection, so it never waits on locks held by this session.
+    db.create_all()
+
+    if db.engine.dialect.name == 'postgresql':
+        # Columns and indexes added to tables that earlier create_all runs already made
+        # 1. Add AI Memory Columns
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS ai_memory TEXT;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_interaction_summary TEXT;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS mood_score VARCHAR(20);"))
+
+        # 2. Add Wealth Plan Columns (Just in case they are missing too)
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS vendors_patronized_month INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_ai_reward TIMESTAMP;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS ai_points_today FLOAT DEFAULT 0.0;"))
+
+        # 2b. Denormalized counters (run /api/admin/reconcile-counters afterwards to backfill)
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS referral_count INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS purchases_confirmed INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS sales_confirmed INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS leads_received INTEGER DEFAULT 0;"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_referral_count ON users (referral_count);"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_purchases_confirmed ON users (purchases_confirmed);"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_users_sales_confirmed ON users (sales_confirmed);"))
+
+        # 4. Columns added to tables that earlier create_all runs already made
+        db.session.execute(text("ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS capped_count INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS impression_budget INTEGER;"))
+        db.session.execute(text("ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS planned_at TIMESTAMP;"))
+        db.session.execute(text("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS delivered_count INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS read_count INTEGER DEFAULT 0;"))
+        db.session.execute(text("ALTER TABLE broadcast_messages ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMP;"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_broadcast_messages_delivered_at ON broadcast_messages (delivered_at);"))
+        # Event timestamps read by the stats rollup (services/stats_rollup.py)
+        db.session.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS confirmed_at TIMESTAMP;"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at);"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_confirmed_at ON orders (confirmed_at);"))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_payments_completed_at ON payments (completed_at);"))
+        db.session.execute(text("UPDATE orders SET confirmed_at = created_at WHERE status = 'confirmed' AND confirmed_at IS NULL;"))
+        db.session.commit()
+
+    # Full-text index (services/search_index.py); built from scratch when new
+    if search_index.ensure_schema():
+        print(f"Search index created, indexed {search_index.reindex_all()} rows")
+
+def reset_schema():
+    """Drop every table, including the search index, and recreate them. DANGEROUS!"""
+    db.drop_all()
+    db.session.execute(text("DROP TABLE IF EXISTS search_documents"))
+    db.session.commit()
+    upgrade_schema()
@@ -0,0 +1,208 @@
+import re
+from typing import Dict, List, Optional, Sequence
+from sqlalchemy import event, inspect, text, bindparam
+from sqlalchemy.orm import Session
+from models import db, Promo, User, SupportTicket
+
+# Indexed entities: kind -> (model, numeric code used in SQLite rowids, fields watched for changes)
+KINDS = {
+    'promo': (Promo, 1, ('title', 'description', 'ai_generated_caption')),
+    'user': (User, 2, ('name', 'business_name', 'phone_number')),
+    'ticket': (SupportTicket, 3, ('message',)),
+}
+_KIND_BY_MODEL = {model: kind for kind, (model, _, _) in KINDS.items()}
+MAX_TERMS = 8
+REINDEX_BATCH = 1000
+
+def phone_tokens(phone: Optional[str]) -> str:
+    """The number and every suffix of 4+ digits, so prefix search finds any partial number"""
+    digits = re.sub(r'\D', '', phone or '')
+    return " ".join(digits[i:] for i in range(max(len(digits) - 3, 1))) if digits else ''
+
+def document(obj) -> Dict[str, str]:
+    """Searchable text of an indexed row: `title` is ranked above `body`"""
+    if isinstance(obj, Promo):
+        return {'title': obj.title or '', 'body': f"{obj.description or ''} {obj.ai_generated_caption or ''}"}
+    if isinstance(obj, User):
+        return {'title': f"{obj.name or ''} {obj.business_name or ''}", 'body': phone_tokens(obj.phone_number)}
+    return {'title': '', 'body': obj.message or ''}
+
+class SearchIndex:
+    """Ranked full-text search over promos, users and support tickets.
+
+    One `search_documents` table holds the text of every indexed row:
+    tsvector + GIN on Postgres, an FTS5 virtual table on SQLite. Rows are
+    re-indexed from an after_flush hook in the same transaction as the
+    write, and only when a watched field changed, so hot updates such as
+    points or counters never touch the index.
+    """
+
+    def __init__(self):
+        self.dialect = None
+
+    def init_app(self, app):
+        """Keep the index current on every flush. The table itself is created by
+        the release step (services/schema.py); without it search stays disabled."""
+        with app.app_context():
+            self.dialect = db.engine.dialect.name
+            if self.dialect not in ('postgresql', 'sqlite'):
+                print(f"Search disabled: no full-text index for {self.dialect}")
+                return
+            if not self._table_exists():
+                # ensure_schema() (e.g. via /fix_database_schema) turns it back on
+                print("Search disabled: search_documents is missing, run init_db.py")
+                self.dialect = None
+        event.listen(Session, 'after_flush', self._after_flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.dialect in ('postgresql', 'sqlite')
+
+    def _table_exists(self) -> bool:
+        if self.dialect == 'postgresql':
+            return db.session.execute(text("SELECT to_regclass('search_documents')")).scalar() is not None
+        return db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'search_documents'"
+        )).scalar() is not None
+
+    def ensure_schema(self) -> bool:
+        """Create the index table if missing. Returns True if it was created."""
+        self.dialect = db.engine.dialect.name
+        if not self.enabled:
+            return False
+        exists = self._table_exists()
+        if self.dialect == 'postgresql':
+            db.session.execute(text(
+                "CREATE TABLE IF NOT EXISTS search_documents ("
+                " kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, title TEXT, body TEXT,"
+                " tsv TSVECTOR, updated_at TIMESTAMP DEFAULT now(), PRIMARY KEY (kind, ref_id))"
+            ))
+            db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)"))
+        else:
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+        db.session.commit()
+        return not exists
+
+    # --- maintenance -------------------------------------------------------
+
+    def _after_flush(self, session, flush_context):
+        if not self.enabled:
+            return
+        upserts, deletes = [], []
+        for obj in session.new:
+            if type(obj) in _KIND_BY_MODEL:
+                upserts.append(obj)
+        for obj in session.dirty:
+            kind = _KIND_BY_MODEL.get(type(obj))
+            if kind and any(inspect(obj).attrs[field].history.has_changes() for field in KINDS[kind][2]):
+                upserts.append(obj)
+        for obj in session.deleted:
+            if type(obj) in _KIND_BY_MODEL:
+                deletes.append((_KIND_BY_MODEL[type(obj)], obj.id))
+        if upserts or deletes:
+            connection = session.connection()
+            self._delete(connection, deletes)
+            self._upsert(connection, [(_KIND_BY_MODEL[type(obj)], obj.id, document(obj)) for obj in upserts])
+
+    def _upsert(self, connection, docs):
+        if not docs:
+            return
+        if self.dialect == 'postgresql':
+            connection.execute(text(
+                "INSERT INTO search_documents (kind, ref_id, title, body, tsv, updated_at) VALUES ("
+                " :kind, :ref_id, :title, :body,"
+                " setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :body), 'B'), now())"
+                " ON CONFLICT (kind, ref_id) DO UPDATE SET title = excluded.title, body = excluded.body,"
+                " tsv = excluded.tsv, updated_at = excluded.updated_at"
+            ), [{'kind': kind, 'ref_id': ref_id, **doc} for kind, ref_id, doc in docs])
+        else:
+            self._delete(connection, [(kind, ref_id) for kind, ref_id, _ in docs])
+            connection.execute(text(
+                "INSERT INTO search_documents (rowid, kind, ref_id, title, body) VALUES (:rowid, :kind, :ref_id, :title, :body)"
+            ), [{'rowid': self._rowid(kind, ref_id), 'kind': kind, 'ref_id': ref_id, **doc} for kind, ref_id, doc in docs])
+
+    def _delete(self, connection, keys):
+        if not keys:
+            return
+        if self.dialect == 'postgresql':
+            connection.execute(text("DELETE FROM search_documents WHERE kind = :kind AND ref_id = :ref_id"),
+                               [{'kind': kind, 'ref_id': ref_id} for kind, ref_id in keys])
+        else:
+            connection.execute(text("DELETE FROM search_documents WHERE rowid = :rowid"),
+                               [{'rowid': self._rowid(kind, ref_id)} for kind, ref_id in keys])
+
+    @staticmethod
+    def _rowid(kind: str, ref_id: int) -> int:
+        # FTS5 only indexes rowid, so encode (kind, id) into it for O(log n) replace/delete
+        return ref_id * 4 + KINDS[kind][1]
+
+    def reindex_all(self) -> int:
+        """Rebuild every document in batches. Returns rows indexed."""
+        total = 0
+        connection = db.session.connection()
+        connection.execute(text("DELETE FROM search_documents"))
+        for kind, (model, _, _) in KINDS.items():
+            last_id = 0
+            while True:
+                batch = model.query.filter(model.id > last_id).order_by(model.id).limit(REINDEX_BATCH).all()
+                if not batch:
+                    break
+                self._upsert(connection, [(kind, obj.id, document(obj)) for obj in batch])
+                last_id = batch[-1].id
+                total += len(batch)
+        db.session.commit()
+        return total
+
+    # --- queries -----------------------------------------------------------
+
+    def search(self, q: str, kinds: Optional[Sequence[str]] = None, page: int = 1, per_page: int = 20) -> dict:
+        """Prefix-matched, ranked results with their rows loaded"""
+        terms = re.findall(r'\w+', (q or '').lower())[:MAX_TERMS]
+        kinds = [k for k in (kinds or KINDS) if k in KINDS]
+        if not terms or not kinds or not self.enabled:
+            return {'results': [], 'total': 0, 'page': page, 'per_page': per_page}
+
+        params = {'kinds': kinds, 'limit': per_page, 'offset': (page - 1) * per_page}
+        if self.dialect == 'postgresql':
+            params['q'] = " & ".join(f"{term}:*" for term in terms)
+            sql = text(
+                "SELECT kind, ref_id, ts_rank(tsv, query) AS rank, count(*) OVER () AS total"
+                " FROM search_documents, to_tsquery('simple', :q) AS query"
+                " WHERE tsv @@ query AND kind IN :kinds"
+                " ORDER BY rank DESC, ref_id DESC LIMIT :limit OFFSET :offset"
+            )
+        else:
+            params['q'] = " AND ".join(f'"{term}"*' for term in terms)
+            # bm25 is lower-is-better; weights follow column order (kind, ref_id, title, body).
+            # FTS5 auxiliary functions can't share a SELECT with a window function, hence the subquery.
+            sql = text(
+                "SELECT kind, ref_id, rank, count(*) OVER () AS total FROM ("
+                " SELECT kind, ref_id, -bm25(search_documents, 0.0, 0.0, 10.0, 2.0) AS rank"
+                " FROM search_documents WHERE search_documents MATCH :q AND kind IN :kinds"
+                ") ORDER BY rank DESC, ref_id DESC LIMIT :limit OFFSET :offset"
+            )
+        rows = db.session.execute(sql.bindparams(bindparam('kinds', expanding=True)), params).all()
+        return {
+            'results': self._hydrate(rows),
+            'total': rows[0].total if rows else 0,
+            'page': page,
+            'per_page': per_page,
+        }
+
+    @staticmethod
+    def _hydrate(rows) -> List[dict]:
+        ids: Dict[str, List[int]] = {}
+        for row in rows:
+            ids.setdefault(row.kind, []).append(int(row.ref_id))
+        loaded = {}
+        for kind, ref_ids in ids.items():
+            model = KINDS[kind][0]
+            for obj in model.query.filter(model.id.in_(ref_ids)).all():
+                loaded[(kind, obj.id)] = obj.to_dict()
+        return [{'type': row.kind, 'id': int(row.ref_id), 'rank': round(float(row.rank), 4), 'item': loaded[(row.kind, int(row.ref_id))]}
+                for row in rows if (row.kind, int(row.ref_id)) in loaded]
+
+search_index = SearchIndex()
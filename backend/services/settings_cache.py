@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+import threading
+from sqlalchemy import select
+from models import db, SystemSetting
+
+SETTINGS_POLL_INTERVAL = float(os.getenv('SETTINGS_POLL_INTERVAL', 5))  # seconds
+VERSION_KEY = '_version'
+
+# Known settings and their types/defaults; new flags only need an entry here
+SETTING_TYPES = {
+    'vendor_lock': (bool, False),
+}
+
+_TRUE = ('true', '1', 'yes', 'on')
+
+def _parse(raw, kind, default):
+    if raw is None:
+        return default
+    try:
+        if kind is bool:
+            return raw.strip().lower() in _TRUE
+        return kind(raw)
+    except (TypeError, ValueError):
+        return default
+
+def _serialize(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+class SettingsCache:
+    """In-memory copy of system_settings shared by every request in a worker.
+
+    Reads are served from memory. At most once per SETTINGS_POLL_INTERVAL a
+    read checks the `_version` row (a single primary-key lookup) and reloads
+    the table only if another worker has written since. Writes go through
+    `set`, which stores the value and a fresh version in one transaction.
+    """
+
+    def __init__(self, poll_interval: float = SETTINGS_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._values = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read every setting into memory (called at startup and on version change)"""
+        rows = db.session.execute(select(SystemSetting.key, SystemSetting.value)).all()
+        values = {key: value for key, value in rows}
+        with self._lock:
+            self._values = values
+            self._version = values.get(VERSION_KEY)
+            self._checked_at = time.monotonic()
+            self._loaded = True
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        try:
+            version = db.session.execute(
+                select(SystemSetting.value).where(SystemSetting.key == VERSION_KEY)
+            ).scalar()
+            if not self._loaded or version != self._version:
+                self.load()
+            else:
+                self._checked_at = time.monotonic()
+        except Exception as e:
+            # Keep serving the last known values if the DB is unreachable; the failed
+            # statement would otherwise leave the caller's session unusable
+            db.session.rollback()
+            self._checked_at = time.monotonic()
+            print(f"Settings refresh failed: {e}")
+
+    def get(self, key: str, default=None, kind=None):
+        """Typed read. Type and default come from SETTING_TYPES unless given."""
+        self._refresh_if_stale()
+        known_kind, known_default = SETTING_TYPES.get(key, (str, None))
+        kind = kind or known_kind
+        default = known_default if default is None else default
+        return _parse(self._values.get(key), kind, default)
+
+    def get_bool(self, key: str, default: bool = None) -> bool:
+        return self.get(key, default, bool)
+
+    def get_int(self, key: str, default: int = None) -> int:
+        return self.get(key, default, int)
+
+    def get_float(self, key: str, default: float = None) -> float:
+        return self.get(key, default, float)
+
+    def set(self, key: str, value):
+        """Persist a setting and bump the version so other workers reload"""
+        raw = _serialize(value)
+        version = uuid.uuid4().hex
+        for k, v in ((key, raw), (VERSION_KEY, version)):
+            setting = SystemSetting.query.get(k)
+            if setting:
+                setting.value = v
+            else:
+                db.session.add(SystemSetting(key=k, value=v))
+        db.session.commit()
+        with self._lock:
+            self._values = {**self._values, key: raw, VERSION_KEY: version}
+            self._version = version
+            self._checked_at = time.monotonic()
+
+settings = SettingsCache()
@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import (db, Promo, Order, OrderStatus, Payment, PaymentStatus, BroadcastMessage,
+                    PromoDailyStat, VendorDailyStat, RollupWatermark, upsert_increment_many)
+
+STATS_ROLLUP_INTERVAL = int(os.getenv('STATS_ROLLUP_INTERVAL', 300))  # seconds
+# Events younger than this may belong to transactions that haven't committed yet
+STATS_ROLLUP_SETTLE_SECONDS = int(os.getenv('STATS_ROLLUP_SETTLE_SECONDS', 120))
+METRICS = ('sent', 'delivered', 'buy_intents', 'sales_confirmed', 'revenue', 'ad_spend')
+_EPOCH = datetime(2000, 1, 1)
+
+def _as_date(value) -> date:
+    # func.date() gives a string on SQLite and a date on Postgres
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+class StatsRollup:
+    """Incremental daily rollups per promo and per vendor.
+
+    Each event source (broadcast sends, deliveries, buy intents, confirmed
+    sales, ad payments) has a timestamp watermark. A run aggregates only the
+    events between the watermark and now minus STATS_ROLLUP_SETTLE_SECONDS,
+    adds them to promo_daily_stats / vendor_daily_stats with multi-row
+    upserts, and advances the watermark in the same transaction. Advancing
+    is a conditional UPDATE on the old position, so when two workers race
+    only one applies the window.
+    """
+
+    def _sources(self):
+        """name -> query builder(start, end) grouping events into (promo_id, vendor_id, day, metrics...)"""
+        def sent(start, end):
+            day = func.date(BroadcastMessage.created_at)
+            return db.session.query(BroadcastMessage.promo_id, Promo.vendor_id, day, func.count().label('sent')) \
+                .join(Promo, Promo.id == BroadcastMessage.promo_id) \
+                .filter(BroadcastMessage.created_at > start, BroadcastMessage.created_at <= end) \
+                .group_by(BroadcastMessage.promo_id, Promo.vendor_id, day)
+
+        def delivered(start, end):
+            day = func.date(BroadcastMessage.delivered_at)
+            return db.session.query(BroadcastMessage.promo_id, Promo.vendor_id, day, func.count().label('delivered')) \
+                .join(Promo, Promo.id == BroadcastMessage.promo_id) \
+                .filter(BroadcastMessage.delivered_at > start, BroadcastMessage.delivered_at <= end) \
+                .group_by(BroadcastMessage.promo_id, Promo.vendor_id, day)
+
+        def buy_intents(start, end):
+            day = func.date(Order.created_at)
+            return db.session.query(Order.promo_id, Order.vendor_id, day, func.count().label('buy_intents')) \
+                .filter(Order.created_at > start, Order.created_at <= end) \
+                .group_by(Order.promo_id, Order.vendor_id, day)
+
+        def sales(start, end):
+            day = func.date(Order.confirmed_at)
+            return db.session.query(Order.promo_id, Order.vendor_id, day, func.count().label('sales_confirmed'),
+                                    func.coalesce(func.sum(Order.amount), 0).label('revenue')) \
+                .filter(Order.status == OrderStatus.CONFIRMED.value,
+                        Order.confirmed_at > start, Order.confirmed_at <= end) \
+                .group_by(Order.promo_id, Order.vendor_id, day)
+
+        def ad_spend(start, end):
+            day = func.date(Payment.completed_at)
+            return db.session.query(Payment.promo_id, Payment.user_id, day,
+                                    func.coalesce(func.sum(Payment.amount), 0).label('ad_spend')) \
+                .filter(Payment.status == PaymentStatus.COMPLETED.value,
+                        Payment.completed_at > start, Payment.completed_at <= end) \
+                .group_by(Payment.promo_id, Payment.user_id, day)
+
+        return {
+            'broadcast_sent': sent,
+            'broadcast_delivered': delivered,
+            'order_created': buy_intents,
+            'order_confirmed': sales,
+            'payment_completed': ad_spend,
+        }
+
+    def _watermark(self, name: str) -> datetime:
+        mark = db.session.get(RollupWatermark, name)
+        if mark is not None:
+            return mark.position
+        try:
+            db.session.add(RollupWatermark(name=name, position=_EPOCH))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        return db.session.get(RollupWatermark, name).position
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Roll up every source's new window. Returns grouped rows applied per source."""
+        upper = (now or datetime.utcnow()) - timedelta(seconds=STATS_ROLLUP_SETTLE_SECONDS)
+        applied = {}
+        for name, build in self._sources().items():
+            start = self._watermark(name)
+            if start >= upper:
+                continue
+            rows = build(start, upper).all()
+
+            claimed = RollupWatermark.query.filter(
+                RollupWatermark.name == name, RollupWatermark.position == start
+            ).update({RollupWatermark.position: upper, RollupWatermark.updated_at: datetime.utcnow()},
+                     synchronize_session=False)
+            if not claimed:
+                # Another worker applied this window
+                db.session.rollback()
+                continue
+            self._apply(rows)
+            db.session.commit()
+            applied[name] = len(rows)
+        return applied
+
+    def _apply(self, rows):
+        promo_rows = []
+        vendor_totals = defaultdict(lambda: defaultdict(int))
+        for row in rows:
+            promo_id, vendor_id, day = row[0], row[1], _as_date(row[2])
+            values = {key: row._mapping[key] for key in METRICS if key in row._mapping.keys()}
+            if promo_id is not None:
+                promo_rows.append({'promo_id': promo_id, 'vendor_id': vendor_id, 'day': day, **values})
+            for key, value in values.items():
+                vendor_totals[(vendor_id, day)][key] += value
+
+        zero = {key: 0 for key in METRICS}
+        if promo_rows:
+            upsert_increment_many(PromoDailyStat, ('promo_id', 'day'), [{**zero, **r} for r in promo_rows], zero)
+        vendor_rows = [{**zero, 'vendor_id': vendor_id, 'day': day, **totals}
+                       for (vendor_id, day), totals in vendor_totals.items()]
+        if vendor_rows:
+            upsert_increment_many(VendorDailyStat, ('vendor_id', 'day'), vendor_rows, zero)
+
+    def start_worker(self, app, interval: int = STATS_ROLLUP_INTERVAL):
+        """Run rollups forever in a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                with app.app_context():
+                    try:
+                        self.run_once()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Stats rollup error: {e}")
+
+        thread = threading.Thread(target=run, name="stats-rollup", daemon=True)
+        thread.start()
+        return thread
+
+# --- Readers: rollup tables only ----------------------------------------
+
+def _totals(model, filters, since: date):
+    row = db.session.query(*[func.coalesce(func.sum(getattr(model, key)), 0) for key in METRICS]) \
+        .filter(*filters, model.day >= since).one()
+    return dict(zip(METRICS, row))
+
+def _series(model, filters, since: date):
+    rows = db.session.query(model.day, *[func.sum(getattr(model, key)) for key in METRICS]) \
+        .filter(*filters, model.day >= since).group_by(model.day).order_by(model.day).all()
+    return [{'day': _as_date(r[0]).isoformat(), **dict(zip(METRICS, r[1:]))} for r in rows]
+
+def vendor_stats(vendor_id: int, days: int = 30) -> dict:
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    filters = [VendorDailyStat.vendor_id == vendor_id]
+    return {'vendor_id': vendor_id, 'days': days,
+            'totals': _totals(VendorDailyStat, filters, since),
+            'daily': _series(VendorDailyStat, filters, since)}
+
+def promo_stats(promo_id: int, days: int = 30) -> dict:
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    filters = [PromoDailyStat.promo_id == promo_id]
+    return {'promo_id': promo_id, 'days': days,
+            'totals': _totals(PromoDailyStat, filters, since),
+            'daily': _series(PromoDailyStat, filters, since)}
+
+def platform_stats(days: int = 30) -> dict:
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    return {'days': days, 'totals': _totals(VendorDailyStat, [], since), 'daily': _series(VendorDailyStat, [], since)}
+
+def top_promos(vendor_id: int, days: int = 30, limit: int = 5):
+    """A vendor's promos ranked by buy intents, then deliveries"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    intents = func.sum(PromoDailyStat.buy_intents)
+    delivered = func.sum(PromoDailyStat.delivered)
+    rows = db.session.query(PromoDailyStat.promo_id, Promo.title, func.sum(PromoDailyStat.sent), delivered, intents,
+                            func.sum(PromoDailyStat.sales_confirmed), func.sum(PromoDailyStat.revenue)) \
+        .join(Promo, Promo.id == PromoDailyStat.promo_id) \
+        .filter(PromoDailyStat.vendor_id == vendor_id, PromoDailyStat.day >= since) \
+        .group_by(PromoDailyStat.promo_id, Promo.title) \
+        .order_by(intents.desc(), delivered.desc()).limit(limit).all()
+    return [{'promo_id': r[0], 'title': r[1], 'sent': r[2], 'delivered': r[3], 'buy_intents': r[4],
+             'sales_confirmed': r[5], 'revenue': r[6]} for r in rows]
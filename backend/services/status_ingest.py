@@ -0,0 +1,151 @@
+import os
+import atexit
+import threading
+from datetime import datetime
+from collections import Counter
+from typing import Dict, List
+from models import db, Broadcast, BroadcastMessage, Promo
+from services import metrics
+from services.counter_buffer import counters
+
+STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', 5))  # seconds
+# Flush early once this many distinct message ids are buffered
+STATUS_FLUSH_MAX = int(os.getenv('STATUS_FLUSH_MAX', 5000))
+# Broadcast message ids are stored at the dispatcher's next checkpoint (at most
+# BROADCAST_CHECKPOINT_SECONDS after the send), which can land after the first
+# callbacks; unmatched ids are retried this many flushes
+STATUS_RETRY_FLUSHES = int(os.getenv('STATUS_RETRY_FLUSHES', 3))
+_IN_BATCH = 500
+
+# Callbacks can arrive out of order; only forward moves count
+STATUS_RANK = {'sent': 1, 'delivered': 2, 'read': 3}
+
+class StatusAggregator:
+    """Buffers WhatsApp status callbacks and applies them in batches.
+
+    The webhook only records the furthest status seen per message id in
+    memory. A background flush turns the buffer into a few conditional
+    UPDATEs on broadcast_messages (sent -> delivered, delivered -> read) and
+    passes the rows that actually moved to the counter buffer as
+    Broadcast.delivered_count / read_count and Promo.views increments. The
+    conditional updates make a status count
+    once even if several workers receive callbacks for the same message.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._failed = set()
+        self._retry: Dict[str, list] = {}  # wamid -> [rank, flushes left]; flush thread only
+        self._retry_failed: Dict[str, int] = {}  # wamid -> flushes left; flush thread only
+        self._wake = threading.Event()
+        self._app = None
+
+    def add(self, statuses: List[dict]):
+        """Record the `statuses` array of a webhook change. Never touches the DB."""
+        with self._lock:
+            for status in statuses:
+                wamid = status.get('id')
+                name = status.get('status')
+                if not wamid:
+                    continue
+                if name == 'failed':
+                    self._failed.add(wamid)
+                elif name in STATUS_RANK and STATUS_RANK[name] > self._pending.get(wamid, 0):
+                    self._pending[wamid] = STATUS_RANK[name]
+            size = len(self._pending)
+        metrics.WEBHOOK_STATUSES.inc(len(statuses))
+        if size >= STATUS_FLUSH_MAX:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Apply buffered statuses. Returns message rows that changed."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            failed, self._failed = self._failed, set()
+        for wamid, (rank, _) in self._retry.items():
+            pending[wamid] = max(rank, pending.get(wamid, 0))
+        failed |= set(self._retry_failed)
+        if not pending and not failed:
+            return 0
+
+        delivered_ids = [wamid for wamid, rank in pending.items() if rank >= STATUS_RANK['delivered']]
+        read_ids = [wamid for wamid, rank in pending.items() if rank >= STATUS_RANK['read']]
+        delivered = self._advance(delivered_ids, 'sent', 'delivered')
+        read = self._advance(read_ids, 'delivered', 'read')
+        failed_matched = {wamid for wamid, _, _ in self._advance(list(failed), 'sent', 'failed')}
+
+        matched = {wamid for wamid, _, _ in delivered} | {wamid for wamid, _, _ in read}
+        retry = {}
+        for wamid, rank in pending.items():
+            if wamid in matched or rank < STATUS_RANK['delivered']:
+                continue
+            left = self._retry[wamid][1] - 1 if wamid in self._retry else STATUS_RETRY_FLUSHES
+            if left > 0:
+                retry[wamid] = [rank, left]
+        self._retry = retry
+        retry_failed = {}
+        for wamid in failed - failed_matched:
+            left = self._retry_failed[wamid] - 1 if wamid in self._retry_failed else STATUS_RETRY_FLUSHES
+            if left > 0:
+                retry_failed[wamid] = left
+        self._retry_failed = retry_failed
+
+        delivered_by_broadcast = Counter(broadcast_id for _, broadcast_id, _ in delivered)
+        read_by_broadcast = Counter(broadcast_id for _, broadcast_id, _ in read)
+        reads_by_promo = Counter(promo_id for _, _, promo_id in read)
+        db.session.commit()
+        for broadcast_id in set(delivered_by_broadcast) | set(read_by_broadcast):
+            counters.add(Broadcast, broadcast_id, delivered_count=delivered_by_broadcast[broadcast_id],
+                         read_count=read_by_broadcast[broadcast_id])
+        for promo_id, reads in reads_by_promo.items():
+            counters.add(Promo, promo_id, views=reads)
+        return len(delivered) + len(read)
+
+    def _advance(self, wamids: List[str], from_status: str, to_status: str):
+        """Move matching rows from one status to the next; returns (wamid, broadcast_id, promo_id) per moved row"""
+        moved = []
+        table = BroadcastMessage.__table__
+        for i in range(0, len(wamids), _IN_BATCH):
+            result = db.session.execute(
+                table.update()
+                .where(table.c.wamid.in_(wamids[i:i + _IN_BATCH]), table.c.status == from_status)
+                .values(status=to_status, **({'delivered_at': datetime.utcnow()} if to_status == 'delivered' else {}))
+                .returning(table.c.wamid, table.c.broadcast_id, table.c.promo_id)
+            )
+            moved.extend(tuple(row) for row in result)
+        return moved
+
+    def start(self, app, interval: float = STATUS_FLUSH_INTERVAL):
+        """Flush on an interval (or early when the buffer fills) in a daemon thread"""
+        self._app = app
+
+        def run():
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                with app.app_context():
+                    try:
+                        self.flush()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Status flush error: {e}")
+
+        thread = threading.Thread(target=run, name="status-flush", daemon=True)
+        thread.start()
+        atexit.register(self.flush_at_exit)
+        return thread
+
+    def flush_at_exit(self):
+        """Apply what is buffered, then write the resulting counter increments"""
+        if self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Status flush on shutdown failed: {e}")
+        counters.flush_at_exit()
+
+status_aggregator = StatusAggregator()
@@ -0,0 +1,49 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+from models import db, User, Order, OrderStatus
+
+COUNTER_COLUMNS = ('referral_count', 'purchases_confirmed', 'sales_confirmed')
+
+def increment(user_id: int, **deltas):
+    """Atomically add to counter columns: UPDATE users SET col = col + n.
+
+    Runs in the caller's transaction, so the counter commits together with
+    the event it counts.
+    """
+    values = {}
+    for column, delta in deltas.items():
+        if column not in COUNTER_COLUMNS:
+            raise ValueError(f"Unknown counter column: {column}")
+        attr = getattr(User, column)
+        values[attr] = func.coalesce(attr, 0) + delta
+    User.query.filter(User.id == user_id).update(values, synchronize_session=False)
+
+def _true_counts():
+    """Correlated subqueries giving each counter's value recomputed from source rows."""
+    referred = aliased(User)
+    return {
+        'referral_count': select(func.count(referred.id))
+            .where(referred.referred_by_id == User.id).scalar_subquery(),
+        'purchases_confirmed': select(func.count(Order.id))
+            .where(Order.buyer_id == User.id, Order.status == OrderStatus.CONFIRMED.value).scalar_subquery(),
+        'sales_confirmed': select(func.count(Order.id))
+            .where(Order.vendor_id == User.id, Order.status == OrderStatus.CONFIRMED.value).scalar_subquery(),
+    }
+
+def reconcile() -> dict:
+    """Repair counter drift with one set-based UPDATE per counter.
+
+    Only rows whose stored value differs are rewritten; returns the number
+    of repaired users per counter.
+    """
+    repaired = {}
+    for column, true_count in _true_counts().items():
+        attr = getattr(User, column)
+        result = db.session.execute(
+            User.__table__.update()
+            .where(func.coalesce(attr, -1) != true_count)
+            .values({column: true_count})
+        )
+        repaired[column] = result.rowcount
+    db.session.commit()
+    return repaired
@@ -1,17 +1,38 @@
 import os
+import time
 import requests
 from typing import Optional, Dict, Any
+from services import metrics
+
+# Seconds to wait on a Graph call (connect, and between bytes when reading); same setting as async_whatsapp.py
+GRAPH_TIMEOUT = float(os.getenv('GRAPH_TIMEOUT_SECONDS', 30))
+# Media uploads send whole files
+GRAPH_UPLOAD_TIMEOUT = float(os.getenv('GRAPH_UPLOAD_TIMEOUT_SECONDS', 120))
 
 class WhatsAppService:
     def __init__(self):
         self.api_token = os.getenv('WHATSAPP_API_TOKEN')
         self.phone_number_id = os.getenv('WHATSAPP_PHONE_NUMBER_ID')
-        self.base_url = f"https://graph.facebook.com/v18.0/{self.phone_number_id}"
+        # Overridable so load tests can point at a local fake Graph API
+        self.graph_url = os.getenv('WHATSAPP_GRAPH_URL', "https://graph.facebook.com/v18.0").rstrip('/')
+        self.base_url = f"{self.graph_url}/{self.phone_number_id}"
         self.headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
 
+    def _post(self, url: str, payload: Dict[str, Any], message_type: str) -> requests.Response:
+        """POST to the Graph API, recording latency and status code per message type"""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = requests.post(url, json=payload, headers=self.headers, timeout=GRAPH_TIMEOUT)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.observe_since(metrics.WHATSAPP_SEND_SECONDS.labels(message_type), started)
+            metrics.WHATSAPP_RESPONSES.labels(message_type, status).inc()
+
     def send_text_message(self, to: str, message: str) -> Dict[str, Any]:
         """Send a text message to a WhatsApp user"""
         url = f"{self.base_url}/messages"
@@ -27,7 +48,7 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "text")
             response.raise_for_status()
             return {"success": True, "data": response.json()}
         except Exception as e:
@@ -54,7 +75,7 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "image")
             response.raise_for_status()
             return {"success": True, "data": response.json()}
         except Exception as e:
@@ -80,7 +101,7 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "video")
             response.raise_for_status()
             return {"success": True, "data": response.json()}
         except Exception as e:
@@ -121,7 +142,7 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "button")
             response.raise_for_status()
             return {"success": True, "data": response.json()}
         except Exception as e:
@@ -150,13 +171,33 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "list")
             response.raise_for_status()
             return {"success": True, "data": response.json()}
         except Exception as e:
             print(f"Error sending list message: {e}")
             return {"success": False, "error": str(e)}
 
+    def send_interactive_message(self, to: str, interactive: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a prebuilt interactive object (see services/message_templates.py)"""
+        url = f"{self.base_url}/messages"
+
+        payload = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": to,
+            "type": "interactive",
+            "interactive": interactive
+        }
+
+        try:
+            response = self._post(url, payload, "interactive")
+            response.raise_for_status()
+            return {"success": True, "data": response.json()}
+        except Exception as e:
+            print(f"Error sending interactive message: {e}")
+            return {"success": False, "error": str(e)}
+
     def mark_message_as_read(self, message_id: str) -> Dict[str, Any]:
         """Mark a message as read"""
         url = f"{self.base_url}/messages"
@@ -167,9 +208,54 @@ class WhatsAppService:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=self.headers)
+            response = self._post(url, payload, "read")
             response.raise_for_status()
             return {"success": True}
         except Exception as e:
             print(f"Error marking message as read: {e}")
             return {"success": False, "error": str(e)}
+
+    def get_media_info(self, media_id: str) -> Dict[str, Any]:
+        """Resolve a media id to its temporary download URL and metadata"""
+        url = f"{self.graph_url}/{media_id}"
+
+        try:
+            response = requests.get(url, headers={"Authorization": f"Bearer {self.api_token}"}, timeout=GRAPH_TIMEOUT)
+            if response.status_code == 400:
+                return {"success": False, "status_code": 400, "error": "Media ID invalid or expired"}
+            response.raise_for_status()
+            return {"success": True, "data": response.json()}
+        except Exception as e:
+            print(f"Error fetching media info: {e}")
+            return {"success": False, "status_code": 500, "error": str(e)}
+
+    def open_media_stream(self, media_url: str) -> requests.Response:
+        """Start downloading a media binary; the caller iterates and closes the response"""
+        response = requests.get(media_url, headers={"Authorization": f"Bearer {self.api_token}"}, stream=True,
+                                timeout=GRAPH_TIMEOUT)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            # Nobody else holds the response yet; release its socket now, not at GC
+            response.close()
+            raise
+        return response
+
+    def upload_media(self, file_path: str, mime_type: str) -> Dict[str, Any]:
+        """Upload a local file to WhatsApp and get a media id reusable for sending (valid ~30 days)"""
+        url = f"{self.base_url}/media"
+
+        try:
+            with open(file_path, 'rb') as f:
+                response = requests.post(
+                    url,
+                    headers={"Authorization": f"Bearer {self.api_token}"},
+                    data={"messaging_product": "whatsapp", "type": mime_type},
+                    files={"file": (os.path.basename(file_path), f, mime_type)},
+                    timeout=GRAPH_UPLOAD_TIMEOUT
+                )
+            response.raise_for_status()
+            return {"success": True, "data": response.json()}
+        except Exception as e:
+            print(f"Error uploading media: {e}")
+            return {"success": False, "error": str(e)}